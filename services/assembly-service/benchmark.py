@@ -0,0 +1,294 @@
+"""
+Assembly Benchmark - synthetic-media benchmark suite for the assembly pipeline
+Generates deterministic clips and audio with FFmpeg lavfi sources (testsrc, sine),
+no real media needed
+
+Drives concatenate_clips, add_audio_to_video, add_subtitles_to_video, the
+per-profile encode (encode_with_profile), the /assemble-video endpoint (one
+case per assembly mode and render profile) and run_batch (N subtitle-style
+variants sharing one decode) across clip counts, resolutions and subtitle lengths, and reports wall time, CPU time, peak RSS, temp-disk bytes
+and output size as JSON.
+
+Usage:
+    python benchmark.py --clip-counts 1,5 --resolutions 540x960,1080x1920 \\
+        --subtitle-words 20,150 --output bench.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+TARGETS = ["concat", "audio", "subtitles", "encode", "endpoint", "batch"]
+
+WORDS = (
+    "it was the coldest night the town had ever seen and nobody could explain "
+    "why the lights on the hill kept blinking in the same pattern every hour "
+    "until the old man at the gas station finally told us what he had buried there"
+).split()
+
+def subtitle_text(num_words: int) -> str:
+    """Deterministic subtitle text of the given length"""
+    return " ".join(WORDS[i % len(WORDS)] for i in range(num_words))
+
+def make_clip(path: str, duration: int, resolution: str, fps: int = 24):
+    """Create a synthetic H.264 clip using the testsrc source"""
+    subprocess.run([
+        "ffmpeg", "-y",
+        "-f", "lavfi", "-i", f"testsrc=size={resolution}:rate={fps}:duration={duration}",
+        "-c:v", "libx264", "-pix_fmt", "yuv420p",
+        path
+    ], capture_output=True, check=True)
+
+def make_audio(path: str, duration: int):
+    """Create a synthetic audio track using the sine source"""
+    subprocess.run([
+        "ffmpeg", "-y",
+        "-f", "lavfi", "-i", f"sine=frequency=440:duration={duration}",
+        path
+    ], capture_output=True, check=True)
+
+def directory_bytes(path: str) -> int:
+    """Total size of the files directly in a directory"""
+    total = 0
+    for entry in os.scandir(path):
+        try:
+            if entry.is_file():
+                total += entry.stat().st_size
+        except OSError:
+            pass
+    return total
+
+def sample_peak_bytes(path: str, stop: threading.Event, peak: list):
+    """Poll a directory's size until stopped, keeping the maximum"""
+    while not stop.is_set():
+        peak[0] = max(peak[0], directory_bytes(path))
+        stop.wait(0.05)
+    peak[0] = max(peak[0], directory_bytes(path))
+
+def call_endpoint(main, case: dict, clips: list, audio_path: str) -> dict:
+    """POST to /assemble-video on a local uvicorn server"""
+    import urllib.request
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=case["port"], log_level="error"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+
+    try:
+        body = json.dumps({
+            "video_clips": clips,
+            "audio_path": audio_path,
+            "subtitle_text": subtitle_text(case["subtitle_words"]),
+            "mode": case["mode"],
+            "profile": case["profile"]
+        }).encode()
+        req = urllib.request.Request(
+            f"http://127.0.0.1:{case['port']}/assemble-video",
+            data=body,
+            headers={"Content-Type": "application/json"}
+        )
+        with urllib.request.urlopen(req) as response:
+            return json.loads(response.read())
+    finally:
+        server.should_exit = True
+        thread.join()
+
+def run_case(case: dict) -> dict:
+    """
+    Run one benchmark case in a fresh process
+
+    The process is spawned per case so peak RSS, CPU time and the service's
+    in-memory caches are isolated from the other cases.
+    """
+    work_dir = case["work_dir"]
+    os.environ["OUTPUT_DIR"] = os.path.join(work_dir, "output")
+    os.environ["TEMP_DIR"] = os.path.join(work_dir, "temp")
+    os.environ["JANITOR_INTERVAL"] = "3600"
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import main
+
+    clips = case["clips"]
+    audio_path = case["audio_path"]
+    output_path = os.path.join(main.OUTPUT_DIR, "bench.mp4")
+
+    # Inputs for the single-stage targets
+    if case["target"] in ("audio", "subtitles", "encode"):
+        concat_path = os.path.join(work_dir, "input_concat.mp4")
+        if not main.concatenate_clips(clips, concat_path):
+            raise Exception("Failed to prepare concatenated input")
+    if case["target"] in ("subtitles", "encode"):
+        muxed_path = os.path.join(work_dir, "input_audio.mp4")
+        if not main.add_audio_to_video(concat_path, audio_path, muxed_path):
+            raise Exception("Failed to prepare muxed input")
+        duration = main.get_video_duration(muxed_path)
+
+    stop, peak = threading.Event(), [0]
+    sampler = threading.Thread(target=sample_peak_bytes, args=(main.TEMP_DIR, stop, peak), daemon=True)
+
+    before_self = resource.getrusage(resource.RUSAGE_SELF)
+    before_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    sampler.start()
+    start = time.perf_counter()
+
+    if case["target"] == "concat":
+        ok = main.concatenate_clips(clips, output_path)
+    elif case["target"] == "audio":
+        ok = main.add_audio_to_video(concat_path, audio_path, output_path)
+    elif case["target"] == "subtitles":
+        ok = main.add_subtitles_to_video(muxed_path, subtitle_text(case["subtitle_words"]), duration, output_path)
+    elif case["target"] == "encode":
+        ok = main.encode_with_profile(muxed_path, subtitle_text(case["subtitle_words"]), duration, output_path,
+                                      case["profile"])
+    elif case["target"] == "batch":
+        styles = list(main.SUBTITLE_STYLES)
+        requests = [
+            main.AssemblyRequest(
+                video_clips=clips,
+                audio_path=audio_path,
+                subtitle_text=subtitle_text(case["subtitle_words"]),
+                subtitle_style=styles[i % len(styles)]
+            )
+            for i in range(case["variants"])
+        ]
+        result = main.run_batch(requests, [None] * len(requests))
+        output_path = result.results[0].final_video
+        ok = result.shared_decode == len(requests)
+    else:
+        result = call_endpoint(main, case, clips, audio_path)
+        output_path = result["final_video"]
+        ok = result["profile"] == case["profile"] and result["mode"] in (case["mode"], "intermediate")
+
+    wall = time.perf_counter() - start
+    stop.set()
+    sampler.join()
+    after_self = resource.getrusage(resource.RUSAGE_SELF)
+    after_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    cpu = sum(
+        (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+        for before, after in ((before_self, after_self), (before_children, after_children))
+    )
+
+    return {
+        **{key: case[key] for key in ("target", "mode", "profile", "variants", "clips_count", "resolution",
+                                      "subtitle_words")},
+        "ok": ok,
+        "wall_seconds": round(wall, 3),
+        "cpu_seconds": round(cpu, 3),
+        # ru_maxrss is in KiB on Linux; children covers the FFmpeg processes
+        "peak_rss_bytes": max(after_self.ru_maxrss, after_children.ru_maxrss) * 1024,
+        "temp_peak_bytes": peak[0],
+        "output_bytes": os.path.getsize(output_path) if ok and os.path.exists(output_path) else 0
+    }
+
+def build_cases(args, media: dict, root: str) -> list:
+    """Expand the benchmark matrix into cases"""
+    cases = []
+    port = args.port
+    for resolution in args.resolutions:
+        for clips_count in args.clip_counts:
+            for words in args.subtitle_words:
+                for target in args.targets:
+                    if target in ("concat", "audio") and words != args.subtitle_words[0]:
+                        continue  # Subtitle length only matters where subtitles are rendered
+                    profiles = args.profiles if target in ("encode", "endpoint") else [None]
+                    for profile in profiles:
+                        # Drafts always render from the intermediate, whatever the mode
+                        modes = args.modes if target == "endpoint" and profile != "draft" else [None]
+                        for mode in modes:
+                            for run in range(args.runs):
+                                port += 1
+                                cases.append({
+                                    "target": target,
+                                    "mode": mode,
+                                    "profile": profile,
+                                    "variants": args.batch_variants if target == "batch" else 1,
+                                    "clips_count": clips_count,
+                                    "resolution": resolution,
+                                    "subtitle_words": words,
+                                    "clips": media[resolution][:clips_count],
+                                    "audio_path": media["audio"][clips_count],
+                                    "work_dir": os.path.join(root, f"case_{len(cases)}"),
+                                    "port": port
+                                })
+    return cases
+
+def main_benchmark():
+    import main as service
+
+    parser = argparse.ArgumentParser(description="Benchmark the assembly pipeline with synthetic media")
+    parser.add_argument("--clip-counts", default="1,3,5")
+    parser.add_argument("--resolutions", default="540x960,1080x1920")
+    parser.add_argument("--subtitle-words", default="20,150")
+    parser.add_argument("--clip-duration", type=int, default=5)
+    parser.add_argument("--targets", default=",".join(TARGETS))
+    parser.add_argument("--modes", default=",".join(service.ASSEMBLY_MODES))
+    parser.add_argument("--profiles", default=",".join(service.RENDER_PROFILES))
+    parser.add_argument("--batch-variants", type=int, default=3)
+    parser.add_argument("--runs", type=int, default=1)
+    parser.add_argument("--port", type=int, default=18004)
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    args = parser.parse_args()
+    args.clip_counts = [int(n) for n in args.clip_counts.split(",")]
+    args.resolutions = args.resolutions.split(",")
+    args.subtitle_words = [int(n) for n in args.subtitle_words.split(",")]
+    args.targets = args.targets.split(",")
+    args.modes = args.modes.split(",")
+    args.profiles = args.profiles.split(",")
+
+    root = tempfile.mkdtemp(prefix="assembly_bench_")
+    try:
+        print(f"📦 Generating synthetic media in {root}...", file=sys.stderr)
+        media = {"audio": {}}
+        for resolution in args.resolutions:
+            media[resolution] = []
+            for i in range(max(args.clip_counts)):
+                clip = os.path.join(root, f"clip_{resolution}_{i}.mp4")
+                make_clip(clip, args.clip_duration, resolution)
+                media[resolution].append(clip)
+        for clips_count in args.clip_counts:
+            audio_path = os.path.join(root, f"audio_{clips_count}.wav")
+            make_audio(audio_path, clips_count * args.clip_duration)
+            media["audio"][clips_count] = audio_path
+
+        cases = build_cases(args, media, root)
+        results = []
+        spawn = multiprocessing.get_context("spawn")
+        for i, case in enumerate(cases):
+            label = f"{case['target']}{'/' + case['mode'] if case['mode'] else ''}" \
+                    f"{'/' + case['profile'] if case['profile'] else ''} " \
+                    f"{case['clips_count']} clips {case['resolution']} {case['subtitle_words']} words"
+            print(f"   [{i + 1}/{len(cases)}] {label}", file=sys.stderr)
+            with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as pool:
+                results.append(pool.submit(run_case, case).result())
+            shutil.rmtree(case["work_dir"], ignore_errors=True)
+
+        report = {
+            "ffmpeg": service.get_ffmpeg_capabilities()["version"],
+            "cpu_count": os.cpu_count(),
+            "clip_duration": args.clip_duration,
+            "results": results
+        }
+        output = json.dumps(report, indent=2)
+        if args.output:
+            with open(args.output, 'w') as f:
+                f.write(output)
+            print(f"✅ Wrote {len(results)} results to {args.output}", file=sys.stderr)
+        else:
+            print(output)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+if __name__ == "__main__":
+    main_benchmark()
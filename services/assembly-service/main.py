@@ -3,14 +3,28 @@ Video Assembly Service - 100% FREE
 Uses FFmpeg for video assembly, subtitles, and audio
 """
 
-from fastapi import FastAPI, HTTPException, UploadFile, File
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from starlette.concurrency import run_in_threadpool
+from multipart.multipart import MultipartParser, parse_options_header
+from typing import Callable, Dict, List, Optional, Tuple, Union
+from collections import OrderedDict, deque
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor, wait
+import asyncio
+import hashlib
+import json
+import math
+import re
+import signal
 import subprocess
+import threading
+import time
 import os
 import uuid
+from email.utils import formatdate
 from pathlib import Path
+import shutil
 
 app = FastAPI(title="Assembly Service", description="FREE video assembly using FFmpeg")
 
@@ -21,6 +35,100 @@ app = FastAPI(title="Assembly Service", description="FREE video assembly using F
 OUTPUT_DIR = os.getenv("OUTPUT_DIR", "/tmp/assembly_output")
 TEMP_DIR = os.getenv("TEMP_DIR", "/tmp/assembly_temp")
 
+# "single_pass" builds one FFmpeg filter graph, "multi_step" runs the
+# concat -> audio -> subtitles chain with intermediate files
+ASSEMBLY_MODE = os.getenv("ASSEMBLY_MODE", "single_pass")
+ASSEMBLY_MODES = ["single_pass", "multi_step", "segmented"]
+
+# "segmented" burns subtitles into each clip in parallel, then stream-copy concats
+SEGMENT_WORKERS = int(os.getenv("SEGMENT_WORKERS", os.cpu_count() or 1))
+
+# How multi_step passes intermediates between stages: "file" (TEMP_DIR),
+# "tmpfs" (INTERMEDIATE_TMPFS_DIR) or "pipe" (stdout -> stdin, tmpfs as fallback)
+INTERMEDIATE_TRANSPORT = os.getenv("INTERMEDIATE_TRANSPORT", "file")
+INTERMEDIATE_TMPFS_DIR = os.getenv("INTERMEDIATE_TMPFS_DIR", "/dev/shm")
+
+# MP4 layout of the final file: "faststart" moves the moov atom to the front so
+# playback can start before the download finishes, "fragmented" writes fMP4
+MP4_LAYOUT = os.getenv("MP4_LAYOUT", "faststart")
+MP4_LAYOUTS = {
+    "default": [],
+    "faststart": ["-movflags", "+faststart"],
+    "fragmented": ["-movflags", "+frag_keyframe+empty_moov+default_base_moof"],
+}
+
+# Render profiles for the encoding stages: "draft" is a cheap low-res preview,
+# "final" stays under TikTok's upload bitrate so the platform re-encodes less
+RENDER_PROFILE = os.getenv("RENDER_PROFILE", "final")
+DRAFT_SCALE = float(os.getenv("DRAFT_SCALE", "0.5"))
+RENDER_PROFILES = {
+    "draft": {
+        "scale": f"scale=trunc(iw*{DRAFT_SCALE}/2)*2:trunc(ih*{DRAFT_SCALE}/2)*2",
+        "video_args": ["-c:v", "libx264", "-preset", "ultrafast", "-crf", "35", "-pix_fmt", "yuv420p"],
+    },
+    "final": {
+        "scale": None,
+        "video_args": ["-c:v", "libx264", "-preset", "medium", "-crf", "20",
+                       "-maxrate", "8M", "-bufsize", "16M", "-profile:v", "high", "-pix_fmt", "yuv420p"],
+    },
+}
+
+# Job queue: one worker per core, 429 once this many jobs are waiting
+ASSEMBLY_WORKERS = int(os.getenv("ASSEMBLY_WORKERS", os.cpu_count() or 1))
+MAX_QUEUED_JOBS = int(os.getenv("MAX_QUEUED_JOBS", "8"))
+JOB_HISTORY_LIMIT = int(os.getenv("JOB_HISTORY_LIMIT", "100"))
+
+# Per-stage FFmpeg deadlines in seconds; the process group is killed when exceeded
+STAGE_TIMEOUTS = {
+    "concat": int(os.getenv("CONCAT_TIMEOUT", "120")),
+    "audio": int(os.getenv("AUDIO_TIMEOUT", "120")),
+    "subtitles": int(os.getenv("SUBTITLES_TIMEOUT", "600")),
+    "single_pass": int(os.getenv("SINGLE_PASS_TIMEOUT", "900")),
+    "segment": int(os.getenv("SEGMENT_TIMEOUT", "300")),
+    "pipeline": int(os.getenv("PIPELINE_TIMEOUT", "900")),
+    "encode": int(os.getenv("ENCODE_TIMEOUT", "600")),
+    "batch": int(os.getenv("BATCH_TIMEOUT", "1800")),
+    "loudnorm": int(os.getenv("LOUDNORM_TIMEOUT", "120")),
+}
+DEFAULT_STAGE_TIMEOUT = int(os.getenv("DEFAULT_STAGE_TIMEOUT", "600"))
+PROGRESS_INTERVAL = float(os.getenv("PROGRESS_INTERVAL", "0.5"))
+
+# Number of ffprobe results kept in memory (keyed by path + size + mtime)
+PROBE_CACHE_SIZE = int(os.getenv("PROBE_CACHE_SIZE", "256"))
+
+# Retention: evict least recently used artifacts once the disk quota is crossed
+DISK_QUOTA_BYTES = int(os.getenv("DISK_QUOTA_BYTES", str(5 * 1024**3)))
+JANITOR_INTERVAL = int(os.getenv("JANITOR_INTERVAL", "300"))
+TEMP_ORPHAN_AGE = int(os.getenv("TEMP_ORPHAN_AGE", "1800"))  # Unindexed temp files older than this are orphans
+
+# Uploaded clips/audio are streamed to TEMP_DIR in chunks up to this size
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(500 * 1024**2)))
+
+# Finished videos are reused for identical requests up to this many bytes
+OUTPUT_CACHE_MAX_BYTES = int(os.getenv("OUTPUT_CACHE_MAX_BYTES", str(2 * 1024**3)))
+OUTPUT_CACHE_INDEX = os.path.join(OUTPUT_DIR, "output_cache.json")
+
+SUBTITLE_STYLE = "Fontsize=24,PrimaryColour=&Hffffff,OutlineColour=&H000000,Outline=2,Alignment=2"
+SUBTITLE_STYLES = {
+    "default": SUBTITLE_STYLE,
+    "bold": "Fontsize=28,Bold=1,PrimaryColour=&Hffffff,OutlineColour=&H000000,Outline=3,Alignment=2",
+    "top": "Fontsize=24,PrimaryColour=&Hffffff,OutlineColour=&H000000,Outline=2,Alignment=8",
+    "boxed": "Fontsize=24,PrimaryColour=&Hffffff,BackColour=&H80000000,BorderStyle=3,Outline=1,Alignment=2",
+}
+
+# Audio stage: two-pass EBU R128 loudness normalization (loudnorm) and a ducked
+# music bed under the voice. First-pass measurements are cached by content hash
+NORMALIZE_AUDIO = os.getenv("NORMALIZE_AUDIO", "false").lower() == "true"
+LOUDNORM_I = float(os.getenv("LOUDNORM_I", "-14"))  # Integrated loudness target (LUFS)
+LOUDNORM_TP = float(os.getenv("LOUDNORM_TP", "-1.5"))  # True peak ceiling (dBTP)
+LOUDNORM_LRA = float(os.getenv("LOUDNORM_LRA", "11"))  # Loudness range target (LU)
+LOUDNORM_CACHE_SIZE = int(os.getenv("LOUDNORM_CACHE_SIZE", "1024"))
+LOUDNORM_CACHE_INDEX = os.path.join(OUTPUT_DIR, "loudnorm_cache.json")
+BACKGROUND_MUSIC_VOLUME = float(os.getenv("BACKGROUND_MUSIC_VOLUME", "0.2"))
+
+# Batch assembly renders up to this many variants in one FFmpeg process
+MAX_BATCH_VARIANTS = int(os.getenv("MAX_BATCH_VARIANTS", "8"))
+
 # Create directories
 Path(OUTPUT_DIR).mkdir(parents=True, exist_ok=True)
 Path(TEMP_DIR).mkdir(parents=True, exist_ok=True)
@@ -32,26 +140,978 @@ Path(TEMP_DIR).mkdir(parents=True, exist_ok=True)
 class AssemblyRequest(BaseModel):
     video_clips: List[str]  # Paths to video clips
     audio_path: str  # Path to audio file
-    hook: Optional[str] = None  # Optional hook text for caption
+    hook: Optional[str] = None  # Optional hook text for caption (the post caption, not rendered into the video)
     add_subtitles: bool = True
     subtitle_text: Optional[str] = None
+    mode: Optional[str] = None  # Defaults to ASSEMBLY_MODE
+    mp4_layout: Optional[str] = None  # Defaults to MP4_LAYOUT
+    profile: Optional[str] = None  # Defaults to RENDER_PROFILE
+    draft_id: Optional[str] = None  # Reuse this draft's concatenated intermediate
+    subtitle_style: Optional[str] = None  # Key of SUBTITLE_STYLES, defaults to "default"
+    normalize_audio: Optional[bool] = None  # Defaults to NORMALIZE_AUDIO
+    background_music: Optional[str] = None  # Path to a music bed, mixed under the voice and ducked
+    background_music_volume: Optional[float] = None  # Defaults to BACKGROUND_MUSIC_VOLUME
 
 class AssemblyResponse(BaseModel):
     final_video: str
     duration: float
     file_size: int
+    mode: str = "multi_step"
+    cached: bool = False
+    disk_io_avoided: int = 0  # Intermediate bytes not written to / read back from TEMP_DIR
+    profile: str = "final"
+    draft_id: Optional[str] = None  # Set for drafts, pass to /drafts/{draft_id}/finalize
+    reused_intermediate: bool = False
+
+class AssemblyVariant(BaseModel):
+    clip_order: Optional[List[int]] = None  # Indices into the batch's video_clips, defaults to all in order
+    add_subtitles: bool = True
+    subtitle_text: Optional[str] = None
+    subtitle_style: Optional[str] = None
+    mp4_layout: Optional[str] = None
+    profile: Optional[str] = None
+
+class BatchAssemblyRequest(BaseModel):
+    video_clips: List[str]  # Shared by every variant
+    audio_path: str
+    normalize_audio: Optional[bool] = None
+    background_music: Optional[str] = None
+    background_music_volume: Optional[float] = None
+    variants: List[AssemblyVariant]
+
+class BatchAssemblyResponse(BaseModel):
+    results: List[AssemblyResponse]  # One per variant, in request order
+    shared_decode: int = 0  # Variants rendered together in one FFmpeg process
+
+class JobStatus(BaseModel):
+    job_id: str
+    status: str  # queued, running, completed, failed, cancelled
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+    progress: Optional[Dict] = None
+
+# ==============================================
+# Process Supervision
+# ==============================================
+
+class JobCancelled(Exception):
+    pass
+
+class FFmpegTimeout(Exception):
+    pass
+
+# The job running on the current worker thread, set by execute_job
+job_context = threading.local()
+
+def current_job() -> Optional[Dict]:
+    """Return the job being executed on this thread, if any"""
+    return getattr(job_context, "job", None)
+
+def check_cancelled():
+    """Raise JobCancelled if the current job has been cancelled"""
+    job = current_job()
+    if job and job["cancel_requested"]:
+        raise JobCancelled(f"Job {job['job_id']} was cancelled")
+
+def in_job_context(fn, *args):
+    """Wrap fn so it runs with the caller's job context on another thread"""
+    job = current_job()
+    def run():
+        job_context.job = job
+        try:
+            return fn(*args)
+        finally:
+            job_context.job = None
+    return run
+
+def kill_process_group(process: subprocess.Popen):
+    """Kill FFmpeg and anything it spawned"""
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+def parse_progress(values: Dict[str, str], stage: str, duration: Optional[float]) -> Dict:
+    """Turn one FFmpeg -progress block into frames/sec and percent complete"""
+    progress = {"stage": stage, "frame": 0, "fps": 0.0, "out_time": 0.0, "speed": None, "percent": None}
+    try:
+        progress["frame"] = int(values.get("frame", 0))
+        progress["fps"] = float(values.get("fps", 0.0))
+        # out_time_us is microseconds (out_time_ms is too, despite its name)
+        progress["out_time"] = max(0, int(values.get("out_time_us", 0))) / 1_000_000
+    except ValueError:
+        pass
+    
+    speed = values.get("speed", "").rstrip("x")
+    if speed and speed != "N/A":
+        progress["speed"] = float(speed)
+    
+    if duration:
+        progress["percent"] = round(min(100.0, progress["out_time"] / duration * 100), 1)
+    if values.get("progress") == "end":
+        progress["percent"] = 100.0
+    
+    return progress
+
+def run_ffmpeg(cmd: List[str], stage: str, duration: Optional[float] = None,
+               stderr_lines: Optional[List[str]] = None) -> int:
+    """
+    Run an FFmpeg command under supervision and return its exit code
+    
+    Progress is published on the current job, the stage deadline from
+    STAGE_TIMEOUTS is enforced and cancelling the job kills the process group.
+    Pass stderr_lines to collect the command's log output.
+    """
+    returncode, _ = run_ffmpeg_pipeline([cmd], stage, duration, stderr_lines)
+    return returncode
+
+def run_ffmpeg_pipeline(cmds: List[List[str]], stage: str, duration: Optional[float] = None,
+                        stderr_lines: Optional[List[str]] = None) -> tuple:
+    """
+    Run FFmpeg commands connected stdout -> stdin under supervision
+    
+    Every command but the last must write to pipe:1 and every command but
+    the first must read pipe:0. Progress comes from the last command;
+    upstream commands report their output size on stderr. Returns the last
+    command's exit code and the number of bytes that went through pipes.
+    The last command's log lines are appended to stderr_lines if given.
+    """
+    check_cancelled()
+    job = current_job()
+    timeout = STAGE_TIMEOUTS.get(stage, DEFAULT_STAGE_TIMEOUT)
+    
+    processes, stderr_threads = [], []
+    stderr_tail = deque(maxlen=20)
+    piped_bytes = [0] * len(cmds)
+    
+    def drain_stderr(process: subprocess.Popen, index: int):
+        # Drain stderr in the background so a chatty FFmpeg can't block on a full pipe
+        for raw in process.stderr:
+            line = raw.decode("utf-8", "replace")
+            if line.startswith("total_size="):
+                try:
+                    piped_bytes[index] = int(line.partition("=")[2])
+                except ValueError:
+                    pass
+            else:
+                stderr_tail.append(line)
+                if stderr_lines is not None and index == len(cmds) - 1:
+                    stderr_lines.append(line)
+    
+    for i, cmd in enumerate(cmds):
+        last = i == len(cmds) - 1
+        # The last command reports progress on stdout, upstream ones on stderr
+        cmd = [cmd[0], "-nostats", "-progress", "pipe:1" if last else "pipe:2"] + cmd[1:]
+        process = subprocess.Popen(
+            cmd,
+            stdin=processes[-1].stdout if processes else subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            start_new_session=True  # Own process group, so it can be killed as a whole
+        )
+        if processes:
+            # Only the downstream process keeps the read end, so upstream sees EPIPE if it exits
+            processes[-1].stdout.close()
+        processes.append(process)
+        thread = threading.Thread(target=drain_stderr, args=(process, i), daemon=True)
+        thread.start()
+        stderr_threads.append(thread)
+    
+    timed_out = threading.Event()
+    def on_timeout():
+        timed_out.set()
+        for process in processes:
+            kill_process_group(process)
+    timer = threading.Timer(timeout, on_timeout)
+    timer.start()
+    
+    if job:
+        with jobs_lock:
+            job["processes"].update(processes)
+            job["progress"] = parse_progress({}, stage, duration)
+            cancelled = job["cancel_requested"]
+        if cancelled:
+            for process in processes:
+                kill_process_group(process)
+    
+    final = processes[-1]
+    try:
+        values = {}
+        for raw in final.stdout:
+            key, _, value = raw.decode("utf-8", "replace").strip().partition("=")
+            values[key] = value
+            # Each progress block ends with progress=continue|end
+            if key == "progress":
+                if job:
+                    with jobs_lock:
+                        job["progress"] = parse_progress(values, stage, duration)
+                values = {}
+        for process in processes:
+            process.wait()
+    finally:
+        timer.cancel()
+        if job:
+            with jobs_lock:
+                job["processes"].difference_update(processes)
+    
+    for thread in stderr_threads:
+        thread.join(timeout=1)
+    check_cancelled()
+    
+    if timed_out.is_set():
+        raise FFmpegTimeout(f"FFmpeg {stage} stage exceeded {timeout}s")
+    
+    if final.returncode != 0:
+        print(f"   FFmpeg {stage} failed: {''.join(stderr_tail).strip()[-500:]}")
+    
+    return final.returncode, sum(piped_bytes[:-1])
+
+# ==============================================
+# Media Probe
+# ==============================================
+
+ffmpeg_capabilities: Optional[Dict] = None
+capabilities_lock = threading.Lock()
+
+probe_cache: "OrderedDict[tuple, Dict]" = OrderedDict()
+probe_cache_lock = threading.Lock()
+probe_stats = {"hits": 0, "misses": 0, "errors": 0}
+
+def parse_ffmpeg_listing(output: str, separator: bool) -> List[str]:
+    """Extract names from `ffmpeg -encoders` / `ffmpeg -filters` output"""
+    names = []
+    started = not separator
+    for line in output.splitlines():
+        if not started:
+            # -encoders prints a legend, then a dashed line before the entries
+            started = line.strip().startswith("------")
+            continue
+        parts = line.split()
+        if len(parts) < 3 or parts[1] == "=":
+            continue
+        if not separator and "->" not in parts[2]:
+            continue
+        names.append(parts[1])
+    return names
+
+def get_ffmpeg_capabilities() -> Dict:
+    """Probe FFmpeg version, encoders and filters once per process"""
+    global ffmpeg_capabilities
+    with capabilities_lock:
+        if ffmpeg_capabilities is not None:
+            return ffmpeg_capabilities
+        
+        capabilities = {"installed": False, "version": None, "encoders": [], "filters": []}
+        try:
+            result = subprocess.run(["ffmpeg", "-version"], capture_output=True, text=True, check=True, timeout=10)
+            capabilities["installed"] = True
+            capabilities["version"] = result.stdout.split()[2]
+            
+            result = subprocess.run(["ffmpeg", "-hide_banner", "-encoders"], capture_output=True, text=True, timeout=10)
+            capabilities["encoders"] = parse_ffmpeg_listing(result.stdout, separator=True)
+            
+            result = subprocess.run(["ffmpeg", "-hide_banner", "-filters"], capture_output=True, text=True, timeout=10)
+            capabilities["filters"] = parse_ffmpeg_listing(result.stdout, separator=False)
+        except Exception as e:
+            print(f"⚠️  FFmpeg probe failed: {e}")
+        
+        ffmpeg_capabilities = capabilities
+        return capabilities
+
+def parse_probe_output(data: Dict) -> Dict:
+    """Reduce ffprobe JSON to the fields the pipeline uses"""
+    streams = data.get("streams", [])
+    video = next((st for st in streams if st.get("codec_type") == "video"), {})
+    audio = next((st for st in streams if st.get("codec_type") == "audio"), {})
+    
+    return {
+        "duration": float(data.get("format", {}).get("duration") or 0.0),
+        "streams": [
+            {key: st.get(key) for key in ("index", "codec_type", "codec_name", "width", "height", "r_frame_rate", "sample_rate")}
+            for st in streams
+        ],
+        "video_codec": video.get("codec_name"),
+        "audio_codec": audio.get("codec_name"),
+        "width": video.get("width"),
+        "height": video.get("height")
+    }
+
+def probe_media(path: str) -> Optional[Dict]:
+    """Return ffprobe metadata for a file, cached by path + size + mtime"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    
+    with probe_cache_lock:
+        if key in probe_cache:
+            probe_cache.move_to_end(key)
+            probe_stats["hits"] += 1
+            return probe_cache[key]
+        probe_stats["misses"] += 1
+    
+    try:
+        cmd = [
+            "ffprobe",
+            "-v", "error",
+            "-show_format",
+            "-show_streams",
+            "-of", "json",
+            path
+        ]
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+        if result.returncode != 0:
+            raise Exception(result.stderr.strip())
+        info = parse_probe_output(json.loads(result.stdout))
+    except Exception as e:
+        print(f"Error probing {path}: {e}")
+        with probe_cache_lock:
+            probe_stats["errors"] += 1
+        return None
+    
+    with probe_cache_lock:
+        probe_cache[key] = info
+        while len(probe_cache) > PROBE_CACHE_SIZE:
+            probe_cache.popitem(last=False)
+    
+    return info
+
+def get_probe_cache_stats() -> Dict:
+    """Probe cache size and hit rate"""
+    with probe_cache_lock:
+        lookups = probe_stats["hits"] + probe_stats["misses"]
+        return {
+            "entries": len(probe_cache),
+            "max_entries": PROBE_CACHE_SIZE,
+            **probe_stats,
+            "hit_rate": round(probe_stats["hits"] / lookups, 3) if lookups else 0.0
+        }
+
+# ==============================================
+# Output Cache
+# ==============================================
+
+# Content hashes of input files, keyed by path + size + mtime
+file_hash_cache: "OrderedDict[tuple, str]" = OrderedDict()
+
+# cache key -> {"response": AssemblyResponse dict, "size": bytes}, in LRU order
+output_cache: "OrderedDict[str, Dict]" = OrderedDict()
+output_cache_lock = threading.Lock()
+output_cache_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+def hash_file(path: str) -> str:
+    """SHA-256 of a file's content, memoized by path + size + mtime"""
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    
+    with output_cache_lock:
+        if key in file_hash_cache:
+            file_hash_cache.move_to_end(key)
+            return file_hash_cache[key]
+    
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    
+    with output_cache_lock:
+        file_hash_cache[key] = digest.hexdigest()
+        while len(file_hash_cache) > PROBE_CACHE_SIZE:
+            file_hash_cache.popitem(last=False)
+    
+    return digest.hexdigest()
+
+def assembly_cache_key(request: AssemblyRequest) -> Optional[str]:
+    """Content-addressed key for a request, or None if an input can't be read"""
+    try:
+        subtitle_text = " ".join(request.subtitle_text.split()) if request.add_subtitles and request.subtitle_text else None
+        key = {
+            "clips": [hash_file(clip) for clip in request.video_clips],
+            "audio": hash_file(request.audio_path),
+            "subtitles": subtitle_text,
+            "mp4_layout": request.mp4_layout or MP4_LAYOUT,
+            "profile": request.profile or RENDER_PROFILE,
+            "subtitle_style": request.subtitle_style or "default",
+            "audio_processing": audio_processing_key(request)
+        }
+    except OSError:
+        return None
+    
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+def save_output_cache_index():
+    """Persist the cache index so entries survive restarts (caller holds the lock)"""
+    try:
+        with open(OUTPUT_CACHE_INDEX, 'w') as f:
+            json.dump(list(output_cache.items()), f)
+    except OSError as e:
+        print(f"Error saving output cache index: {e}")
+
+def load_output_cache_index():
+    """Load the persisted cache index, dropping entries whose video is gone"""
+    try:
+        with open(OUTPUT_CACHE_INDEX) as f:
+            entries = json.load(f)
+    except (OSError, ValueError):
+        return
+    
+    with output_cache_lock:
+        for key, entry in entries:
+            if os.path.exists(entry["response"]["final_video"]):
+                output_cache[key] = entry
+
+def lookup_cached_output(key: str) -> Optional[AssemblyResponse]:
+    """Return the cached result for a key if its video still exists"""
+    with output_cache_lock:
+        entry = output_cache.get(key)
+        if entry and not os.path.exists(entry["response"]["final_video"]):
+            del output_cache[key]
+            entry = None
+        
+        if not entry:
+            output_cache_stats["misses"] += 1
+            return None
+        
+        output_cache.move_to_end(key)
+        output_cache_stats["hits"] += 1
+        touch_artifact(entry["response"]["final_video"])
+        return AssemblyResponse(**{**entry["response"], "cached": True})
+
+def store_cached_output(key: str, response: AssemblyResponse):
+    """Add a finished video to the cache and evict least recently used entries"""
+    with output_cache_lock:
+        output_cache[key] = {"response": response.model_dump(), "size": response.file_size}
+        output_cache.move_to_end(key)
+        
+        total = sum(entry["size"] for entry in output_cache.values())
+        while total > OUTPUT_CACHE_MAX_BYTES and len(output_cache) > 1:
+            _, evicted = output_cache.popitem(last=False)
+            total -= evicted["size"]
+            output_cache_stats["evictions"] += 1
+            try:
+                os.remove(evicted["response"]["final_video"])
+            except OSError:
+                pass
+            forget_artifact(evicted["response"]["final_video"])
+        
+        save_output_cache_index()
+
+def forget_cached_output(path: str):
+    """Drop cache entries pointing at a video that was deleted"""
+    with output_cache_lock:
+        for key in [k for k, entry in output_cache.items() if entry["response"]["final_video"] == path]:
+            del output_cache[key]
+
+def get_output_cache_stats() -> Dict:
+    """Output cache size and hit rate"""
+    with output_cache_lock:
+        lookups = output_cache_stats["hits"] + output_cache_stats["misses"]
+        return {
+            "entries": len(output_cache),
+            "bytes": sum(entry["size"] for entry in output_cache.values()),
+            "max_bytes": OUTPUT_CACHE_MAX_BYTES,
+            **output_cache_stats,
+            "hit_rate": round(output_cache_stats["hits"] / lookups, 3) if lookups else 0.0
+        }
+
+load_output_cache_index()
+
+# ==============================================
+# Retention
+# ==============================================
+
+# path -> {"size", "last_access", "pins": set of job ids}
+artifacts: Dict[str, Dict] = {}
+artifacts_lock = threading.Lock()
+janitor_stats = {"runs": 0, "bytes_reclaimed": 0, "last_run": None}
+
+def register_artifact(path: str, job_id: Optional[str] = None):
+    """Track a file produced by the service, optionally pinned by a job"""
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return
+    with artifacts_lock:
+        entry = artifacts.setdefault(path, {"size": 0, "last_access": 0.0, "pins": set()})
+        entry["size"] = size
+        entry["last_access"] = time.time()
+        if job_id:
+            entry["pins"].add(job_id)
+
+def touch_artifact(path: str):
+    """Mark an artifact as recently used"""
+    with artifacts_lock:
+        if path in artifacts:
+            artifacts[path]["last_access"] = time.time()
+
+def pin_artifacts(paths: List[str], job_id: str):
+    """Protect tracked artifacts from eviction while a job uses them"""
+    with artifacts_lock:
+        for path in paths:
+            if path in artifacts:
+                artifacts[path]["pins"].add(job_id)
+
+def unpin_artifacts(job_id: str):
+    """Release every pin held by a job"""
+    with artifacts_lock:
+        for entry in artifacts.values():
+            entry["pins"].discard(job_id)
+
+def forget_artifact(path: str):
+    """Stop tracking a file that was removed"""
+    with artifacts_lock:
+        artifacts.pop(path, None)
+
+def scan_artifacts():
+    """Index existing output files, completed uploads and music beds once at startup"""
+    paths = [os.path.join(OUTPUT_DIR, filename) for filename in os.listdir(OUTPUT_DIR)]
+    paths += [
+        os.path.join(TEMP_DIR, filename) for filename in os.listdir(TEMP_DIR)
+        if filename.startswith(("upload_", "music_")) and not filename.endswith(".partial")
+    ]
+    for filepath in paths:
+        if filepath not in (OUTPUT_CACHE_INDEX, LOUDNORM_CACHE_INDEX) and os.path.isfile(filepath):
+            stat = os.stat(filepath)
+            with artifacts_lock:
+                artifacts[filepath] = {"size": stat.st_size, "last_access": stat.st_mtime, "pins": set()}
+
+def remove_orphans(max_age: float) -> Dict:
+    """Delete untracked temp files left behind by crashed or killed jobs"""
+    removed, reclaimed = 0, 0
+    cutoff = time.time() - max_age
+    paths = [os.path.join(TEMP_DIR, filename) for filename in os.listdir(TEMP_DIR)]
+    # tmpfs is shared with other processes, so only take our own multi-step intermediates
+    if os.path.isdir(INTERMEDIATE_TMPFS_DIR) and os.path.realpath(INTERMEDIATE_TMPFS_DIR) != os.path.realpath(TEMP_DIR):
+        paths += [
+            os.path.join(INTERMEDIATE_TMPFS_DIR, filename) for filename in os.listdir(INTERMEDIATE_TMPFS_DIR)
+            if filename.startswith(("concat_", "audio_")) and filename.endswith(".mp4")
+        ]
+    for filepath in paths:
+        with artifacts_lock:
+            tracked = filepath in artifacts
+        try:
+            stat = os.stat(filepath)
+            if tracked or not os.path.isfile(filepath) or stat.st_mtime > cutoff:
+                continue
+            os.remove(filepath)
+            removed += 1
+            reclaimed += stat.st_size
+        except OSError:
+            pass
+    return {"files": removed, "bytes": reclaimed}
+
+def evict_over_quota() -> Dict:
+    """Evict unpinned artifacts, least recently used first, until under quota"""
+    with artifacts_lock:
+        used = sum(entry["size"] for entry in artifacts.values())
+        candidates = sorted(
+            (entry["last_access"], path, entry["size"])
+            for path, entry in artifacts.items() if not entry["pins"]
+        )
+    
+    evicted, reclaimed = 0, 0
+    for _, path, size in candidates:
+        if used <= DISK_QUOTA_BYTES:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            continue
+        forget_artifact(path)
+        forget_cached_output(path)
+        used -= size
+        evicted += 1
+        reclaimed += size
+    
+    return {"files": evicted, "bytes": reclaimed, "used_bytes": used}
+
+def run_janitor(orphan_age: float = TEMP_ORPHAN_AGE) -> Dict:
+    """One retention pass: orphan cleanup, then LRU eviction over the quota"""
+    start = time.time()
+    orphans = remove_orphans(orphan_age)
+    evicted = evict_over_quota()
+    report = {
+        "started_at": start,
+        "duration": round(time.time() - start, 3),
+        "orphans_removed": orphans["files"],
+        "evicted_files": evicted["files"],
+        "bytes_reclaimed": orphans["bytes"] + evicted["bytes"],
+        "used_bytes": evicted["used_bytes"],
+        "quota_bytes": DISK_QUOTA_BYTES
+    }
+    
+    with artifacts_lock:
+        janitor_stats["runs"] += 1
+        janitor_stats["bytes_reclaimed"] += report["bytes_reclaimed"]
+        janitor_stats["last_run"] = report
+    
+    if report["bytes_reclaimed"]:
+        print(f"🧹 Janitor reclaimed {report['bytes_reclaimed']/1024/1024:.2f}MB "
+              f"({report['orphans_removed']} orphans, {report['evicted_files']} evicted)")
+    return report
+
+def get_retention_stats() -> Dict:
+    """Tracked disk usage and janitor history"""
+    with artifacts_lock:
+        return {
+            "artifacts": len(artifacts),
+            "pinned": sum(1 for entry in artifacts.values() if entry["pins"]),
+            "used_bytes": sum(entry["size"] for entry in artifacts.values()),
+            "quota_bytes": DISK_QUOTA_BYTES,
+            "runs": janitor_stats["runs"],
+            "bytes_reclaimed": janitor_stats["bytes_reclaimed"],
+            "last_run": janitor_stats["last_run"]
+        }
+
+def janitor_loop():
+    """Background retention manager"""
+    while True:
+        time.sleep(JANITOR_INTERVAL)
+        try:
+            run_janitor()
+        except Exception as e:
+            print(f"Janitor error: {e}")
+
+# ==============================================
+# Uploads
+# ==============================================
+
+upload_stats = {"uploads": 0, "deduplicated": 0, "bytes_received": 0}
+
+def write_upload_chunks(part: Dict, chunks: List[bytes]):
+    """Append received chunks to a part's file and hash them"""
+    for chunk in chunks:
+        part["file"].write(chunk)
+        part["digest"].update(chunk)
+        part["size"] += len(chunk)
+
+def finish_upload(part: Dict) -> Dict:
+    """Move a completed upload to its content-addressed name, deduplicating"""
+    part["file"].close()
+    sha256 = part["digest"].hexdigest()
+    # The extension ends up in FFmpeg concat lists, so only keep a short plain one
+    ext = os.path.splitext(part["filename"])[1].lower()
+    if not re.fullmatch(r"\.[a-z0-9]{1,8}", ext):
+        ext = ""
+    path = os.path.join(TEMP_DIR, f"upload_{sha256}{ext}")
+    
+    deduplicated = os.path.exists(path)
+    if deduplicated:
+        os.remove(part["partial_path"])
+        touch_artifact(path)
+    else:
+        os.replace(part["partial_path"], path)
+        register_artifact(path)
+    
+    # Seed the output cache's hash memo so assembly never re-reads the file
+    stat = os.stat(path)
+    with output_cache_lock:
+        file_hash_cache[(os.path.abspath(path), stat.st_size, stat.st_mtime_ns)] = sha256
+    with artifacts_lock:
+        upload_stats["uploads"] += 1
+        upload_stats["deduplicated"] += int(deduplicated)
+        upload_stats["bytes_received"] += part["size"]
+    
+    return {
+        "filename": part["filename"],
+        "path": path,
+        "sha256": sha256,
+        "size": part["size"],
+        "deduplicated": deduplicated
+    }
+
+async def stream_multipart_upload(request: Request) -> List[Dict]:
+    """
+    Stream every file part of a multipart request straight into TEMP_DIR
+    
+    Parts are written and hashed chunk by chunk as they arrive from the
+    socket, so memory use does not depend on the file size.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(status_code=400, detail="Expected multipart/form-data")
+    
+    parts = []
+    current = {"header_field": b"", "header_value": b"", "headers": {}, "part": None}
+    pending = []  # (part, chunk or None) parsed from the current network read
+    
+    def on_part_begin():
+        current.update(header_field=b"", header_value=b"", headers={}, part=None)
+    
+    def on_header_field(data, start, end):
+        current["header_field"] += data[start:end]
+    
+    def on_header_value(data, start, end):
+        current["header_value"] += data[start:end]
+    
+    def on_header_end():
+        current["headers"][current["header_field"].lower()] = current["header_value"]
+        current["header_field"], current["header_value"] = b"", b""
+    
+    def on_headers_finished():
+        _, options = parse_options_header(current["headers"].get(b"content-disposition", b""))
+        filename = options.get(b"filename")
+        if filename:
+            # Plain form fields are ignored, only file parts are stored
+            partial_path = os.path.join(TEMP_DIR, f"upload_{uuid.uuid4()}.partial")
+            part = {
+                "filename": os.path.basename(filename.decode("utf-8", "replace")),
+                "partial_path": partial_path,
+                "file": open(partial_path, 'wb'),
+                "digest": hashlib.sha256(),
+                "size": 0
+            }
+            parts.append(part)
+            current["part"] = part
+    
+    def on_part_data(data, start, end):
+        if current["part"]:
+            pending.append((current["part"], data[start:end]))
+    
+    def on_part_end():
+        if current["part"]:
+            pending.append((current["part"], None))
+    
+    parser = MultipartParser(params[b"boundary"], {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end
+    })
+    
+    results = []
+    received = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > MAX_UPLOAD_BYTES:
+                raise HTTPException(status_code=413, detail=f"Upload exceeds {MAX_UPLOAD_BYTES} bytes")
+            
+            parser.write(chunk)
+            
+            # Disk writes run off the event loop
+            batch, finished = {}, []
+            for part, data in pending:
+                if data is None:
+                    finished.append(part)
+                else:
+                    batch.setdefault(id(part), (part, []))[1].append(data)
+            pending.clear()
+            for part, chunks in batch.values():
+                await run_in_threadpool(write_upload_chunks, part, chunks)
+            for part in finished:
+                results.append(await run_in_threadpool(finish_upload, part))
+        parser.finalize()
+    except BaseException:
+        # Client disconnected or upload rejected: drop partial files
+        for part in parts:
+            part["file"].close()
+            if os.path.exists(part["partial_path"]):
+                os.remove(part["partial_path"])
+        raise
+    
+    if not results:
+        raise HTTPException(status_code=400, detail="No files in upload")
+    return results
+
+# ==============================================
+# Audio Processing
+# ==============================================
+
+# Content hash + loudness target -> first-pass loudnorm measurements
+loudnorm_cache: "OrderedDict[str, Dict]" = OrderedDict()
+loudnorm_lock = threading.Lock()
+audio_cache_stats = {"loudnorm_hits": 0, "loudnorm_misses": 0, "music_hits": 0, "music_misses": 0}
+
+LOUDNORM_MEASUREMENTS = ("input_i", "input_tp", "input_lra", "input_thresh", "target_offset")
+
+def loudnorm_target() -> str:
+    """loudnorm options for the configured EBU R128 target"""
+    return f"I={LOUDNORM_I}:TP={LOUDNORM_TP}:LRA={LOUDNORM_LRA}"
+
+def normalize_enabled(request) -> bool:
+    """Whether a request asks for loudness normalization"""
+    return request.normalize_audio if request.normalize_audio is not None else NORMALIZE_AUDIO
+
+def audio_processing_key(request) -> Optional[Dict]:
+    """Part of the output cache key describing audio processing"""
+    normalize = normalize_enabled(request)
+    if not normalize and not request.background_music:
+        return None
+    return {
+        "loudnorm": loudnorm_target() if normalize else None,
+        "music": hash_file(request.background_music) if request.background_music else None,
+        "music_volume": request.background_music_volume if request.background_music_volume is not None
+                        else BACKGROUND_MUSIC_VOLUME
+    }
+
+def save_loudnorm_cache():
+    """Persist measurements so restarts keep skipping the analysis pass (caller holds the lock)"""
+    try:
+        with open(LOUDNORM_CACHE_INDEX, 'w') as f:
+            json.dump(list(loudnorm_cache.items()), f)
+    except OSError as e:
+        print(f"Error saving loudnorm cache: {e}")
+
+def load_loudnorm_cache():
+    """Load persisted loudnorm measurements"""
+    try:
+        with open(LOUDNORM_CACHE_INDEX) as f:
+            entries = json.load(f)
+    except (OSError, ValueError):
+        return
+    
+    with loudnorm_lock:
+        for key, measured in entries[-LOUDNORM_CACHE_SIZE:]:
+            loudnorm_cache[key] = measured
+
+def measure_loudness(audio_path: str) -> Dict:
+    """
+    Run the loudnorm analysis pass, or reuse it for content already measured
+    
+    Measurements are keyed by the input's content hash and the target, so a
+    re-render of the same voice track only needs the second pass.
+    """
+    key = f"{hash_file(audio_path)}:{loudnorm_target()}"
+    with loudnorm_lock:
+        if key in loudnorm_cache:
+            loudnorm_cache.move_to_end(key)
+            audio_cache_stats["loudnorm_hits"] += 1
+            return loudnorm_cache[key]
+        audio_cache_stats["loudnorm_misses"] += 1
+    
+    lines = []
+    cmd = [
+        "ffmpeg",
+        "-i", audio_path,
+        "-vn",
+        "-af", f"loudnorm={loudnorm_target()}:print_format=json",
+        "-f", "null", "-"
+    ]
+    if run_ffmpeg(cmd, "loudnorm", get_video_duration(audio_path), lines) != 0:
+        raise Exception("Loudness analysis failed")
+    
+    # loudnorm prints its measurements as a JSON block at the end of the log
+    log = "".join(lines)
+    stats = json.loads(log[log.rindex("{"):log.rindex("}") + 1])
+    measured = {name: stats[name] for name in LOUDNORM_MEASUREMENTS}
+    
+    with loudnorm_lock:
+        loudnorm_cache[key] = measured
+        while len(loudnorm_cache) > LOUDNORM_CACHE_SIZE:
+            loudnorm_cache.popitem(last=False)
+        save_loudnorm_cache()
+    
+    return measured
+
+def decode_music_bed(music_path: str) -> str:
+    """Decode a music bed to PCM once, content-addressed in TEMP_DIR"""
+    bed_path = os.path.join(TEMP_DIR, f"music_{hash_file(music_path)}.wav")
+    hit = os.path.exists(bed_path)
+    with loudnorm_lock:
+        audio_cache_stats["music_hits" if hit else "music_misses"] += 1
+    if hit:
+        touch_artifact(bed_path)
+        return bed_path
+    
+    # Unique per call: jobs decoding the same bed concurrently each write their own file
+    partial_path = f"{bed_path}.{uuid.uuid4()}.partial"
+    cmd = [
+        "ffmpeg", "-y",
+        "-i", music_path,
+        "-vn",
+        "-ac", "2",
+        "-ar", "48000",
+        "-c:a", "pcm_s16le",
+        "-f", "wav",
+        partial_path
+    ]
+    try:
+        if run_ffmpeg(cmd, "audio", get_video_duration(music_path)) != 0:
+            raise Exception("Failed to decode background music")
+        os.replace(partial_path, bed_path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+    
+    register_artifact(bed_path)
+    return bed_path
+
+def prepare_audio(request, audio_id: str) -> Optional[str]:
+    """
+    Normalize the voice track and mix in the ducked music bed
+    
+    Writes a PCM track to TEMP_DIR that replaces audio_path for the rest of
+    the assembly, or returns None when no audio processing was requested.
+    The loudnorm second pass uses the (cached) first-pass measurements with
+    linear=true, so gain is applied without dynamic compression.
+    """
+    normalize = normalize_enabled(request)
+    if not normalize and not request.background_music:
+        return None
+    
+    chain = "[0:a]aformat=channel_layouts=stereo"
+    if normalize:
+        measured = measure_loudness(request.audio_path)
+        if math.isfinite(float(measured["input_i"])):
+            chain += (
+                f",loudnorm={loudnorm_target()}"
+                f":measured_I={measured['input_i']}:measured_TP={measured['input_tp']}"
+                f":measured_LRA={measured['input_lra']}:measured_thresh={measured['input_thresh']}"
+                f":offset={measured['target_offset']}:linear=true"
+            )
+        else:
+            print("   Warning: Voice track is silent, skipping loudness normalization")
+    # loudnorm resamples to 192kHz internally
+    chain += ",aresample=48000"
+    
+    cmd = ["ffmpeg", "-y", "-i", request.audio_path]
+    if request.background_music:
+        bed_path = decode_music_bed(request.background_music)
+        volume = request.background_music_volume if request.background_music_volume is not None \
+            else BACKGROUND_MUSIC_VOLUME
+        # Loop the bed under the whole voice track and duck it while the voice is speaking
+        cmd += ["-stream_loop", "-1", "-i", bed_path]
+        graph = (
+            f"{chain},asplit=2[voice][key];"
+            f"[1:a]volume={volume}[bed];"
+            f"[bed][key]sidechaincompress=threshold=0.05:ratio=8:attack=20:release=400[ducked];"
+            f"[voice][ducked]amix=inputs=2:duration=first:normalize=0[aout]"
+        )
+    else:
+        graph = f"{chain}[aout]"
+    
+    output_path = os.path.join(TEMP_DIR, f"audio_prep_{audio_id}.wav")
+    cmd += ["-filter_complex", graph, "-map", "[aout]", "-c:a", "pcm_s16le", output_path]
+    if run_ffmpeg(cmd, "audio", get_video_duration(request.audio_path)) != 0:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise Exception("Failed to prepare audio")
+    
+    return output_path
+
+def get_audio_cache_stats() -> Dict:
+    """Loudnorm measurement and music bed cache statistics"""
+    with loudnorm_lock:
+        return {"loudnorm_entries": len(loudnorm_cache), **audio_cache_stats}
+
+load_loudnorm_cache()
 
 # ==============================================
 # FFmpeg Helper Functions
 # ==============================================
 
 def check_ffmpeg() -> bool:
-    """Check if FFmpeg is installed"""
-    try:
-        subprocess.run(["ffmpeg", "-version"], capture_output=True, check=True)
-        return True
-    except:
-        return False
+    """Check if FFmpeg is installed (probed once, see get_ffmpeg_capabilities)"""
+    return get_ffmpeg_capabilities()["installed"]
 
 def concatenate_clips(clips: List[str], output_path: str) -> bool:
     """Concatenate video clips using FFmpeg"""
@@ -72,17 +1132,21 @@ def concatenate_clips(clips: List[str], output_path: str) -> bool:
             output_path
         ]
         
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        
-        # Cleanup
-        os.remove(concat_file)
+        try:
+            returncode = run_ffmpeg(cmd, "concat")
+        finally:
+            # Cleanup
+            os.remove(concat_file)
         
-        return result.returncode == 0
+        return returncode == 0
+    except (JobCancelled, FFmpegTimeout):
+        raise
     except Exception as e:
         print(f"Error concatenating clips: {e}")
         return False
 
-def add_audio_to_video(video_path: str, audio_path: str, output_path: str) -> bool:
+def add_audio_to_video(video_path: str, audio_path: str, output_path: str,
+                       output_args: Optional[List[str]] = None) -> bool:
     """Add audio to video using FFmpeg"""
     try:
         cmd = [
@@ -94,19 +1158,19 @@ def add_audio_to_video(video_path: str, audio_path: str, output_path: str) -> bo
             "-map", "0:v:0",
             "-map", "1:a:0",
             "-shortest",
+            *(output_args or []),
             output_path
         ]
         
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        return result.returncode == 0
+        return run_ffmpeg(cmd, "audio") == 0
+    except (JobCancelled, FFmpegTimeout):
+        raise
     except Exception as e:
         print(f"Error adding audio: {e}")
         return False
 
-def create_subtitle_file(text: str, duration: float) -> str:
-    """Create SRT subtitle file"""
-    srt_path = os.path.join(TEMP_DIR, f"subtitles_{uuid.uuid4()}.srt")
-    
+def build_subtitle_cues(text: str, duration: float) -> List[tuple]:
+    """Split text into (start, end, text) cues spread evenly over the duration"""
     # Split text into chunks (roughly 10 words per subtitle)
     words = text.split()
     chunk_size = 10
@@ -115,17 +1179,47 @@ def create_subtitle_file(text: str, duration: float) -> str:
     # Calculate timing
     chunk_duration = duration / len(chunks)
     
+    return [(i * chunk_duration, (i + 1) * chunk_duration, chunk) for i, chunk in enumerate(chunks)]
+
+def write_subtitle_file(cues: List[tuple]) -> str:
+    """Write cues to a new SRT file in TEMP_DIR"""
+    srt_path = os.path.join(TEMP_DIR, f"subtitles_{uuid.uuid4()}.srt")
+    
     with open(srt_path, 'w') as f:
-        for i, chunk in enumerate(chunks):
-            start_time = i * chunk_duration
-            end_time = (i + 1) * chunk_duration
-            
+        for i, (start_time, end_time, chunk) in enumerate(cues):
             f.write(f"{i+1}\n")
             f.write(f"{format_time(start_time)} --> {format_time(end_time)}\n")
             f.write(f"{chunk}\n\n")
     
     return srt_path
 
+def create_subtitle_file(text: str, duration: float) -> str:
+    """Create SRT subtitle file"""
+    return write_subtitle_file(build_subtitle_cues(text, duration))
+
+def split_cues_at_boundaries(cues: List[tuple], durations: List[float]) -> List[List[tuple]]:
+    """
+    Split a subtitle timeline into per-segment timelines
+    
+    Each segment gets the cues overlapping it, clipped to the segment and
+    shifted so the segment starts at 0. A cue crossing a seam is shown in
+    both segments, so it stays on screen across the join.
+    """
+    segments = []
+    segment_start = 0.0
+    for duration in durations:
+        segment_end = segment_start + duration
+        segment_cues = []
+        for start, end, text in cues:
+            if end <= segment_start or start >= segment_end:
+                continue
+            segment_cues.append((max(start, segment_start) - segment_start,
+                                 min(end, segment_end) - segment_start,
+                                 text))
+        segments.append(segment_cues)
+        segment_start = segment_end
+    return segments
+
 def format_time(seconds: float) -> str:
     """Format seconds to SRT time format (00:00:00,000)"""
     hours = int(seconds // 3600)
@@ -134,7 +1228,14 @@ def format_time(seconds: float) -> str:
     millis = int((seconds - int(seconds)) * 1000)
     return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
 
-def add_subtitles_to_video(video_path: str, subtitle_text: str, duration: float, output_path: str) -> bool:
+def subtitle_filter(srt_path: str, style: Optional[str] = None) -> str:
+    """FFmpeg subtitles filter for an SRT file with a SUBTITLE_STYLES preset"""
+    return f"subtitles={srt_path}:force_style='{SUBTITLE_STYLES[style or 'default']}'"
+
+def add_subtitles_to_video(video_path: str, subtitle_text: str, duration: float, output_path: str,
+                           output_args: Optional[List[str]] = None,
+                           video_args: Optional[List[str]] = None,
+                           style: Optional[str] = None) -> bool:
     """Add subtitles to video using FFmpeg"""
     try:
         # Create subtitle file
@@ -144,172 +1245,1185 @@ def add_subtitles_to_video(video_path: str, subtitle_text: str, duration: float,
         cmd = [
             "ffmpeg",
             "-i", video_path,
-            "-vf", f"subtitles={srt_path}:force_style='Fontsize=24,PrimaryColour=&Hffffff,OutlineColour=&H000000,Outline=2,Alignment=2'",
+            "-vf", subtitle_filter(srt_path, style),
+            *(video_args or []),
             "-c:a", "copy",
+            *(output_args or []),
             output_path
         ]
         
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        
-        # Cleanup
-        os.remove(srt_path)
+        try:
+            returncode = run_ffmpeg(cmd, "subtitles", duration)
+        finally:
+            # Cleanup
+            os.remove(srt_path)
         
-        return result.returncode == 0
+        return returncode == 0
+    except (JobCancelled, FFmpegTimeout):
+        raise
     except Exception as e:
         print(f"Error adding subtitles: {e}")
         return False
 
 def get_video_duration(video_path: str) -> float:
-    """Get video duration using FFmpeg"""
+    """Get video duration using the cached ffprobe metadata"""
+    info = probe_media(video_path)
+    return info["duration"] if info else 0.0
+
+def build_single_pass_command(clips: List[str], audio_path: str, output_path: str,
+                              srt_path: Optional[str] = None,
+                              output_args: Optional[List[str]] = None,
+                              video_args: Optional[List[str]] = None,
+                              style: Optional[str] = None) -> List[str]:
+    """Build one FFmpeg command that concatenates, muxes audio and burns subtitles"""
+    cmd = ["ffmpeg", "-y"]
+    for clip in clips:
+        cmd += ["-i", clip]
+    cmd += ["-i", audio_path]
+    
+    # Concat all clip video streams, then burn subtitles on the joined stream
+    inputs = "".join(f"[{i}:v:0]" for i in range(len(clips)))
+    graph = f"{inputs}concat=n={len(clips)}:v=1:a=0[vcat]"
+    if srt_path:
+        graph += f";[vcat]{subtitle_filter(srt_path, style)}[vout]"
+    else:
+        graph += ";[vcat]null[vout]"
+    
+    cmd += [
+        "-filter_complex", graph,
+        "-map", "[vout]",
+        "-map", f"{len(clips)}:a:0",
+        *(video_args or []),
+        "-c:a", "aac",
+        "-shortest",
+        *(output_args or []),
+        output_path
+    ]
+    return cmd
+
+def assemble_single_pass(clips: List[str], audio_path: str, subtitle_text: Optional[str],
+                         output_path: str, output_args: Optional[List[str]] = None,
+                         video_args: Optional[List[str]] = None, style: Optional[str] = None) -> bool:
+    """Assemble the final video with a single FFmpeg invocation"""
+    srt_path = None
     try:
-        cmd = [
-            "ffprobe",
-            "-v", "error",
-            "-show_entries", "format=duration",
-            "-of", "default=noprint_wrappers=1:nokey=1",
-            video_path
-        ]
+        # Output is cut to the shorter of video and audio (-shortest)
+        video_duration = sum(get_video_duration(clip) for clip in clips)
+        audio_duration = get_video_duration(audio_path)
+        durations = [d for d in (video_duration, audio_duration) if d > 0]
+        duration = min(durations) if durations else None
         
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        if result.returncode == 0:
-            return float(result.stdout.strip())
-    except:
-        pass
-    
-    return 0.0
+        if subtitle_text and duration:
+            srt_path = create_subtitle_file(subtitle_text, duration)
+        
+        cmd = build_single_pass_command(clips, audio_path, output_path, srt_path, output_args, video_args, style)
+        return run_ffmpeg(cmd, "single_pass", duration) == 0
+    except (JobCancelled, FFmpegTimeout):
+        raise
+    except Exception as e:
+        print(f"Error in single-pass assembly: {e}")
+        return False
+    finally:
+        if srt_path and os.path.exists(srt_path):
+            os.remove(srt_path)
 
-# ==============================================
-# API Endpoints
-# ==============================================
-
-@app.get("/")
-def read_root():
-    ffmpeg_installed = check_ffmpeg()
-    return {
-        "service": "Video Assembly Service",
-        "status": "running",
-        "cost": "FREE",
-        "backend": "FFmpeg",
-        "ffmpeg_installed": ffmpeg_installed
-    }
-
-@app.get("/health")
-def health_check():
-    """Health check endpoint"""
-    ffmpeg_status = "installed" if check_ffmpeg() else "not_found"
-    return {
-        "status": "healthy" if ffmpeg_status == "installed" else "ffmpeg_missing",
-        "ffmpeg": ffmpeg_status,
-        "output_dir": OUTPUT_DIR
-    }
+def render_segment(clip: str, cues: List[tuple], index: int, output_path: str,
+                   video_args: Optional[List[str]] = None, style: Optional[str] = None) -> bool:
+    """Burn one segment's subtitles into its clip (video only)"""
+    srt_path = write_subtitle_file(cues) if cues else None
+    try:
+        vf = subtitle_filter(srt_path, style) if srt_path else "null"
+        cmd = [
+            "ffmpeg", "-y",
+            "-i", clip,
+            "-vf", vf,
+            "-an",
+            *(video_args or ["-c:v", "libx264", "-pix_fmt", "yuv420p"]),
+            output_path
+        ]
+        return run_ffmpeg(cmd, "segment", get_video_duration(clip)) == 0
+    except (JobCancelled, FFmpegTimeout):
+        raise
+    except Exception as e:
+        print(f"Error rendering segment {index}: {e}")
+        return False
+    finally:
+        if srt_path and os.path.exists(srt_path):
+            os.remove(srt_path)
 
-@app.post("/assemble-video", response_model=AssemblyResponse)
-def assemble_video(request: AssemblyRequest):
+def assemble_segmented(clips: List[str], audio_path: str, subtitle_text: Optional[str],
+                       output_path: str, video_id: str, output_args: Optional[List[str]] = None,
+                       video_args: Optional[List[str]] = None, style: Optional[str] = None) -> bool:
     """
-    Assemble final video using FREE FFmpeg:
-    1. Concatenate video clips
-    2. Add audio
-    3. Add subtitles (optional)
+    Burn subtitles per clip in parallel, then join with stream-copy concat
+    
+    The subtitle timeline is split at the clip boundaries so every segment
+    can be encoded independently on its own core.
     """
+    durations = [get_video_duration(clip) for clip in clips]
+    if not subtitle_text or not all(durations):
+        return False
+    
+    # Output is cut to the shorter of video and audio (-shortest)
+    audio_duration = get_video_duration(audio_path)
+    total = min(sum(durations), audio_duration) if audio_duration > 0 else sum(durations)
+    segment_cues = split_cues_at_boundaries(build_subtitle_cues(subtitle_text, total), durations)
+    
+    segments = [os.path.join(TEMP_DIR, f"segment_{video_id}_{i}.mp4") for i in range(len(clips))]
+    temp_concat = os.path.join(TEMP_DIR, f"concat_{video_id}.mp4")
     try:
-        if not check_ffmpeg():
-            raise HTTPException(
-                status_code=503,
-                detail="FFmpeg not installed. Install with: apt-get install ffmpeg"
-            )
+        futures = [
+            segment_pool.submit(in_job_context(render_segment, clip, cues, i, segment, video_args, style))
+            for i, (clip, cues, segment) in enumerate(zip(clips, segment_cues, segments))
+        ]
+        # Wait for every segment before cleanup, even if one failed or timed out
+        wait(futures)
+        results = [future.result() for future in futures]
+        if not all(results):
+            return False
         
-        if not request.video_clips:
-            raise HTTPException(status_code=400, detail="No video clips provided")
+        if not concatenate_clips(segments, temp_concat):
+            return False
         
-        if not request.audio_path:
-            raise HTTPException(status_code=400, detail="No audio path provided")
+        return add_audio_to_video(temp_concat, audio_path, output_path, output_args)
+    finally:
+        for path in segments + [temp_concat]:
+            if os.path.exists(path):
+                os.remove(path)
+
+def assemble_multi_step_piped(request: AssemblyRequest, final_output: str,
+                              output_args: Optional[List[str]] = None,
+                              video_args: Optional[List[str]] = None) -> Optional[int]:
+    """
+    Run concat -> audio mux -> subtitle burn-in as one streaming pipeline
+    
+    Stages are connected with pipes carrying Matroska, so no intermediate
+    file is written. Returns the number of bytes that went through the
+    pipes, or None if the pipeline failed.
+    """
+    concat_file = os.path.join(TEMP_DIR, f"concat_{uuid.uuid4()}.txt")
+    srt_path = None
+    try:
+        with open(concat_file, 'w') as f:
+            for clip in request.video_clips:
+                f.write(f"file '{clip}'\n")
         
-        print(f"🎬 Assembling video from {len(request.video_clips)} clips...")
+        subtitles = request.add_subtitles and request.subtitle_text
+        # Intermediates can't be probed, so derive the duration from the inputs (-shortest)
+        video_duration = sum(get_video_duration(clip) for clip in request.video_clips)
+        audio_duration = get_video_duration(request.audio_path)
+        durations = [d for d in (video_duration, audio_duration) if d > 0]
+        duration = min(durations) if durations else None
+        if subtitles:
+            if not duration:
+                return None
+            srt_path = create_subtitle_file(request.subtitle_text, duration)
         
-        # Generate unique filename
-        video_id = uuid.uuid4()
-        temp_concat = os.path.join(TEMP_DIR, f"concat_{video_id}.mp4")
-        temp_audio = os.path.join(TEMP_DIR, f"audio_{video_id}.mp4")
-        final_output = os.path.join(OUTPUT_DIR, f"final_{video_id}.mp4")
+        cmds = [
+            ["ffmpeg", "-f", "concat", "-safe", "0", "-i", concat_file,
+             "-c", "copy", "-f", "matroska", "pipe:1"],
+            ["ffmpeg", "-i", "pipe:0", "-i", request.audio_path,
+             "-c:v", "copy", "-c:a", "aac", "-map", "0:v:0", "-map", "1:a:0", "-shortest"]
+        ]
+        if srt_path:
+            cmds[-1] += ["-f", "matroska", "pipe:1"]
+            cmds.append(["ffmpeg", "-y", "-i", "pipe:0",
+                         "-vf", subtitle_filter(srt_path, request.subtitle_style),
+                         *(video_args or []), "-c:a", "copy", *(output_args or []), final_output])
+        else:
+            cmds[-1] += ["-y", *(output_args or []), final_output]
         
-        # Step 1: Concatenate clips
-        print("   Step 1: Concatenating clips...")
-        if not concatenate_clips(request.video_clips, temp_concat):
-            raise Exception("Failed to concatenate clips")
+        returncode, piped_bytes = run_ffmpeg_pipeline(cmds, "pipeline", duration)
+        return piped_bytes if returncode == 0 else None
+    except (JobCancelled, FFmpegTimeout):
+        raise
+    except Exception as e:
+        print(f"Error in piped assembly: {e}")
+        return None
+    finally:
+        os.remove(concat_file)
+        if srt_path and os.path.exists(srt_path):
+            os.remove(srt_path)
+
+def assemble_multi_step(request: AssemblyRequest, video_id: str, final_output: str,
+                        output_args: Optional[List[str]] = None,
+                        video_args: Optional[List[str]] = None) -> int:
+    """
+    Assemble the final video with separate concat, audio and subtitle passes
+    
+    Returns the bytes of TEMP_DIR I/O avoided by the intermediate transport.
+    """
+    transport = INTERMEDIATE_TRANSPORT
+    if transport == "pipe":
+        print("   Piped: concat | audio | subtitles...")
+        try:
+            piped_bytes = assemble_multi_step_piped(request, final_output, output_args, video_args)
+        except FFmpegTimeout as e:
+            print(f"   Warning: {e}")
+            piped_bytes = None
+        if piped_bytes is not None:
+            # Each intermediate would have been written once and read back once
+            return 2 * piped_bytes
+        check_cancelled()
+        print("   Warning: Piped assembly failed, retrying with tmpfs intermediates")
+        if os.path.exists(final_output):
+            os.remove(final_output)
+        transport = "tmpfs"
+    
+    intermediate_dirs = [TEMP_DIR]
+    if transport == "tmpfs":
+        # The concat and audio intermediates are each about as large as the clips together
+        needed = 2 * sum(os.path.getsize(clip) for clip in request.video_clips) + os.path.getsize(request.audio_path)
+        if not (os.path.isdir(INTERMEDIATE_TMPFS_DIR) and os.access(INTERMEDIATE_TMPFS_DIR, os.W_OK)):
+            print(f"   Warning: {INTERMEDIATE_TMPFS_DIR} not writable, using {TEMP_DIR}")
+        elif shutil.disk_usage(INTERMEDIATE_TMPFS_DIR).free < needed:
+            print(f"   Warning: {INTERMEDIATE_TMPFS_DIR} has less than {needed/1024/1024:.1f}MB free, using {TEMP_DIR}")
+        else:
+            intermediate_dirs.insert(0, INTERMEDIATE_TMPFS_DIR)
+    
+    temp_concat = temp_audio = None
+    try:
+        for intermediate_dir in intermediate_dirs:
+            temp_concat = os.path.join(intermediate_dir, f"concat_{video_id}.mp4")
+            temp_audio = os.path.join(intermediate_dir, f"audio_{video_id}.mp4")
+            
+            # Step 1: Concatenate clips
+            print("   Step 1: Concatenating clips...")
+            error = None
+            if not concatenate_clips(request.video_clips, temp_concat):
+                error = "Failed to concatenate clips"
+            else:
+                # Step 2: Add audio
+                print("   Step 2: Adding audio...")
+                # The audio output may become the final video, so it gets the output options too
+                if not add_audio_to_video(temp_concat, request.audio_path, temp_audio, output_args):
+                    error = "Failed to add audio"
+            if not error:
+                break
+            
+            if intermediate_dir == TEMP_DIR:
+                raise Exception(error)
+            # tmpfs can fill up (ENOSPC) when other jobs share it, so retry on disk
+            check_cancelled()
+            print(f"   Warning: {error} in {intermediate_dir}, retrying in {TEMP_DIR}")
+            for path in (temp_concat, temp_audio):
+                if os.path.exists(path):
+                    os.remove(path)
         
-        # Step 2: Add audio
-        print("   Step 2: Adding audio...")
-        if not add_audio_to_video(temp_concat, request.audio_path, temp_audio):
-            raise Exception("Failed to add audio")
+        intermediate_bytes = os.path.getsize(temp_concat) + os.path.getsize(temp_audio)
         
         # Step 3: Add subtitles (if requested)
         if request.add_subtitles and request.subtitle_text:
             print("   Step 3: Adding subtitles...")
             duration = get_video_duration(temp_audio)
-            if not add_subtitles_to_video(temp_audio, request.subtitle_text, duration, final_output):
+            if not add_subtitles_to_video(temp_audio, request.subtitle_text, duration, final_output,
+                                          output_args, video_args, request.subtitle_style):
                 # If subtitles fail, use video without subtitles
+                check_cancelled()
                 print("   Warning: Subtitles failed, using video without subtitles")
-                os.rename(temp_audio, final_output)
+                shutil.move(temp_audio, final_output)
         else:
-            os.rename(temp_audio, final_output)
-        
-        # Get video info
-        duration = get_video_duration(final_output)
-        file_size = os.path.getsize(final_output)
+            shutil.move(temp_audio, final_output)
         
+        return 2 * intermediate_bytes if intermediate_dir != TEMP_DIR else 0
+    finally:
         # Cleanup temp files
         try:
-            if os.path.exists(temp_concat):
-                os.remove(temp_concat)
-            if os.path.exists(temp_audio):
-                os.remove(temp_audio)
+            for path in (temp_concat, temp_audio):
+                if path and os.path.exists(path):
+                    os.remove(path)
         except:
             pass
+
+def encode_with_profile(video_path: str, subtitle_text: Optional[str], duration: float, output_path: str,
+                        profile: str, output_args: Optional[List[str]] = None,
+                        style: Optional[str] = None) -> bool:
+    """Scale, burn subtitles and encode a muxed intermediate with a render profile"""
+    settings = RENDER_PROFILES[profile]
+    srt_path = None
+    try:
+        filters = []
+        if settings["scale"]:
+            filters.append(settings["scale"])
+        if subtitle_text:
+            srt_path = create_subtitle_file(subtitle_text, duration)
+            filters.append(subtitle_filter(srt_path, style))
+        
+        cmd = [
+            "ffmpeg", "-y",
+            "-i", video_path,
+            "-vf", ",".join(filters) or "null",
+            *settings["video_args"],
+            "-c:a", "copy",
+            *(output_args or []),
+            output_path
+        ]
+        return run_ffmpeg(cmd, "encode", duration) == 0
+    except (JobCancelled, FFmpegTimeout):
+        raise
+    except Exception as e:
+        print(f"Error encoding {profile} render: {e}")
+        return False
+    finally:
+        if srt_path and os.path.exists(srt_path):
+            os.remove(srt_path)
+
+def assemble_from_intermediate(request: AssemblyRequest, video_id: str, final_output: str, profile: str,
+                               output_args: Optional[List[str]] = None) -> Tuple[str, bool]:
+    """
+    Build (or reuse) the concatenated, audio-muxed intermediate and encode it
+    
+    Drafts keep their intermediate so a later final render only repeats the
+    encode. Returns the intermediate's path and whether a draft's
+    intermediate was reused.
+    """
+    draft = get_draft(request.draft_id) if request.draft_id else None
+    intermediate = draft["intermediate"] if draft and os.path.exists(draft["intermediate"]) else None
+    reused = intermediate is not None
+    created = None
+    
+    try:
+        if reused:
+            print(f"   Reusing draft intermediate {intermediate}")
+            touch_artifact(intermediate)
+        else:
+            if request.draft_id:
+                print(f"   Warning: Draft {request.draft_id} intermediate not available, rebuilding")
+            created = intermediate = os.path.join(TEMP_DIR, f"draft_{video_id}.mp4")
+            temp_concat = os.path.join(TEMP_DIR, f"concat_{video_id}.mp4")
+            try:
+                print("   Step 1: Concatenating clips...")
+                if not concatenate_clips(request.video_clips, temp_concat):
+                    raise Exception("Failed to concatenate clips")
+                print("   Step 2: Adding audio...")
+                if not add_audio_to_video(temp_concat, request.audio_path, intermediate):
+                    raise Exception("Failed to add audio")
+            finally:
+                if os.path.exists(temp_concat):
+                    os.remove(temp_concat)
+        
+        print(f"   Step 3: Encoding {profile} render...")
+        subtitle_text = request.subtitle_text if request.add_subtitles else None
+        if not encode_with_profile(intermediate, subtitle_text, get_video_duration(intermediate), final_output,
+                                   profile, output_args, request.subtitle_style):
+            check_cancelled()
+            raise Exception(f"Failed to encode {profile} render")
+    except BaseException:
+        if created and os.path.exists(created):
+            os.remove(created)
+        raise
+    
+    if profile == "draft":
+        job = current_job()
+        register_artifact(intermediate, job["job_id"] if job else None)
+    elif created:
+        os.remove(created)
+    
+    return intermediate, reused
+
+def build_batch_command(requests: List[AssemblyRequest], srt_paths: List[Optional[str]],
+                        outputs: List[str]) -> List[str]:
+    """
+    Build one FFmpeg command that renders every variant
+    
+    All variants must concat the same clips in the same order. Each clip is
+    decoded once and split to every variant, so the split branches are
+    consumed at the same pace; with different orders a branch would buffer
+    every decoded frame until its own concat reached that clip. Each variant
+    gets its own concat, subtitle burn-in, encoder and output file.
+    """
+    clips = requests[0].video_clips
+    if any(request.video_clips != clips for request in requests):
+        raise ValueError("Shared decode needs every variant to use the same clip order")
+    audio_index = len(clips)
+    
+    cmd = ["ffmpeg", "-y"]
+    for clip in clips:
+        cmd += ["-i", clip]
+    cmd += ["-i", requests[0].audio_path]
+    
+    # One input per position, so a clip repeated within the order is decoded again
+    graph = []
+    labels = []
+    for i in range(len(clips)):
+        if len(requests) == 1:
+            labels.append([f"[{i}:v:0]"])
+        else:
+            labels.append([f"[c{i}_{j}]" for j in range(len(requests))])
+            graph.append(f"[{i}:v:0]split={len(requests)}{''.join(labels[i])}")
+    
+    for j, (request, srt_path) in enumerate(zip(requests, srt_paths)):
+        profile = RENDER_PROFILES[request.profile or RENDER_PROFILE]
+        chain = "".join(labels[i][j] for i in range(len(clips)))
+        chain += f"concat=n={len(request.video_clips)}:v=1:a=0"
+        if profile["scale"]:
+            chain += f",{profile['scale']}"
+        if srt_path:
+            chain += f",{subtitle_filter(srt_path, request.subtitle_style)}"
+        graph.append(f"{chain}[v{j}]")
+    
+    cmd += ["-filter_complex", ";".join(graph)]
+    for j, (request, output_path) in enumerate(zip(requests, outputs)):
+        cmd += [
+            "-map", f"[v{j}]",
+            "-map", f"{audio_index}:a:0",
+            *RENDER_PROFILES[request.profile or RENDER_PROFILE]["video_args"],
+            "-c:a", "aac",
+            "-shortest",
+            *MP4_LAYOUTS[request.mp4_layout or MP4_LAYOUT],
+            output_path
+        ]
+    return cmd
+
+def assemble_batch_shared(requests: List[AssemblyRequest], outputs: List[str]) -> bool:
+    """Render variants sharing clips and audio with a single FFmpeg invocation"""
+    srt_paths = []
+    try:
+        # Each output is cut to the shorter of its video and the audio (-shortest)
+        audio_duration = get_video_duration(requests[0].audio_path)
+        durations = []
+        for request in requests:
+            video_duration = sum(get_video_duration(clip) for clip in request.video_clips)
+            known = [d for d in (video_duration, audio_duration) if d > 0]
+            duration = min(known) if known else None
+            durations.append(duration)
+            
+            subtitle_text = request.subtitle_text if request.add_subtitles else None
+            srt_paths.append(create_subtitle_file(subtitle_text, duration) if subtitle_text and duration else None)
+        
+        cmd = build_batch_command(requests, srt_paths, outputs)
+        longest = max((d for d in durations if d), default=None)
+        return run_ffmpeg(cmd, "batch", longest) == 0
+    except (JobCancelled, FFmpegTimeout):
+        raise
+    except Exception as e:
+        print(f"Error in batch assembly: {e}")
+        return False
+    finally:
+        for srt_path in srt_paths:
+            if srt_path and os.path.exists(srt_path):
+                os.remove(srt_path)
+
+def validate_request(request: AssemblyRequest) -> str:
+    """Validate an assembly request and return the resolved mode"""
+    if not check_ffmpeg():
+        raise HTTPException(
+            status_code=503,
+            detail="FFmpeg not installed. Install with: apt-get install ffmpeg"
+        )
+    
+    if not request.video_clips:
+        raise HTTPException(status_code=400, detail="No video clips provided")
+    
+    if not request.audio_path:
+        raise HTTPException(status_code=400, detail="No audio path provided")
+    
+    mode = request.mode or ASSEMBLY_MODE
+    if mode not in ASSEMBLY_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown mode: {mode}. Use one of {ASSEMBLY_MODES}")
+    
+    layout = request.mp4_layout or MP4_LAYOUT
+    if layout not in MP4_LAYOUTS:
+        raise HTTPException(status_code=400, detail=f"Unknown mp4_layout: {layout}. Use one of {list(MP4_LAYOUTS)}")
+    
+    profile = request.profile or RENDER_PROFILE
+    if profile not in RENDER_PROFILES:
+        raise HTTPException(status_code=400, detail=f"Unknown profile: {profile}. Use one of {list(RENDER_PROFILES)}")
+    
+    if request.background_music_volume is not None and request.background_music_volume < 0:
+        raise HTTPException(status_code=400, detail="background_music_volume must not be negative")
+    
+    if request.subtitle_style and request.subtitle_style not in SUBTITLE_STYLES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown subtitle_style: {request.subtitle_style}. Use one of {list(SUBTITLE_STYLES)}"
+        )
+    
+    # The draft's intermediate already holds its clips and processed audio
+    draft = get_draft(request.draft_id) if request.draft_id else None
+    if draft:
+        mismatched = [field for field in DRAFT_INPUT_FIELDS if draft["request"][field] != getattr(request, field)]
+        if mismatched:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Draft {request.draft_id} was rendered with different {', '.join(mismatched)}"
+            )
+    
+    return mode
+
+def validate_batch(batch: BatchAssemblyRequest) -> List[AssemblyRequest]:
+    """Validate a batch and expand its variants into assembly requests"""
+    if not batch.variants:
+        raise HTTPException(status_code=400, detail="No variants provided")
+    
+    if len(batch.variants) > MAX_BATCH_VARIANTS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_VARIANTS} variants per batch")
+    
+    requests = []
+    for i, variant in enumerate(batch.variants):
+        order = variant.clip_order if variant.clip_order is not None else list(range(len(batch.video_clips)))
+        if not all(0 <= index < len(batch.video_clips) for index in order):
+            raise HTTPException(status_code=400, detail=f"Variant {i}: clip_order index out of range")
+        
+        request = AssemblyRequest(
+            video_clips=[batch.video_clips[index] for index in order],
+            audio_path=batch.audio_path,
+            normalize_audio=batch.normalize_audio,
+            background_music=batch.background_music,
+            background_music_volume=batch.background_music_volume,
+            **variant.model_dump(exclude={"clip_order"})
+        )
+        validate_request(request)
+        requests.append(request)
+    
+    return requests
+
+def run_assembly(request: AssemblyRequest, mode: str) -> AssemblyResponse:
+    """
+    Assemble final video using FREE FFmpeg:
+    1. Concatenate video clips
+    2. Add audio
+    3. Add subtitles (optional)
+    
+    In single_pass mode all three steps run as one FFmpeg filter graph;
+    in segmented mode subtitles are burned per clip in parallel. Both only
+    apply when there are subtitles to burn in (otherwise the stream-copy
+    multi_step path is used) and fall back to multi_step if they fail.
+    
+    Drafts, and final renders of a draft, go through a kept concat + audio
+    intermediate instead so the draft can be upgraded without redoing it.
+    """
+    print(f"🎬 Assembling video from {len(request.video_clips)} clips ({mode})...")
+    
+    # Generate unique filename
+    video_id = str(uuid.uuid4())
+    final_output = os.path.join(OUTPUT_DIR, f"final_{video_id}.mp4")
+    
+    # Normalization and music mixing run once, ahead of every mode's audio stage.
+    # A reused draft intermediate already carries the processed audio
+    draft = get_draft(request.draft_id) if request.draft_id else None
+    source_request = request
+    prepared_audio = None
+    if not (draft and os.path.exists(draft["intermediate"])):
+        prepared_audio = prepare_audio(request, video_id)
+    if prepared_audio:
+        request = request.model_copy(update={"audio_path": prepared_audio})
+    
+    try:
+        subtitle_text = request.subtitle_text if request.add_subtitles else None
+        output_args = MP4_LAYOUTS[request.mp4_layout or MP4_LAYOUT]
+        profile = request.profile or RENDER_PROFILE
+        video_args = RENDER_PROFILES[profile]["video_args"]
+        reused_intermediate = False
+        if profile == "draft" or request.draft_id:
+            print(f"   Profile {profile}: concat + audio intermediate, then encode...")
+            intermediate, reused_intermediate = assemble_from_intermediate(request, video_id, final_output, profile,
+                                                                           output_args)
+            if profile == "draft":
+                # The draft record keeps the caller's request, not the prepared audio
+                store_draft(video_id, source_request, intermediate)
+            mode = "intermediate"
+        
+        if mode in ("single_pass", "segmented") and not subtitle_text:
+            # Nothing to burn in: the multi-step path stream-copies instead of re-encoding
+            mode = "multi_step"
+        
+        if mode in ("single_pass", "segmented"):
+            if mode == "single_pass":
+                print("   Single pass: concat + audio + subtitles...")
+                assembled = assemble_single_pass(request.video_clips, request.audio_path, subtitle_text, final_output,
+                                                 output_args, video_args, request.subtitle_style)
+            else:
+                print(f"   Segmented: {len(request.video_clips)} segments on {SEGMENT_WORKERS} workers...")
+                assembled = assemble_segmented(request.video_clips, request.audio_path, subtitle_text, final_output,
+                                               video_id, output_args, video_args, request.subtitle_style)
+        
+            if not assembled:
+                # Fall back to the multi-step path
+                check_cancelled()
+                print(f"   Warning: {mode} failed, falling back to multi-step")
+                if os.path.exists(final_output):
+                    os.remove(final_output)
+                mode = "multi_step"
+        
+        disk_io_avoided = 0
+        if mode == "multi_step":
+            disk_io_avoided = assemble_multi_step(request, video_id, final_output, output_args, video_args)
+        
+        # Get video info
+        job = current_job()
+        register_artifact(final_output, job["job_id"] if job else None)
+        duration = get_video_duration(final_output)
+        file_size = os.path.getsize(final_output)
         
         print(f"✅ Video assembled: {duration:.2f}s, {file_size/1024/1024:.2f}MB")
         
         return AssemblyResponse(
             final_video=final_output,
             duration=duration,
-            file_size=file_size
+            file_size=file_size,
+            mode=mode,
+            disk_io_avoided=disk_io_avoided,
+            profile=profile,
+            draft_id=video_id if profile == "draft" else None,
+            reused_intermediate=reused_intermediate
         )
-        
+    finally:
+        if prepared_audio and os.path.exists(prepared_audio):
+            os.remove(prepared_audio)
+
+def run_batch(requests: List[AssemblyRequest], cache_keys: List[Optional[str]]) -> BatchAssemblyResponse:
+    """
+    Render assembly variants over shared inputs
+    
+    Variants not in the output cache that concat the clips in the same order
+    are rendered together by one FFmpeg process. Drafts (kept upgradeable),
+    variants whose order no other variant shares, and all variants after a
+    failed shared render go through run_assembly.
+    """
+    print(f"🎬 Assembling {len(requests)} variants...")
+    
+    results = [lookup_cached_output(key) if key else None for key in cache_keys]
+    cached = [result is not None for result in results]
+    orders: Dict[tuple, List[int]] = {}
+    for i, request in enumerate(requests):
+        if not cached[i] and (request.profile or RENDER_PROFILE) != "draft":
+            orders.setdefault(tuple(request.video_clips), []).append(i)
+    groups = [group for group in orders.values() if len(group) > 1]
+    
+    shared_decode = 0
+    if groups:
+        # Variants share the audio, so it is normalized and mixed once for all of them
+        prepared_audio = prepare_audio(requests[groups[0][0]], str(uuid.uuid4()))
+        try:
+            for shared in groups:
+                print(f"   Shared decode: {len(shared)} variants in one FFmpeg process...")
+                outputs = [os.path.join(OUTPUT_DIR, f"final_{uuid.uuid4()}.mp4") for _ in shared]
+                shared_requests = [
+                    requests[i].model_copy(update={"audio_path": prepared_audio}) if prepared_audio else requests[i]
+                    for i in shared
+                ]
+                if assemble_batch_shared(shared_requests, outputs):
+                    job = current_job()
+                    for i, output_path in zip(shared, outputs):
+                        register_artifact(output_path, job["job_id"] if job else None)
+                        results[i] = AssemblyResponse(
+                            final_video=output_path,
+                            duration=get_video_duration(output_path),
+                            file_size=os.path.getsize(output_path),
+                            mode="batch",
+                            profile=requests[i].profile or RENDER_PROFILE
+                        )
+                    shared_decode += len(shared)
+                else:
+                    check_cancelled()
+                    print("   Warning: Shared batch render failed, rendering variants separately")
+                    for output_path in outputs:
+                        if os.path.exists(output_path):
+                            os.remove(output_path)
+        finally:
+            if prepared_audio and os.path.exists(prepared_audio):
+                os.remove(prepared_audio)
+    
+    for i, request in enumerate(requests):
+        if results[i] is None:
+            results[i] = run_assembly(request, request.mode or ASSEMBLY_MODE)
+        if not cached[i] and cache_keys[i]:
+            store_cached_output(cache_keys[i], results[i])
+    
+    print(f"✅ Batch assembled: {len(requests)} variants, {sum(cached)} cached")
+    
+    return BatchAssemblyResponse(
+        results=results,
+        shared_decode=shared_decode
+    )
+
+# ==============================================
+# Job Queue
+# ==============================================
+
+# Assembly is CPU-bound inside FFmpeg, so run at most one job per core
+# and reject new work once the backlog is full
+worker_pool = ThreadPoolExecutor(max_workers=ASSEMBLY_WORKERS, thread_name_prefix="assembly")
+jobs: Dict[str, Dict] = {}
+jobs_lock = threading.Lock()
+
+# Shared by all jobs so parallel segment encodes never exceed SEGMENT_WORKERS
+segment_pool = ThreadPoolExecutor(max_workers=SEGMENT_WORKERS, thread_name_prefix="segment")
+
+# Drafts whose concat + audio intermediate can be reused by a final render
+drafts: "OrderedDict[str, Dict]" = OrderedDict()
+drafts_lock = threading.Lock()
+
+FINISHED_STATES = ("completed", "failed", "cancelled")
+
+# Request fields baked into a draft's intermediate; a final render must match them
+DRAFT_INPUT_FIELDS = ("video_clips", "audio_path", "normalize_audio", "background_music", "background_music_volume")
+
+def store_draft(draft_id: str, request: AssemblyRequest, intermediate: str):
+    """Remember a draft, dropping the oldest beyond JOB_HISTORY_LIMIT"""
+    with drafts_lock:
+        drafts[draft_id] = {"request": request.model_dump(), "intermediate": intermediate}
+        expired = []
+        while len(drafts) > JOB_HISTORY_LIMIT:
+            expired.append(drafts.popitem(last=False)[1]["intermediate"])
+    
+    for path in expired:
+        forget_artifact(path)
+        if os.path.exists(path):
+            os.remove(path)
+
+def get_draft(draft_id: str) -> Optional[Dict]:
+    """Look up a draft by id"""
+    with drafts_lock:
+        return drafts.get(draft_id)
+
+def prune_finished_jobs():
+    """Forget the oldest finished jobs beyond JOB_HISTORY_LIMIT"""
+    with jobs_lock:
+        finished = [job for job in jobs.values() if job["status"] in FINISHED_STATES]
+        finished.sort(key=lambda job: job["finished_at"])
+        for job in finished[:max(0, len(finished) - JOB_HISTORY_LIMIT)]:
+            del jobs[job["job_id"]]
+
+def assemble_and_cache(request: AssemblyRequest, mode: str, cache_key: Optional[str]) -> AssemblyResponse:
+    """Assemble one video and remember it in the output cache"""
+    result = run_assembly(request, mode)
+    if cache_key:
+        store_cached_output(cache_key, result)
+    return result
+
+def execute_job(job_id: str, task: Callable):
+    """Run a job's task on a worker thread and record its outcome"""
+    with jobs_lock:
+        job = jobs[job_id]
+        job["status"] = "running"
+        job["started_at"] = time.time()
+    job_context.job = job
+    
+    try:
+        check_cancelled()
+        result = task()
+        with jobs_lock:
+            job.update(status="completed", result=result, finished_at=time.time())
+        return result
+    except Exception as e:
+        with jobs_lock:
+            cancelled = job["cancel_requested"]
+            job.update(status="cancelled" if cancelled else "failed",
+                       error="Cancelled" if cancelled else str(e), finished_at=time.time())
+        if cancelled and not isinstance(e, JobCancelled):
+            raise JobCancelled(f"Job {job_id} was cancelled") from e
+        raise
+    finally:
+        job_context.job = None
+        unpin_artifacts(job_id)
+        prune_finished_jobs()
+
+def new_job() -> Dict:
+    """Create the bookkeeping record for a job"""
+    return {
+        "job_id": str(uuid.uuid4()),
+        "status": "queued",
+        "created_at": time.time(),
+        "started_at": None,
+        "finished_at": None,
+        "result": None,
+        "error": None,
+        "progress": None,
+        "cancel_requested": False,
+        "processes": set(),
+        "future": None
+    }
+
+def complete_cached_job(job: Dict, result) -> Dict:
+    """Record a job whose result came from the output cache without touching the queue"""
+    job.update(status="completed", started_at=job["created_at"], finished_at=time.time(), result=result)
+    job["future"] = Future()
+    job["future"].set_result(result)
+    with jobs_lock:
+        jobs[job["job_id"]] = job
+    return job
+
+def enqueue_job(job: Dict, inputs: List[str], task: Callable) -> Dict:
+    """Queue a job on the worker pool, or raise 429 when the backlog is full"""
+    with jobs_lock:
+        queued = sum(1 for j in jobs.values() if j["status"] == "queued")
+        if queued >= MAX_QUEUED_JOBS:
+            raise HTTPException(
+                status_code=429,
+                detail=f"Assembly queue is full ({queued} jobs waiting), retry later",
+                headers={"Retry-After": "30"}
+            )
+        # Pinned from submission, so eviction can't take the inputs while the job waits its turn
+        pin_artifacts(inputs, job["job_id"])
+        # Submitted under the lock so cancel_job never sees a queued job without its future
+        jobs[job["job_id"]] = job
+        job["future"] = worker_pool.submit(execute_job, job["job_id"], task)
+    return job
+
+def submit_job(request: AssemblyRequest) -> Dict:
+    """Validate a request and queue it on the worker pool"""
+    mode = validate_request(request)
+    cache_key = assembly_cache_key(request)
+    cached = lookup_cached_output(cache_key) if cache_key else None
+    
+    # Identical request already rendered: finish without touching the queue
+    if cached:
+        print(f"♻️  Reusing cached video {cached.final_video}")
+        return complete_cached_job(new_job(), cached)
+    
+    inputs = request.video_clips + [request.audio_path]
+    draft = get_draft(request.draft_id) if request.draft_id else None
+    if draft:
+        inputs.append(draft["intermediate"])
+    return enqueue_job(new_job(), inputs, lambda: assemble_and_cache(request, mode, cache_key))
+
+def submit_batch(batch: BatchAssemblyRequest) -> Dict:
+    """Validate a batch and queue it on the worker pool as a single job"""
+    requests = validate_batch(batch)
+    cache_keys = [assembly_cache_key(request) for request in requests]
+    return enqueue_job(new_job(), batch.video_clips + [batch.audio_path],
+                       lambda: run_batch(requests, cache_keys))
+
+def get_job(job_id: str) -> Dict:
+    """Look up a job or raise 404"""
+    with jobs_lock:
+        job = jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+def job_status(job: Dict) -> JobStatus:
+    """Build the public status view of a job"""
+    with jobs_lock:
+        return JobStatus(
+            job_id=job["job_id"],
+            status=job["status"],
+            created_at=job["created_at"],
+            started_at=job["started_at"],
+            finished_at=job["finished_at"],
+            error=job["error"],
+            progress=job["progress"]
+        )
+
+def cancel_job(job: Dict):
+    """Cancel a queued job, or kill the FFmpeg process group of a running one"""
+    with jobs_lock:
+        if job["status"] in FINISHED_STATES:
+            raise HTTPException(status_code=409, detail=f"Job is already {job['status']}")
+        job["cancel_requested"] = True
+        processes = list(job["processes"])
+        dequeued = job["status"] == "queued" and job["future"].cancel()
+        if dequeued:
+            job["status"] = "cancelled"
+            job["error"] = "Cancelled"
+            job["finished_at"] = time.time()
+    
+    if dequeued:
+        # execute_job never runs for it, so release the inputs pinned at submission
+        unpin_artifacts(job["job_id"])
+    for process in processes:
+        kill_process_group(process)
+
+# ==============================================
+# Range Downloads
+# ==============================================
+
+def parse_range_header(header: str, size: int) -> Optional[tuple]:
+    """
+    Parse a single-range "bytes=start-end" header into an inclusive range
+    
+    Returns None when the header should be ignored (malformed or
+    multi-range) and raises 416 when the range can't be satisfied.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+    
+    start, _, end = spec.strip().partition("-")
+    try:
+        if not start:
+            # Suffix range: the last N bytes
+            length = int(end)
+            if length <= 0:
+                raise ValueError
+            first, last = max(0, size - length), size - 1
+        else:
+            first = int(start)
+            last = min(int(end), size - 1) if end else size - 1
+    except ValueError:
+        return None
+    
+    if first >= size or first > last:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    return first, last
+
+def iter_file_range(path: str, first: int, last: int, chunk_size: int = 64 * 1024):
+    """Yield bytes first..last (inclusive) of a file"""
+    with open(path, 'rb') as f:
+        f.seek(first)
+        remaining = last - first + 1
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+def file_range_response(request: Request, path: str, media_type: str, filename: str):
+    """Serve a file with ETag, If-None-Match, If-Range and single Range support"""
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = f'"{hash_file(path)}"'
+    last_modified = formatdate(stat.st_mtime, usegmt=True)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Last-Modified": last_modified,
+        "Content-Disposition": f'attachment; filename="{filename}"'
+    }
+    
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    
+    byte_range = None
+    range_header = request.headers.get("range")
+    if range_header:
+        # If-Range: only resume when the client still has the same version
+        if_range = request.headers.get("if-range")
+        if if_range is None or if_range in (etag, last_modified):
+            byte_range = parse_range_header(range_header, size)
+    
+    if byte_range is None:
+        first, last, status_code = 0, size - 1, 200
+    else:
+        first, last = byte_range
+        status_code = 206
+        headers["Content-Range"] = f"bytes {first}-{last}/{size}"
+    headers["Content-Length"] = str(last - first + 1)
+    
+    if request.method == "HEAD" or size == 0:
+        return Response(status_code=status_code, headers=headers, media_type=media_type)
+    
+    return StreamingResponse(
+        iter_file_range(path, first, last),
+        status_code=status_code,
+        headers=headers,
+        media_type=media_type
+    )
+
+# ==============================================
+# API Endpoints
+# ==============================================
+
+@app.on_event("startup")
+def probe_ffmpeg_on_startup():
+    """Probe FFmpeg once so requests and health checks never fork for it"""
+    capabilities = get_ffmpeg_capabilities()
+    print(f"   FFmpeg {capabilities['version']}: {len(capabilities['encoders'])} encoders, "
+          f"{len(capabilities['filters'])} filters")
+
+@app.on_event("startup")
+def start_janitor():
+    """Index existing outputs and start the background retention manager"""
+    scan_artifacts()
+    # Runs before the server accepts requests, so every temp file is left over from a previous process
+    try:
+        run_janitor(orphan_age=0)
+    except Exception as e:
+        print(f"Janitor error: {e}")
+    threading.Thread(target=janitor_loop, name="janitor", daemon=True).start()
+
+@app.get("/")
+def read_root():
+    ffmpeg_installed = check_ffmpeg()
+    return {
+        "service": "Video Assembly Service",
+        "status": "running",
+        "cost": "FREE",
+        "backend": "FFmpeg",
+        "ffmpeg_installed": ffmpeg_installed
+    }
+
+@app.get("/health")
+def health_check():
+    """Health check endpoint"""
+    ffmpeg_status = "installed" if check_ffmpeg() else "not_found"
+    return {
+        "status": "healthy" if ffmpeg_status == "installed" else "ffmpeg_missing",
+        "ffmpeg": ffmpeg_status,
+        "ffmpeg_version": get_ffmpeg_capabilities()["version"],
+        "output_dir": OUTPUT_DIR
+    }
+
+@app.get("/capabilities")
+def capabilities():
+    """FFmpeg version, encoders and filters detected at startup"""
+    return get_ffmpeg_capabilities()
+
+@app.get("/stats")
+def stats():
+    """Cache statistics"""
+    return {
+        "probe_cache": get_probe_cache_stats(),
+        "output_cache": get_output_cache_stats(),
+        "retention": get_retention_stats(),
+        "uploads": dict(upload_stats),
+        "audio": get_audio_cache_stats(),
+        "drafts": len(drafts)
+    }
+
+@app.post("/uploads")
+async def upload_files(request: Request):
+    """
+    Upload clips and audio as multipart/form-data
+    
+    Returns the TEMP_DIR path of each file, to be used in video_clips and
+    audio_path. Identical uploads are stored once.
+    """
+    uploads = await stream_multipart_upload(request)
+    print(f"📤 Received {len(uploads)} uploads ({sum(u['size'] for u in uploads)/1024/1024:.2f}MB)")
+    return {"uploads": uploads}
+
+@app.post("/assemble-video", response_model=AssemblyResponse)
+def assemble_video(request: AssemblyRequest):
+    """
+    Assemble final video and wait for the result
+    
+    Runs on the same bounded worker pool as /jobs, so overlapping
+    callers queue instead of oversubscribing the CPU.
+    """
+    try:
+        job = submit_job(request)
+        return job["future"].result()
+    except HTTPException:
+        raise
+    except (CancelledError, JobCancelled):
+        raise HTTPException(status_code=409, detail="Assembly was cancelled")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/assemble-batch", response_model=BatchAssemblyResponse)
+def assemble_batch(batch: BatchAssemblyRequest):
+    """
+    Assemble several variants of one story and wait for all results
+    
+    Variants share the batch's clips and audio; each input is decoded
+    once and fanned out to every variant inside one FFmpeg process.
+    """
+    try:
+        job = submit_batch(batch)
+        return job["future"].result()
     except HTTPException:
         raise
+    except (CancelledError, JobCancelled):
+        raise HTTPException(status_code=409, detail="Assembly was cancelled")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/download/{video_id}")
-def download_video(video_id: str):
-    """Download assembled video"""
+@app.post("/drafts/{draft_id}/finalize", response_model=AssemblyResponse)
+def finalize_draft(draft_id: str):
+    """Render a draft with the final profile, reusing its concatenated intermediate"""
+    draft = get_draft(draft_id)
+    if not draft:
+        raise HTTPException(status_code=404, detail="Draft not found")
+    
+    request = AssemblyRequest(**{**draft["request"], "profile": "final", "draft_id": draft_id})
+    return assemble_video(request)
+
+@app.post("/jobs", response_model=JobStatus, status_code=202)
+def create_job(request: AssemblyRequest):
+    """Queue an assembly job and return its id immediately"""
+    job = submit_job(request)
+    print(f"📥 Queued assembly job {job['job_id']}")
+    return job_status(job)
+
+@app.get("/jobs")
+def list_jobs():
+    """Queue overview"""
+    with jobs_lock:
+        statuses = [job["status"] for job in jobs.values()]
+    return {
+        "workers": ASSEMBLY_WORKERS,
+        "max_queued": MAX_QUEUED_JOBS,
+        "queued": statuses.count("queued"),
+        "running": statuses.count("running"),
+        "completed": statuses.count("completed"),
+        "failed": statuses.count("failed"),
+        "cancelled": statuses.count("cancelled")
+    }
+
+@app.get("/jobs/{job_id}", response_model=JobStatus)
+def get_job_status(job_id: str):
+    """Get the status of an assembly job"""
+    return job_status(get_job(job_id))
+
+@app.get("/jobs/{job_id}/result", response_model=Union[AssemblyResponse, BatchAssemblyResponse])
+def get_job_result(job_id: str):
+    """Get the result of a finished assembly job"""
+    job = get_job(job_id)
+    
+    if job["status"] == "failed":
+        raise HTTPException(status_code=500, detail=job["error"])
+    
+    if job["status"] != "completed":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    
+    return job["result"]
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """Stream job status and FFmpeg progress as Server-Sent Events"""
+    job = get_job(job_id)
+    
+    async def events():
+        last = None
+        while True:
+            status = job_status(job)
+            payload = json.dumps(status.model_dump())
+            if payload != last:
+                yield f"data: {payload}\n\n"
+                last = payload
+            if status.status in FINISHED_STATES:
+                break
+            await asyncio.sleep(PROGRESS_INTERVAL)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"}
+    )
+
+@app.post("/jobs/{job_id}/cancel", response_model=JobStatus)
+def cancel_job_endpoint(job_id: str):
+    """Cancel an assembly job and reclaim its CPU"""
+    job = get_job(job_id)
+    cancel_job(job)
+    print(f"🛑 Cancelled assembly job {job_id}")
+    return job_status(job)
+
+@app.api_route("/download/{video_id}", methods=["GET", "HEAD"])
+def download_video(video_id: str, request: Request):
+    """Download assembled video (supports Range requests for seeking and resuming)"""
     filepath = os.path.join(OUTPUT_DIR, f"final_{video_id}.mp4")
     
     if not os.path.exists(filepath):
         raise HTTPException(status_code=404, detail="Video not found")
     
-    return FileResponse(
-        filepath,
-        media_type="video/mp4",
-        filename=f"tiktok_{video_id}.mp4"
-    )
+    touch_artifact(filepath)
+    return file_range_response(request, filepath, "video/mp4", f"tiktok_{video_id}.mp4")
 
 @app.delete("/cleanup")
 def cleanup_old_files():
-    """Clean up old files"""
+    """Run the retention janitor now instead of waiting for its next pass"""
     try:
-        import time
-        deleted = 0
-        current_time = time.time()
-        
-        for directory in [OUTPUT_DIR, TEMP_DIR]:
-            for filename in os.listdir(directory):
-                filepath = os.path.join(directory, filename)
-                # Delete files older than 1 hour
-                if os.path.getmtime(filepath) < current_time - 3600:
-                    os.remove(filepath)
-                    deleted += 1
-        
-        return {"deleted_files": deleted}
+        report = run_janitor()
+        return {"deleted_files": report["orphans_removed"] + report["evicted_files"], **report}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
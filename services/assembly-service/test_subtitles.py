@@ -0,0 +1,58 @@
+"""
+Subtitle timing at segment seams (split_cues_at_boundaries)
+
+Run with: python -m pytest test_subtitles.py
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+os.environ.setdefault("OUTPUT_DIR", tempfile.mkdtemp(prefix="assembly_test_output_"))
+os.environ.setdefault("TEMP_DIR", tempfile.mkdtemp(prefix="assembly_test_temp_"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from main import build_subtitle_cues, split_cues_at_boundaries
+
+def test_cue_crossing_a_seam_is_shown_on_both_sides():
+    segments = split_cues_at_boundaries([(0.0, 3.0, "first"), (3.0, 7.0, "second")], [5.0, 5.0])
+
+    assert segments[0] == [(0.0, 3.0, "first"), (3.0, 5.0, "second")]
+    assert segments[1] == [(0.0, 2.0, "second")]
+
+def test_cue_ending_exactly_on_a_seam_stays_in_its_segment():
+    segments = split_cues_at_boundaries([(0.0, 5.0, "first"), (5.0, 10.0, "second")], [5.0, 5.0])
+
+    assert segments == [[(0.0, 5.0, "first")], [(0.0, 5.0, "second")]]
+
+def test_timeline_cut_short_by_audio():
+    # Clips run 12s but the audio only 7s, so cues cover 7s (-shortest)
+    cues = build_subtitle_cues(" ".join(f"w{i}" for i in range(20)), 7.0)
+    segments = split_cues_at_boundaries(cues, [4.0, 4.0, 4.0])
+
+    assert segments[0] == [(0.0, 3.5, cues[0][2]), (3.5, 4.0, cues[1][2])]
+    assert segments[1] == [(0.0, pytest.approx(3.0), cues[1][2])]
+    assert segments[2] == []
+
+def test_segments_without_cues():
+    assert split_cues_at_boundaries([], [2.0, 3.0]) == [[], []]
+    assert split_cues_at_boundaries([(0.0, 1.0, "only")], [1.0, 2.0]) == [[(0.0, 1.0, "only")], []]
+
+def test_segment_cues_line_up_with_the_timeline():
+    cues = build_subtitle_cues(" ".join(f"w{i}" for i in range(45)), 9.0)
+    durations = [2.5, 3.0, 3.5]
+    offsets = [0.0, 2.5, 5.5]
+
+    # Shifting each segment's cues back by its offset gives the original cues, split at the seams
+    rebuilt = sorted((start + offset, end + offset, text)
+                     for segment, offset in zip(split_cues_at_boundaries(cues, durations), offsets)
+                     for start, end, text in segment)
+    for text in {cue[2] for cue in cues}:
+        pieces = [(start, end) for start, end, t in rebuilt if t == text]
+        original = next((start, end) for start, end, t in cues if t == text)
+        assert pieces[0][0] == pytest.approx(original[0])
+        assert pieces[-1][1] == pytest.approx(original[1])
+        for (_, end), (start, _) in zip(pieces, pieces[1:]):
+            assert end == pytest.approx(start)
@@ -0,0 +1,117 @@
+"""
+Quality Mode Benchmark - GPU seconds saved versus CPU seconds added per quality mode
+Runs /generate-video once per quality mode (full, balanced, fast) and reports
+the ComfyUI execution time (from the event stream) next to the encode
+workers' CPU time, which includes the FFmpeg interpolation and upscale.
+
+By default it starts a fake ComfyUI whose simulated GPU time scales with
+pixel count (--frame-seconds per 1080x1920 frame); pass --comfyui-urls to
+measure real backends instead.
+
+Usage:
+    python benchmark.py --modes full,balanced,fast --clips 2 --clip-duration 2 --output bench.json
+    python benchmark.py --comfyui-urls http://gpu-1:8188 --clips 5 --output bench.json
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from pool_harness import start_backend
+
+def run_mode(main, args, quality: str) -> dict:
+    """Generate one request in a quality mode and measure it"""
+    start = time.perf_counter()
+    result = main.generate_video(main.VideoRequest(
+        visual_prompt="Snowy small town, dark atmosphere, mysterious lights, cinematic",
+        num_clips=args.clips,
+        clip_duration=args.clip_duration,
+        fps=args.fps,
+        quality=quality
+    ))
+    wall = time.perf_counter() - start
+
+    return {
+        "quality": quality,
+        "ok": len(result.clips) == args.clips,
+        "generated_size": result.generated_size,
+        "frames_generated": sum(timing.frames for timing in result.sub_batches),
+        "wall_seconds": round(wall, 3),
+        "gpu_seconds": result.gpu_seconds,
+        "cpu_seconds": result.cpu_seconds,
+        "output_bytes": sum(os.path.getsize(clip) for clip in result.clips if os.path.exists(clip))
+    }
+
+def main_benchmark():
+    parser = argparse.ArgumentParser(description="Benchmark GPU seconds saved against CPU seconds added per quality mode")
+    parser.add_argument("--modes", default="full,balanced,fast")
+    parser.add_argument("--clips", type=int, default=2)
+    parser.add_argument("--clip-duration", type=int, default=2)
+    parser.add_argument("--fps", type=int, default=24)
+    parser.add_argument("--frame-seconds", type=float, default=0.25, help="Fake GPU time per 1080x1920 frame")
+    parser.add_argument("--comfyui-urls", help="Benchmark these ComfyUI servers instead of a fake one")
+    parser.add_argument("--port", type=int, default=18288)
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    args = parser.parse_args()
+    modes = args.modes.split(",")
+
+    root = tempfile.mkdtemp(prefix="video_bench_")
+    backend = None
+    try:
+        if args.comfyui_urls:
+            os.environ["COMFYUI_URLS"] = args.comfyui_urls
+        else:
+            backend = start_backend(args.port, args.frame_seconds, os.path.join(root, "comfyui"))
+            os.environ["COMFYUI_URLS"] = f"http://127.0.0.1:{args.port}"
+        os.environ["OUTPUT_DIR"] = os.path.join(root, "output")
+        os.environ["ENCODE_CLIPS"] = "true"
+        os.environ["DETERMINISTIC_SEEDS"] = "false"
+
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        import main
+
+        main.start_event_listener()
+        deadline = time.time() + 10
+        while not all(b["ws_connected"].is_set() for b in main.backends.values()) and time.time() < deadline:
+            time.sleep(0.05)
+
+        results = []
+        for i, quality in enumerate(modes):
+            print(f"   [{i + 1}/{len(modes)}] {quality}", file=sys.stderr)
+            results.append(run_mode(main, args, quality))
+
+        # Savings are relative to generating every frame at full size
+        full = next((r for r in results if r["quality"] == "full"), None)
+        for result in results:
+            if full and full["gpu_seconds"] is not None and result["gpu_seconds"] is not None:
+                result["gpu_seconds_saved"] = round(full["gpu_seconds"] - result["gpu_seconds"], 2)
+                result["cpu_seconds_added"] = round(result["cpu_seconds"] - full["cpu_seconds"], 2)
+
+        report = {
+            "backends": main.COMFYUI_URLS if args.comfyui_urls else "fake",
+            "cpu_count": os.cpu_count(),
+            "encode_workers": main.ENCODE_WORKERS,
+            "interpolation": main.INTERPOLATION_MODE,
+            "clips": args.clips,
+            "clip_duration": args.clip_duration,
+            "fps": args.fps,
+            "results": results
+        }
+        output = json.dumps(report, indent=2)
+        if args.output:
+            with open(args.output, 'w') as f:
+                f.write(output)
+            print(f"✅ Wrote {len(results)} results to {args.output}", file=sys.stderr)
+        else:
+            print(output)
+    finally:
+        if backend:
+            backend.kill()
+        shutil.rmtree(root, ignore_errors=True)
+
+if __name__ == "__main__":
+    main_benchmark()
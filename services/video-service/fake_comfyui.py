@@ -0,0 +1,291 @@
+"""
+Fake ComfyUI - local stand-in for testing the video service offline
+Implements the parts of ComfyUI's API the video service uses: /prompt,
+/history, /queue (including deletes), /interrupt, /system_stats, /view and
+the /ws event stream
+
+Prompts run one at a time like on a real GPU. Each one sleeps
+--frame-seconds per frame of its EmptyLatentImage batch (or of the
+LatentFromBatch slice), scaled by the frame's pixel count relative to
+1080x1920, then writes synthetic PNG frames with the SaveImage filename
+prefix.
+
+Latency and failures can be injected:
+    --latency        seconds added to every HTTP response
+    --jitter         GPU time varies by up to this fraction either way
+    --fail-rate      fraction of prompts ending in execution_error
+    --reject-rate    fraction of /prompt calls answered with HTTP 500
+    --view-fail-rate fraction of /view calls answered with HTTP 500
+    --ws-drop-rate   chance of dropping a websocket after each event
+
+Usage:
+    python fake_comfyui.py --port 8188
+    python fake_comfyui.py --port 8188 --latency 0.02 --fail-rate 0.1 --seed 1
+    COMFYUI_URL=http://localhost:8188 python main.py
+"""
+
+import argparse
+import asyncio
+import os
+import queue
+import random
+import tempfile
+import threading
+import uuid
+from typing import Dict, List, Optional
+
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import FileResponse
+from PIL import Image
+
+def create_app(output_dir: str, frame_seconds: float = 0.01, latency: float = 0.0, jitter: float = 0.0,
+               fail_rate: float = 0.0, reject_rate: float = 0.0, view_fail_rate: float = 0.0,
+               ws_drop_rate: float = 0.0, seed: Optional[int] = None) -> FastAPI:
+    """Build a fake ComfyUI app writing frames to output_dir"""
+    app = FastAPI(title="Fake ComfyUI")
+    os.makedirs(output_dir, exist_ok=True)
+    rng = random.Random(seed)
+
+    state = {"loop": None, "number": 0, "running": None}
+    interrupted = threading.Event()
+    pending: "queue.Queue[Dict]" = queue.Queue()
+    queued: List[Dict] = []
+    history: Dict[str, Dict] = {}
+    sockets: Dict[str, List[asyncio.Queue]] = {}
+    lock = threading.Lock()
+
+    def send(message: Dict, client_id: Optional[str] = None):
+        """Queue an event for one client's sockets, or all of them"""
+        loop = state["loop"]
+        if loop is None:
+            return
+        with lock:
+            targets = sockets.get(client_id, []) if client_id else [q for qs in sockets.values() for q in qs]
+        for target in targets:
+            loop.call_soon_threadsafe(target.put_nowait, message)
+
+    def queue_status() -> Dict:
+        with lock:
+            remaining = len(queued) + (1 if state["running"] else 0)
+        return {"type": "status", "data": {"status": {"exec_info": {"queue_remaining": remaining}}}}
+
+    def render_frames(item: Dict) -> List[Dict]:
+        """Write synthetic PNG frames for every SaveImage node"""
+        prompt = item["prompt"]
+        latent = next((node["inputs"] for node in prompt.values() if node.get("class_type") == "EmptyLatentImage"),
+                      {"width": 512, "height": 512, "batch_size": 1})
+        width, height, frames = int(latent["width"]), int(latent["height"]), int(latent["batch_size"])
+        total, first = frames, 0
+        # LatentFromBatch samples a slice of the batch
+        for node in prompt.values():
+            if node.get("class_type") == "LatentFromBatch":
+                first = min(int(node["inputs"]["batch_index"]), total - 1)
+                frames = min(int(node["inputs"]["length"]), total - first)
+        # GPU time grows with pixel count; frame_seconds is for a 1080x1920 frame
+        gpu_seconds = frame_seconds * frames * width * height / (1080 * 1920)
+        if jitter:
+            gpu_seconds *= 1 + rng.uniform(-jitter, jitter)
+        if interrupted.wait(gpu_seconds):
+            raise InterruptedError("Interrupted")
+        if rng.random() < fail_rate:
+            raise RuntimeError("Injected failure")
+
+        outputs = {}
+        for node_id, node in prompt.items():
+            if node.get("class_type") != "SaveImage":
+                continue
+            prefix = node["inputs"].get("filename_prefix", "ComfyUI")
+            images = []
+            for i in range(frames):
+                filename = f"{prefix}_{i + 1:05d}_.png"
+                shade = int(255 * (first + i) / max(total - 1, 1))
+                Image.new("RGB", (width, height), (shade, 64, 255 - shade)).save(
+                    os.path.join(output_dir, filename), compress_level=1
+                )
+                images.append({"filename": filename, "subfolder": "", "type": "output"})
+            outputs[node_id] = {"images": images}
+        return outputs
+
+    def worker():
+        """Execute queued prompts one at a time, emitting ComfyUI's events"""
+        while True:
+            item = pending.get()
+            prompt_id, client_id = item["prompt_id"], item["client_id"]
+            with lock:
+                if item not in queued:
+                    continue  # Deleted while pending
+                queued.remove(item)
+                state["running"] = item
+                interrupted.clear()
+            send(queue_status())
+            send({"type": "execution_start", "data": {"prompt_id": prompt_id}}, client_id)
+
+            status = "success"
+            outputs = {}
+            try:
+                for node_id in item["prompt"]:
+                    send({"type": "executing", "data": {"node": node_id, "prompt_id": prompt_id}}, client_id)
+                outputs = render_frames(item)
+                for node_id, output in outputs.items():
+                    send({"type": "executed", "data": {"node": node_id, "output": output, "prompt_id": prompt_id}},
+                         client_id)
+            except InterruptedError:
+                status = "error"
+                send({"type": "execution_interrupted", "data": {"prompt_id": prompt_id}}, client_id)
+            except Exception as e:
+                status = "error"
+                send({"type": "execution_error", "data": {"prompt_id": prompt_id, "exception_message": str(e)}},
+                     client_id)
+
+            with lock:
+                history[prompt_id] = {
+                    "prompt": [item["number"], prompt_id, item["prompt"], {"client_id": client_id}, list(outputs)],
+                    "outputs": outputs,
+                    "status": {"status_str": status, "completed": status == "success", "messages": []}
+                }
+                state["running"] = None
+            if status == "success":
+                send({"type": "executing", "data": {"node": None, "prompt_id": prompt_id}}, client_id)
+                send({"type": "execution_success", "data": {"prompt_id": prompt_id}}, client_id)
+            send(queue_status())
+
+    @app.middleware("http")
+    async def add_latency(request: Request, call_next):
+        if latency:
+            await asyncio.sleep(latency)
+        return await call_next(request)
+
+    @app.on_event("startup")
+    async def start_worker():
+        state["loop"] = asyncio.get_running_loop()
+        threading.Thread(target=worker, daemon=True).start()
+
+    @app.post("/prompt")
+    def post_prompt(body: Dict):
+        if not isinstance(body.get("prompt"), dict):
+            raise HTTPException(status_code=400, detail="No prompt provided")
+        if rng.random() < reject_rate:
+            raise HTTPException(status_code=500, detail="Injected rejection")
+        with lock:
+            state["number"] += 1
+            item = {
+                "prompt_id": str(uuid.uuid4()),
+                "number": state["number"],
+                "prompt": body["prompt"],
+                "client_id": body.get("client_id")
+            }
+            queued.append(item)
+        pending.put(item)
+        send(queue_status())
+        return {"prompt_id": item["prompt_id"], "number": item["number"], "node_errors": {}}
+
+    @app.get("/history")
+    def get_all_history():
+        with lock:
+            return dict(history)
+
+    @app.get("/history/{prompt_id}")
+    def get_history(prompt_id: str):
+        with lock:
+            return {prompt_id: history[prompt_id]} if prompt_id in history else {}
+
+    @app.get("/queue")
+    def get_queue():
+        def entry(item):
+            return [item["number"], item["prompt_id"], item["prompt"], {"client_id": item["client_id"]}, []]
+        with lock:
+            return {
+                "queue_running": [entry(state["running"])] if state["running"] else [],
+                "queue_pending": [entry(item) for item in queued]
+            }
+
+    @app.post("/queue")
+    def edit_queue(body: Dict):
+        with lock:
+            if body.get("clear"):
+                queued.clear()
+            for prompt_id in body.get("delete", []):
+                queued[:] = [item for item in queued if item["prompt_id"] != prompt_id]
+        send(queue_status())
+        return {}
+
+    @app.post("/interrupt")
+    def interrupt(body: Optional[Dict] = None):
+        with lock:
+            running = state["running"]
+        # Like ComfyUI, a prompt_id only interrupts if that prompt is the one running
+        if running and (not body or body.get("prompt_id") in (None, running["prompt_id"])):
+            interrupted.set()
+        return {}
+
+    @app.get("/system_stats")
+    def system_stats():
+        return {
+            "system": {"os": "fake", "python_version": "fake", "embedded_python": False},
+            "devices": [{
+                "name": "fake:0 Fake GPU",
+                "type": "cuda",
+                "index": 0,
+                "vram_total": 24 * 1024**3,
+                "vram_free": 20 * 1024**3,
+                "torch_vram_total": 24 * 1024**3,
+                "torch_vram_free": 20 * 1024**3
+            }]
+        }
+
+    @app.get("/view")
+    def view(filename: str, subfolder: str = "", type: str = "output"):
+        path = os.path.join(output_dir, subfolder, os.path.basename(filename))
+        if rng.random() < view_fail_rate:
+            raise HTTPException(status_code=500, detail="Injected view failure")
+        if not os.path.isfile(path):
+            raise HTTPException(status_code=404, detail="Image not found")
+        return FileResponse(path, media_type="image/png")
+
+    @app.websocket("/ws")
+    async def events(ws: WebSocket, clientId: Optional[str] = None):
+        await ws.accept()
+        client_id = clientId or uuid.uuid4().hex
+        outbox: asyncio.Queue = asyncio.Queue()
+        with lock:
+            sockets.setdefault(client_id, []).append(outbox)
+        try:
+            status = queue_status()
+            status["data"]["sid"] = client_id
+            await ws.send_json(status)
+            while True:
+                await ws.send_json(await outbox.get())
+                if rng.random() < ws_drop_rate:
+                    await ws.close()
+                    break
+        except (WebSocketDisconnect, RuntimeError):
+            pass
+        finally:
+            with lock:
+                sockets[client_id].remove(outbox)
+
+    return app
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Fake ComfyUI server for offline testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8188)
+    parser.add_argument("--frame-seconds", type=float, default=0.01, help="Simulated GPU time per 1080x1920 frame")
+    parser.add_argument("--output-dir", default=os.path.join(tempfile.gettempdir(), "fake_comfyui_output"))
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every HTTP response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random GPU time variation, as a fraction")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of prompts that fail")
+    parser.add_argument("--reject-rate", type=float, default=0.0, help="Fraction of /prompt calls rejected")
+    parser.add_argument("--view-fail-rate", type=float, default=0.0, help="Fraction of /view calls that fail")
+    parser.add_argument("--ws-drop-rate", type=float, default=0.0, help="Chance of dropping a websocket per event")
+    parser.add_argument("--seed", type=int, help="Seed for jitter and failure injection")
+    args = parser.parse_args()
+
+    print(f"🧪 Fake ComfyUI on http://{args.host}:{args.port} (frames in {args.output_dir})")
+    uvicorn.run(
+        create_app(args.output_dir, args.frame_seconds, args.latency, args.jitter, args.fail_rate,
+                   args.reject_rate, args.view_fail_rate, args.ws_drop_rate, args.seed),
+        host=args.host, port=args.port, log_level="warning"
+    )
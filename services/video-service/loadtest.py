@@ -0,0 +1,201 @@
+"""
+Load Test - drives /generate-video at increasing concurrency against fake ComfyUI
+Starts --backends fake_comfyui.py servers (with optional latency and failure
+injection) and the video service under uvicorn, then sends --requests
+requests at each --concurrency level and reports p50/p95/p99 latency and the
+non-GPU overhead per clip.
+
+Overhead is reported two ways:
+    overhead_per_clip_seconds  request latency minus the GPU time of its own
+                               sub-batches, per clip (includes queueing
+                               behind other requests)
+    gpu_idle_per_clip_seconds  backend time not spent executing prompts
+                               (wall x backends - GPU seconds), per clip
+
+Usage:
+    python loadtest.py --concurrency 1,2,4,8 --requests 8 --output load.json
+    python loadtest.py --backends 2 --latency 0.02 --fail-rate 0.05 --view-fail-rate 0.02 --seed 1
+"""
+
+import argparse
+import json
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+import requests
+
+from pool_harness import start_backend
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[max(math.ceil(pct / 100 * len(ordered)) - 1, 0)], 3)
+
+def start_service(port: int, env: dict) -> subprocess.Popen:
+    """Run the video service under uvicorn and wait until every backend is online"""
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env, stdout=subprocess.DEVNULL
+    )
+    count = len(env["COMFYUI_URLS"].split(","))
+    expected = f"{count}/{count}"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            health = requests.get(f"http://127.0.0.1:{port}/health", timeout=1).json()
+            if health.get("backends_online") == expected:
+                return process
+        except Exception:
+            pass
+        time.sleep(0.2)
+    process.kill()
+    raise Exception(f"Video service on port {port} didn't start")
+
+def send_request(url: str, args, n: int) -> dict:
+    """POST one /generate-video request and time it"""
+    start = time.perf_counter()
+    try:
+        response = requests.post(f"{url}/generate-video", json={
+            "visual_prompt": f"Load test request {n}, snowy small town, cinematic",
+            "num_clips": args.clips,
+            "clip_duration": args.clip_duration,
+            "fps": args.fps,
+            "quality": args.quality
+        }, timeout=args.timeout)
+        latency = time.perf_counter() - start
+        response.raise_for_status()
+        result = response.json()
+        return {
+            "ok": True,
+            "latency": latency,
+            "clips": len(result["clips"]),
+            "failed_clips": len(result["failed_clips"]),
+            "gpu_seconds": result.get("gpu_seconds") or 0.0
+        }
+    except Exception as e:
+        return {"ok": False, "latency": time.perf_counter() - start, "error": str(e)[:200]}
+
+def run_level(url: str, args, concurrency: int) -> dict:
+    """Send args.requests requests with `concurrency` in flight"""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda n: send_request(url, args, n), range(args.requests)))
+    wall = time.perf_counter() - start
+
+    done = [r for r in results if r["ok"]]
+    latencies = [r["latency"] for r in done]
+    clips = sum(r["clips"] for r in done)
+    gpu_seconds = sum(r["gpu_seconds"] for r in done)
+    overheads = [(r["latency"] - r["gpu_seconds"]) / r["clips"] for r in done if r["clips"]]
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(results),
+        "errors": [r["error"] for r in results if not r["ok"]],
+        "clips": clips,
+        "failed_clips": sum(r["failed_clips"] for r in done),
+        "wall_seconds": round(wall, 3),
+        "clips_per_second": round(clips / wall, 3) if wall else None,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p95": percentile(latencies, 95),
+        "latency_p99": percentile(latencies, 99),
+        "gpu_seconds": round(gpu_seconds, 3),
+        "overhead_per_clip_seconds": round(sum(overheads) / len(overheads), 3) if overheads else None,
+        "gpu_idle_per_clip_seconds": round((wall * args.backends - gpu_seconds) / clips, 3) if clips else None
+    }
+
+def main_loadtest():
+    parser = argparse.ArgumentParser(description="Load test /generate-video against fake ComfyUI servers")
+    parser.add_argument("--concurrency", default="1,2,4,8", help="Concurrency levels to step through")
+    parser.add_argument("--requests", type=int, default=8, help="Requests per concurrency level")
+    parser.add_argument("--clips", type=int, default=2)
+    parser.add_argument("--clip-duration", type=int, default=1)
+    parser.add_argument("--fps", type=int, default=4)
+    parser.add_argument("--quality", default="full")
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--backends", type=int, default=1, help="Number of fake ComfyUI servers")
+    parser.add_argument("--frame-seconds", type=float, default=0.05, help="Fake GPU time per 1080x1920 frame")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--reject-rate", type=float, default=0.0)
+    parser.add_argument("--view-fail-rate", type=float, default=0.0)
+    parser.add_argument("--ws-drop-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--port", type=int, default=18388, help="Video service port; backends use the next ones")
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+    levels = [int(n) for n in args.concurrency.split(",")]
+
+    fault_args = ["--latency", str(args.latency), "--jitter", str(args.jitter),
+                  "--fail-rate", str(args.fail_rate), "--reject-rate", str(args.reject_rate),
+                  "--view-fail-rate", str(args.view_fail_rate), "--ws-drop-rate", str(args.ws_drop_rate)]
+    root = tempfile.mkdtemp(prefix="video_load_")
+    processes = []
+    try:
+        urls = []
+        for i in range(args.backends):
+            port = args.port + 1 + i
+            seed = ["--seed", str(args.seed + i)] if args.seed is not None else []
+            processes.append(start_backend(port, args.frame_seconds, os.path.join(root, f"backend_{i}"),
+                                           (*fault_args, *seed)))
+            urls.append(f"http://127.0.0.1:{port}")
+
+        env = dict(os.environ)
+        env.update({
+            "COMFYUI_URLS": ",".join(urls),
+            "OUTPUT_DIR": os.path.join(root, "output"),
+            "DETERMINISTIC_SEEDS": "false"
+        })
+        processes.append(start_service(args.port, env))
+        print(f"🧪 Video service on :{args.port}, {args.backends} fake backends", file=sys.stderr)
+
+        results = []
+        for concurrency in levels:
+            print(f"   concurrency {concurrency}: {args.requests} requests", file=sys.stderr)
+            results.append(run_level(f"http://127.0.0.1:{args.port}", args, concurrency))
+
+        report = {
+            "backends": args.backends,
+            "frame_seconds": args.frame_seconds,
+            "faults": {
+                "latency": args.latency, "jitter": args.jitter, "fail_rate": args.fail_rate,
+                "reject_rate": args.reject_rate, "view_fail_rate": args.view_fail_rate,
+                "ws_drop_rate": args.ws_drop_rate, "seed": args.seed
+            },
+            "clips_per_request": args.clips,
+            "clip_duration": args.clip_duration,
+            "fps": args.fps,
+            "quality": args.quality,
+            "results": results
+        }
+        output = json.dumps(report, indent=2)
+        if args.output:
+            with open(args.output, 'w') as f:
+                f.write(output)
+            print(f"✅ Wrote {len(results)} levels to {args.output}", file=sys.stderr)
+        else:
+            print(output)
+    finally:
+        # SIGTERM lets uvicorn shut the encode pool down instead of orphaning its workers
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        shutil.rmtree(root, ignore_errors=True)
+
+if __name__ == "__main__":
+    main_loadtest()
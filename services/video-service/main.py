@@ -4,15 +4,33 @@ Uses ComfyUI for video generation
 """
 
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Dict
+from typing import List, Dict, Optional
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED, \
+    TimeoutError as FutureTimeout
+import multiprocessing
+import asyncio
+import subprocess
+import threading
 import requests
 import os
+import io
 import json
 import time
 import uuid
+import random
+import hashlib
+import shutil
+import resource
 from pathlib import Path
 
+try:
+    import websocket  # websocket-client
+except ImportError:
+    websocket = None
+
 app = FastAPI(title="Video Service", description="FREE video generation using ComfyUI")
 
 # ==============================================
@@ -20,8 +38,66 @@ app = FastAPI(title="Video Service", description="FREE video generation using Co
 # ==============================================
 
 COMFYUI_URL = os.getenv("COMFYUI_URL", "http://localhost:8188")
+# Comma-separated ComfyUI servers to spread clips across (default: COMFYUI_URL)
+COMFYUI_URLS = [url.strip().rstrip("/") for url in os.getenv("COMFYUI_URLS", COMFYUI_URL).split(",") if url.strip()]
+# Seconds a backend's health check and queue depth are cached for
+HEALTH_CACHE_TTL = float(os.getenv("HEALTH_CACHE_TTL", "10"))
+QUEUE_DEPTH_TTL = float(os.getenv("QUEUE_DEPTH_TTL", "1"))
 OUTPUT_DIR = os.getenv("OUTPUT_DIR", "/tmp/video_output")
 
+# Encode each prompt's frame sequence into an MP4 clip for the assembly service
+ENCODE_CLIPS = os.getenv("ENCODE_CLIPS", "true").lower() == "true"
+ENCODE_WORKERS = int(os.getenv("ENCODE_WORKERS", os.cpu_count() or 1))
+# Set when ComfyUI's output folder is mounted locally; otherwise frames are read via /view
+COMFYUI_OUTPUT_DIR = os.getenv("COMFYUI_OUTPUT_DIR", "")
+# Frames are downloaded from /view into OUTPUT_DIR concurrently, in chunks
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "8"))
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE", str(256 * 1024)))
+DOWNLOAD_ATTEMPTS = int(os.getenv("DOWNLOAD_ATTEMPTS", "3"))
+
+# Completion comes from ComfyUI's /ws event stream; /history is only polled
+# (every HISTORY_POLL_INTERVAL seconds) while the stream is disconnected
+COMFYUI_WS = os.getenv("COMFYUI_WS", "true").lower() == "true"
+HISTORY_POLL_INTERVAL = float(os.getenv("HISTORY_POLL_INTERVAL", "2"))
+
+# Clips are generated in sub-batches of frames sized to fit in VRAM: the
+# budget is each backend's reported VRAM (/system_stats) minus VRAM_RESERVE_MB
+# for model weights, capped by VRAM_BUDGET_MB when set, divided by the
+# estimated cost of one frame
+VRAM_BUDGET_MB = float(os.getenv("VRAM_BUDGET_MB", "0"))
+VRAM_RESERVE_MB = float(os.getenv("VRAM_RESERVE_MB", "8192"))
+FRAME_VRAM_MB_PER_MEGAPIXEL = float(os.getenv("FRAME_VRAM_MB_PER_MEGAPIXEL", "1500"))
+
+# Quality modes trade GPU time for CPU time: frames are generated at a fraction
+# of the output size and at a lower frame rate, then interpolated (minterpolate)
+# and upscaled to the requested format by the encode workers
+QUALITY_MODES = {
+    "full": {"scale": 1.0, "fps": None},
+    "balanced": {"scale": float(os.getenv("BALANCED_SCALE", "0.75")), "fps": int(os.getenv("BALANCED_FPS", "12"))},
+    "fast": {"scale": float(os.getenv("FAST_SCALE", "0.5")), "fps": int(os.getenv("FAST_FPS", "8"))}
+}
+QUALITY_MODE = os.getenv("QUALITY_MODE", "full")
+# minterpolate mode: mci (motion compensated, slow) or blend (cheap crossfade)
+INTERPOLATION_MODE = os.getenv("INTERPOLATION_MODE", "mci")
+
+# Seconds a clip may run once ComfyUI starts executing it; while still queued
+# behind the request's other clips it may wait CLIP_TIMEOUT per clip
+CLIP_TIMEOUT = float(os.getenv("CLIP_TIMEOUT", "300"))
+GATHER_WORKERS = int(os.getenv("GATHER_WORKERS", "16"))  # Sub-batches waited on at once per request
+CLIENT_ID = str(uuid.uuid4())
+
+# Derive each clip's seed from the prompt instead of picking a random one, so
+# reruns produce the same workflow and can be served from the clip cache
+DETERMINISTIC_SEEDS = os.getenv("DETERMINISTIC_SEEDS", "false").lower() == "true"
+CLIP_CACHE_MAX_BYTES = int(os.getenv("CLIP_CACHE_MAX_BYTES", str(5 * 1024**3)))
+CLIP_CACHE_INDEX = os.path.join(OUTPUT_DIR, "clip_cache.json")
+
+# Retention: clips and frames outside the clip cache are evicted least recently
+# used once the disk quota is crossed
+DISK_QUOTA_BYTES = int(os.getenv("DISK_QUOTA_BYTES", str(10 * 1024**3)))
+JANITOR_INTERVAL = int(os.getenv("JANITOR_INTERVAL", "300"))
+TEMP_ORPHAN_AGE = int(os.getenv("TEMP_ORPHAN_AGE", "1800"))  # Untracked outputs older than this are orphans
+
 # Create output directory
 Path(OUTPUT_DIR).mkdir(parents=True, exist_ok=True)
 
@@ -35,29 +111,268 @@ class VideoRequest(BaseModel):
     clip_duration: int = 5
     aspect_ratio: List[int] = [9, 16]  # TikTok format
     fps: int = 24
+    deterministic: Optional[bool] = None  # Default: DETERMINISTIC_SEEDS
+    quality: Optional[str] = None  # full, balanced or fast (default: QUALITY_MODE)
+    seed: Optional[int] = None  # Base seed; implies deterministic
+
+class ClipFailure(BaseModel):
+    index: int
+    prompt_id: Optional[str] = None
+    error: str
+
+class SubBatchTiming(BaseModel):
+    clip: int
+    batch: int
+    frames: int
+    backend: str
+    wait_seconds: float  # Submission to completion
+    gpu_seconds: Optional[float] = None  # Execution time, when the event stream reported it
+    download_seconds: float = 0
+
+class ClipResult(BaseModel):
+    index: int
+    clips: List[str]  # The encoded clip, or its frames when ENCODE_CLIPS is off
+    cached: bool = False
+    generate_seconds: Optional[float] = None  # Submission until its last sub-batch finished
+    encode_seconds: Optional[float] = None
+    elapsed_seconds: float  # Since the request started
 
 class VideoResponse(BaseModel):
     clips: List[str]
     total_duration: float
     prompt_used: str
+    failed_clips: List[ClipFailure] = []
+    cached_clips: int = 0
+    frames_per_batch: Optional[int] = None
+    sub_batches: List[SubBatchTiming] = []
+    quality: str = "full"
+    generated_size: List[int] = []  # [width, height, fps] the frames were generated at
+    gpu_seconds: Optional[float] = None  # ComfyUI execution time, when the event stream reported it
+    cpu_seconds: float = 0  # Encode worker and FFmpeg CPU time
 
 # ==============================================
-# ComfyUI Helper Functions
+# ComfyUI Backends
 # ==============================================
 
-def check_comfyui_status() -> bool:
-    """Check if ComfyUI is available"""
+class BackendUnavailable(Exception):
+    """The backend a prompt was queued on stopped responding"""
+
+def new_backend(url: str) -> Dict:
+    return {
+        "url": url,
+        "healthy": False,
+        "checked_at": 0.0,
+        "queue_depth": 0,
+        "queue_checked_at": 0.0,
+        # Prompts sent since queue_depth was read, so back-to-back picks spread out
+        "assigned": 0,
+        "ws_connected": threading.Event(),
+        "submitted": 0,
+        "completed": 0,
+        "failed": 0,
+        "failovers": 0,
+        "vram_total_mb": None,
+        "frames": 0,
+        # Clips and frames whose execution time the event stream reported
+        "timed_clips": 0,
+        "timed_frames": 0,
+        "gpu_seconds": 0.0
+    }
+
+backends: Dict[str, Dict] = {url: new_backend(url) for url in COMFYUI_URLS}
+backends_lock = threading.Lock()
+# prompt_id -> URL of the backend it was queued on
+prompt_backends: Dict[str, str] = {}
+# prompt_id -> seconds ComfyUI spent executing it, from the event stream
+prompt_runtimes: Dict[str, float] = {}
+
+def prompt_backend(prompt_id: str) -> str:
+    """URL of the backend running a prompt"""
+    with backends_lock:
+        return prompt_backends.get(prompt_id, COMFYUI_URLS[0])
+
+def check_comfyui_status(url: Optional[str] = None, refresh: bool = False) -> bool:
+    """
+    Check if ComfyUI is available
+
+    Results are cached per backend for HEALTH_CACHE_TTL seconds. Without a
+    url, True if any backend is up.
+    """
+    if url is None:
+        return any([check_comfyui_status(backend, refresh) for backend in COMFYUI_URLS])
+
+    backend = backends[url]
+    if not refresh and time.time() - backend["checked_at"] < HEALTH_CACHE_TTL:
+        return backend["healthy"]
+    vram_total_mb = None
     try:
-        response = requests.get(f"{COMFYUI_URL}/system_stats", timeout=5)
-        return response.status_code == 200
+        response = requests.get(f"{url}/system_stats", timeout=5)
+        healthy = response.status_code == 200
+        if healthy:
+            devices = response.json().get("devices") or [{}]
+            if devices[0].get("vram_total"):
+                vram_total_mb = devices[0]["vram_total"] / 1024**2
     except:
-        return False
+        healthy = False
+
+    with backends_lock:
+        if backend["healthy"] and not healthy:
+            print(f"⚠️  ComfyUI backend {url} is offline")
+        backend["healthy"] = healthy
+        backend["checked_at"] = time.time()
+        if vram_total_mb:
+            backend["vram_total_mb"] = vram_total_mb
+    return healthy
+
+def get_queue_depth(url: str) -> int:
+    """Running plus pending prompts on a backend, cached for QUEUE_DEPTH_TTL seconds"""
+    backend = backends[url]
+    if time.time() - backend["queue_checked_at"] < QUEUE_DEPTH_TTL:
+        return backend["queue_depth"] + backend["assigned"]
+    try:
+        response = requests.get(f"{url}/queue", timeout=5)
+        response.raise_for_status()
+        queue = response.json()
+        depth = len(queue.get("queue_running", [])) + len(queue.get("queue_pending", []))
+    except Exception:
+        # Can't see the queue; count what we sent it
+        with backends_lock:
+            depth = sum(1 for backend_url in prompt_backends.values() if backend_url == url)
+
+    with backends_lock:
+        backend["queue_depth"] = depth
+        backend["queue_checked_at"] = time.time()
+        backend["assigned"] = 0
+    return depth
+
+def pick_backend(exclude: tuple = ()) -> Optional[str]:
+    """Least-loaded healthy backend; ties go to the one with the best throughput"""
+    candidates = [url for url in COMFYUI_URLS if url not in exclude and check_comfyui_status(url)]
+    if not candidates:
+        return None
+
+    def load(url):
+        backend = backends[url]
+        return (get_queue_depth(url), -backend_throughput(backend))
+    return min(candidates, key=load)
+
+def submit_workflow(workflow: Dict, exclude: tuple = ()) -> str:
+    """Queue a workflow on the least-loaded backend, failing over to the others"""
+    exclude = set(exclude)
+    while True:
+        url = pick_backend(tuple(exclude))
+        if url is None:
+            raise Exception("No ComfyUI backend available")
+        try:
+            return queue_prompt(workflow, url)
+        except Exception as e:
+            print(f"   Warning: {e}, trying another backend")
+            check_comfyui_status(url, refresh=True)
+            exclude.add(url)
 
-def generate_workflow(prompt: str, num_frames: int, width: int, height: int) -> Dict:
+def record_prompt_result(prompt_id: str, frames: int = 0, error: Optional[str] = None,
+                         failover: bool = False) -> Optional[float]:
+    """
+    Count a finished prompt towards its backend's metrics and stop tracking it
+    Returns the prompt's execution time if the event stream reported it.
+    """
+    with backends_lock:
+        url = prompt_backends.pop(prompt_id, None)
+        runtime = prompt_runtimes.pop(prompt_id, None)
+        if url is None:
+            return None
+        backend = backends[url]
+        if failover:
+            backend["failovers"] += 1
+        elif error:
+            backend["failed"] += 1
+        else:
+            backend["completed"] += 1
+            backend["frames"] += frames
+            if runtime is not None:
+                backend["timed_clips"] += 1
+                backend["timed_frames"] += frames
+                backend["gpu_seconds"] += runtime
+    return runtime
+
+def untrack_prompt(prompt_id: str):
+    """Stop tracking a cancelled prompt without counting it towards any metric"""
+    with backends_lock:
+        prompt_backends.pop(prompt_id, None)
+        prompt_runtimes.pop(prompt_id, None)
+    unwatch_prompt(prompt_id)
+
+def backend_throughput(backend: Dict) -> float:
+    """Frames per second of ComfyUI execution time"""
+    return backend["timed_frames"] / backend["gpu_seconds"] if backend["gpu_seconds"] else 0.0
+
+def get_backend_stats() -> List[Dict]:
+    """Health, load and throughput of every backend"""
+    stats = []
+    for url in COMFYUI_URLS:
+        healthy = check_comfyui_status(url)
+        backend = backends[url]
+        with backends_lock:
+            in_flight = sum(1 for backend_url in prompt_backends.values() if backend_url == url)
+            stats.append({
+                "url": url,
+                "status": "online" if healthy else "offline",
+                "event_stream": "connected" if backend["ws_connected"].is_set() else "polling",
+                "queue_depth": backend["queue_depth"],
+                "vram_total_mb": round(backend["vram_total_mb"]) if backend["vram_total_mb"] else None,
+                "in_flight": in_flight,
+                "submitted": backend["submitted"],
+                "completed": backend["completed"],
+                "failed": backend["failed"],
+                "failovers": backend["failovers"],
+                "frames": backend["frames"],
+                "gpu_seconds": round(backend["gpu_seconds"], 2),
+                "frames_per_second": round(backend_throughput(backend), 2),
+                "avg_clip_seconds": round(backend["gpu_seconds"] / backend["timed_clips"], 2)
+                                    if backend["timed_clips"] else None
+            })
+    return stats
+
+def frames_per_batch(width: int, height: int) -> Optional[int]:
+    """
+    Largest sub-batch of frames that fits the VRAM budget on every healthy
+    backend (so a sub-batch can fail over anywhere), or None if unknown
+    """
+    capacities = [
+        backends[url]["vram_total_mb"] - VRAM_RESERVE_MB
+        for url in COMFYUI_URLS
+        if check_comfyui_status(url) and backends[url]["vram_total_mb"]
+    ]
+    budget = min(capacities) if capacities else None
+    if VRAM_BUDGET_MB:
+        budget = VRAM_BUDGET_MB if budget is None else min(budget, VRAM_BUDGET_MB)
+    if budget is None:
+        return None
+    
+    frame_mb = width * height / 1e6 * FRAME_VRAM_MB_PER_MEGAPIXEL
+    if budget < frame_mb:
+        print(f"⚠️  VRAM budget of {budget:.0f}MB doesn't fit one {width}x{height} frame ({frame_mb:.0f}MB), "
+              f"check VRAM_RESERVE_MB/VRAM_BUDGET_MB; sampling 1 frame per sub-batch")
+        return 1
+    return int(budget // frame_mb)
+
+# ==============================================
+# ComfyUI Helper Functions
+# ==============================================
+
+def generate_workflow(prompt: str, num_frames: int, width: int, height: int, seed: Optional[int] = None,
+                      batch_index: int = 0, batch_length: Optional[int] = None) -> Dict:
     """
     Generate ComfyUI workflow for AnimateDiff video generation
     This is a simplified workflow - you'll need to adjust based on your ComfyUI setup
+    
+    With batch_length, only frames batch_index..batch_index+batch_length-1
+    of the clip are sampled (a sub-batch).
     """
+    if seed is None:
+        # Random rather than the clock: clips queued in the same second must differ
+        seed = random.randrange(2**32)
+    
     workflow = {
         "1": {
             "inputs": {
@@ -75,7 +390,7 @@ def generate_workflow(prompt: str, num_frames: int, width: int, height: int) ->
         },
         "3": {
             "inputs": {
-                "seed": int(time.time()),
+                "seed": seed,
                 "steps": 20,
                 "cfg": 8.0,
                 "sampler_name": "euler",
@@ -117,68 +432,770 @@ def generate_workflow(prompt: str, num_frames: int, width: int, height: int) ->
             "class_type": "SaveImage"
         }
     }
+    
+    if batch_length is not None and batch_length < num_frames:
+        # Sample a slice of the clip's latent batch. ComfyUI derives the slice's
+        # noise from its batch_index, so the stitched frames match an unsplit run.
+        workflow["8"] = {
+            "inputs": {
+                "samples": ["5", 0],
+                "batch_index": batch_index,
+                "length": batch_length
+            },
+            "class_type": "LatentFromBatch"
+        }
+        workflow["3"]["inputs"]["latent_image"] = ["8", 0]
+    
     return workflow
 
-def queue_prompt(workflow: Dict) -> str:
-    """Queue workflow in ComfyUI"""
+def queue_prompt(workflow: Dict, base_url: Optional[str] = None) -> str:
+    """Queue workflow in ComfyUI (by default on the least-loaded backend)"""
+    base_url = base_url or pick_backend() or COMFYUI_URLS[0]
     try:
+        # client_id routes this prompt's execution events to our /ws connection
         response = requests.post(
-            f"{COMFYUI_URL}/prompt",
-            json={"prompt": workflow},
+            f"{base_url}/prompt",
+            json={"prompt": workflow, "client_id": CLIENT_ID},
             timeout=10
         )
         
         if response.status_code == 200:
             result = response.json()
-            return result.get("prompt_id", "")
+            prompt_id = result.get("prompt_id", "")
+            with backends_lock:
+                prompt_backends[prompt_id] = base_url
+                backends[base_url]["submitted"] += 1
+                backends[base_url]["assigned"] += 1
+            # Watch from submission, so the result is kept until a waiter gets to it
+            watch_prompt(prompt_id)
+            return prompt_id
         else:
             raise Exception(f"ComfyUI returned status {response.status_code}")
     except Exception as e:
-        raise Exception(f"Failed to queue prompt: {e}")
+        raise Exception(f"Failed to queue prompt on {base_url}: {e}")
+
+def cancel_prompt(prompt_id: str):
+    """Remove a prompt from ComfyUI's queue, interrupting it if it's running"""
+    base_url = prompt_backend(prompt_id)
+    try:
+        requests.post(f"{base_url}/queue", json={"delete": [prompt_id]}, timeout=5)
+        with events_lock:
+            running = prompt_id in prompt_started
+        if running:
+            requests.post(f"{base_url}/interrupt", json={"prompt_id": prompt_id}, timeout=5)
+    except Exception as e:
+        print(f"   Warning: Failed to cancel prompt {prompt_id}: {e}")
+    # A deleted queued prompt gets no events, so release its waiter here
+    resolve_prompt(prompt_id, "Cancelled")
+
+def get_history_images(prompt_id: str) -> Optional[List[Dict]]:
+    """Image references from a prompt's history entry, or None if it hasn't finished"""
+    response = requests.get(f"{prompt_backend(prompt_id)}/history/{prompt_id}", timeout=10)
+    if response.status_code == 200:
+        history = response.json()
+        if prompt_id in history:
+            outputs = history[prompt_id].get("outputs", {})
+            images = []
+            for node_output in outputs.values():
+                if "images" in node_output:
+                    for img in node_output["images"]:
+                        if img.get("filename"):
+                            images.append(img)
+            return images
+    return None
+
+def get_output_image_refs(prompt_id: str) -> List[Dict]:
+    """Get generated image references (filename, subfolder, type) from ComfyUI"""
+    try:
+        return get_history_images(prompt_id) or []
+    except:
+        return []
 
-def wait_for_completion(prompt_id: str, timeout: int = 300) -> bool:
-    """Wait for ComfyUI to complete generation"""
-    start_time = time.time()
+# ==============================================
+# ComfyUI Events
+# ==============================================
+
+# prompt_id -> Future resolved with the prompt's output images
+prompt_futures: Dict[str, Future] = {}
+# Images reported by "executed" events, until the prompt finishes
+prompt_images: Dict[str, List[Dict]] = {}
+# prompt_id -> time ComfyUI started executing it
+prompt_started: Dict[str, float] = {}
+# Recently finished prompts, kept for waiters that arrive after the event
+finished_prompts: "OrderedDict[str, tuple]" = OrderedDict()
+FINISHED_PROMPTS_LIMIT = 256
+events_lock = threading.Lock()
+
+def watch_prompt(prompt_id: str) -> Future:
+    """Future for a prompt's completion, already resolved if it finished"""
+    with events_lock:
+        future = prompt_futures.setdefault(prompt_id, Future())
+        if prompt_id in finished_prompts and not future.done():
+            images, error = finished_prompts[prompt_id]
+            if error:
+                future.set_exception(Exception(error))
+            else:
+                future.set_result(images)
+    return future
+
+def unwatch_prompt(prompt_id: str):
+    """Stop tracking a prompt nobody is waiting for anymore"""
+    with events_lock:
+        prompt_futures.pop(prompt_id, None)
+
+def resolve_prompt(prompt_id: str, error: Optional[str] = None):
+    """Finish a prompt with the images collected from its events"""
+    with events_lock:
+        if prompt_id in finished_prompts:
+            return  # Already resolved (e.g. executing/null followed by execution_success)
+        images = prompt_images.pop(prompt_id, [])
+        started = prompt_started.pop(prompt_id, None)
+        finished_prompts[prompt_id] = (images, error)
+        while len(finished_prompts) > FINISHED_PROMPTS_LIMIT:
+            finished_prompts.popitem(last=False)
+        # The future stays registered until its waiter unwatches it
+        future = prompt_futures.get(prompt_id)
     
-    while time.time() - start_time < timeout:
+    if started:
+        with backends_lock:
+            if prompt_id in prompt_backends:
+                prompt_runtimes[prompt_id] = time.time() - started
+    
+    if future and not future.done():
+        if error:
+            future.set_exception(Exception(error))
+        else:
+            future.set_result(images)
+
+def handle_event(message: Dict):
+    """Apply one ComfyUI websocket event to the prompt futures"""
+    event = message.get("type")
+    data = message.get("data") or {}
+    prompt_id = data.get("prompt_id")
+    if not prompt_id:
+        return
+    
+    if event == "execution_start":
+        with events_lock:
+            prompt_started[prompt_id] = time.time()
+    elif event == "executed":
+        images = [img for img in (data.get("output") or {}).get("images", []) if img.get("filename")]
+        with events_lock:
+            prompt_images.setdefault(prompt_id, []).extend(images)
+    elif event == "executing" and data.get("node") is None:
+        # A null node means the whole prompt finished
+        resolve_prompt(prompt_id)
+    elif event == "execution_success":
+        resolve_prompt(prompt_id)
+    elif event == "execution_error":
+        resolve_prompt(prompt_id, f"ComfyUI execution error: {data.get('exception_message', 'unknown')}")
+    elif event == "execution_interrupted":
+        resolve_prompt(prompt_id, "ComfyUI execution interrupted")
+
+def reconcile_pending_prompts(base_url: str):
+    """Resolve a backend's prompts that finished while its event stream was down"""
+    with events_lock:
+        pending = [prompt_id for prompt_id, future in prompt_futures.items() if not future.done()]
+    for prompt_id in pending:
+        if prompt_backend(prompt_id) != base_url:
+            continue
         try:
-            response = requests.get(f"{COMFYUI_URL}/history/{prompt_id}")
-            if response.status_code == 200:
-                history = response.json()
-                if prompt_id in history:
-                    return True
-        except:
-            pass
+            images = get_history_images(prompt_id)
+        except Exception:
+            continue
+        if images is not None:
+            with events_lock:
+                prompt_images[prompt_id] = images
+            resolve_prompt(prompt_id)
+
+def event_listener_loop(base_url: str):
+    """Keep a websocket open to a backend's /ws, reconnecting with backoff"""
+    ws_url = f"ws{base_url[4:]}/ws?clientId={CLIENT_ID}"
+    connected = backends[base_url]["ws_connected"]
+    backoff = 1
+    while True:
+        try:
+            ws = websocket.create_connection(ws_url, timeout=10)
+            ws.settimeout(None)
+            connected.set()
+            backoff = 1
+            print(f"🔌 Listening for ComfyUI events on {ws_url}")
+            check_comfyui_status(base_url, refresh=True)
+            reconcile_pending_prompts(base_url)
+            while True:
+                message = ws.recv()
+                # Binary messages are sampler previews
+                if isinstance(message, str):
+                    handle_event(json.loads(message))
+        except Exception as e:
+            if connected.is_set():
+                print(f"⚠️  ComfyUI event stream lost ({base_url}): {e}")
+                connected.clear()
+                # Route new clips elsewhere right away if the backend itself went down
+                check_comfyui_status(base_url, refresh=True)
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+def wait_for_prompt(prompt_id: str, timeout: float = 300, queue_timeout: Optional[float] = None) -> List[Dict]:
+    """
+    Wait for a prompt and return its output image references
+    
+    Resolves as soon as the /ws stream reports completion. While the stream
+    is down, /history is polled instead. timeout bounds execution once the
+    stream reports it started; until then the prompt may wait queue_timeout
+    (default: timeout) seconds. Raises TimeoutError, BackendUnavailable if
+    the prompt's backend stops responding, or the execution error.
+    """
+    future = watch_prompt(prompt_id)
+    base_url = prompt_backend(prompt_id)
+    connected = backends[base_url]["ws_connected"]
+    submitted = time.time()
+    queue_timeout = timeout if queue_timeout is None else queue_timeout
+    try:
+        while True:
+            with events_lock:
+                started = prompt_started.get(prompt_id)
+            deadline = started + timeout if started else submitted + queue_timeout
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise TimeoutError(f"Timed out after {time.time() - submitted:.0f}s "
+                                   f"({'running' if started else 'queued'})")
+            try:
+                return future.result(timeout=min(HISTORY_POLL_INTERVAL, remaining))
+            except FutureTimeout:
+                if connected.is_set():
+                    continue
+            
+            try:
+                images = get_history_images(prompt_id)
+                if images is not None:
+                    return images
+            except Exception:
+                if not check_comfyui_status(base_url):
+                    raise BackendUnavailable(f"ComfyUI backend {base_url} is unavailable")
+    finally:
+        unwatch_prompt(prompt_id)
+
+def forget_prompt(prompt_id: str):
+    """Drop event state for a prompt that will never finish (its backend went away)"""
+    with events_lock:
+        prompt_images.pop(prompt_id, None)
+        prompt_started.pop(prompt_id, None)
+
+def wait_for_part(key: tuple, workflow: Dict, prompt_ids: Dict[tuple, str], queue_timeout: float) -> List[Dict]:
+    """
+    Wait for one (clip, sub-batch) prompt, resubmitting it to another backend
+    if its own goes down. prompt_ids[key] always holds the current prompt.
+    """
+    tried = set()
+    while True:
+        prompt_id = prompt_ids[key]
+        try:
+            return wait_for_prompt(prompt_id, CLIP_TIMEOUT, queue_timeout)
+        except BackendUnavailable as e:
+            base_url = prompt_backend(prompt_id)
+            tried.add(base_url)
+            forget_prompt(prompt_id)
+            record_prompt_result(prompt_id, failover=True)
+            print(f"   Warning: {e}, moving clip {key[0]+1} batch {key[1]+1} to another backend")
+            prompt_ids[key] = submit_workflow(workflow, exclude=tuple(tried))
+
+# ==============================================
+# Output Downloads
+# ==============================================
+
+download_pool: Optional[ThreadPoolExecutor] = None
+download_session: Optional[requests.Session] = None
+download_lock = threading.Lock()
+download_stats = {"files": 0, "bytes": 0, "retries": 0}
+
+def get_downloader() -> tuple:
+    """Download thread pool and its shared keep-alive session, created on first use"""
+    global download_pool, download_session
+    with download_lock:
+        if download_pool is None:
+            download_session = requests.Session()
+            # One pooled connection per worker, per backend
+            adapter = requests.adapters.HTTPAdapter(pool_connections=len(COMFYUI_URLS), pool_maxsize=DOWNLOAD_WORKERS)
+            download_session.mount("http://", adapter)
+            download_session.mount("https://", adapter)
+            download_pool = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS, thread_name_prefix="download")
+    return download_pool, download_session
+
+def download_image(image: Dict, dest_dir: str, session: requests.Session) -> str:
+    """Stream one output file from its backend's /view to disk and verify its size"""
+    path = os.path.join(dest_dir, os.path.basename(image["filename"]))
+    partial = path + ".partial"
+    
+    for attempt in range(1, DOWNLOAD_ATTEMPTS + 1):
+        written = 0
+        try:
+            with session.get(
+                f"{image.get('base_url', COMFYUI_URLS[0])}/view",
+                params={
+                    "filename": image["filename"],
+                    "subfolder": image.get("subfolder", ""),
+                    "type": image.get("type", "output")
+                },
+                stream=True,
+                timeout=30
+            ) as response:
+                response.raise_for_status()
+                # Content-Length counts encoded bytes, so it only checks identity responses
+                expected = None if response.headers.get("Content-Encoding") else response.headers.get("Content-Length")
+                with open(partial, 'wb') as f:
+                    for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                        f.write(chunk)
+                        written += len(chunk)
+            
+            if expected is not None and written != int(expected):
+                raise Exception(f"got {written} of {expected} bytes")
+            if written == 0:
+                raise Exception("empty response")
+            
+            os.replace(partial, path)
+            with download_lock:
+                download_stats["files"] += 1
+                download_stats["bytes"] += written
+            return path
+        except Exception as e:
+            if os.path.exists(partial):
+                os.remove(partial)
+            if attempt == DOWNLOAD_ATTEMPTS:
+                raise Exception(f"Failed to download {image['filename']}: {e}")
+            with download_lock:
+                download_stats["retries"] += 1
+
+def download_outputs(prompt_id: str, images: List[Dict]) -> List[Dict]:
+    """
+    Download a prompt's output files into OUTPUT_DIR/frames_<prompt_id>
+    
+    All files are fetched concurrently over the pooled session. Returns the
+    image references with a local_path added, in the original order.
+    """
+    pool, session = get_downloader()
+    dest_dir = os.path.join(OUTPUT_DIR, f"frames_{prompt_id}")
+    os.makedirs(dest_dir, exist_ok=True)
+    
+    futures = [pool.submit(download_image, image, dest_dir, session) for image in images]
+    try:
+        return [{**image, "local_path": future.result()} for image, future in zip(images, futures)]
+    except Exception:
+        for future in futures:
+            future.cancel()
+        for future in futures:
+            if not future.cancelled():
+                future.exception()  # Let running downloads finish before removing the folder
+        shutil.rmtree(dest_dir, ignore_errors=True)
+        raise
+
+def get_download_stats() -> Dict:
+    with download_lock:
+        return dict(download_stats)
+
+# ==============================================
+# Clip Encoding
+# ==============================================
+
+encode_pool: Optional[ProcessPoolExecutor] = None
+encode_pool_lock = threading.Lock()
+
+def get_encode_pool() -> ProcessPoolExecutor:
+    """Process pool for clip encoding, created on first use"""
+    global encode_pool
+    with encode_pool_lock:
+        if encode_pool is None:
+            # spawn: forking a process that runs uvicorn threads is unsafe
+            encode_pool = ProcessPoolExecutor(
+                max_workers=ENCODE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return encode_pool
+
+def read_frame(image: Dict, session: requests.Session) -> bytes:
+    """Read one PNG frame from its download, the mounted output folder or ComfyUI's /view"""
+    if image.get("local_path"):
+        with open(image["local_path"], 'rb') as f:
+            return f.read()
+    if COMFYUI_OUTPUT_DIR:
+        path = os.path.join(COMFYUI_OUTPUT_DIR, image.get("subfolder", ""), image["filename"])
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                return f.read()
+    
+    response = session.get(
+        f"{image.get('base_url', COMFYUI_URLS[0])}/view",
+        params={
+            "filename": image["filename"],
+            "subfolder": image.get("subfolder", ""),
+            "type": image.get("type", "output")
+        },
+        timeout=30
+    )
+    response.raise_for_status()
+    return response.content
+
+def postprocess_filter(target: Dict) -> str:
+    """FFmpeg filter interpolating to the target frame rate, then upscaling to its size"""
+    # Interpolate first, while frames are still small: minterpolate's cost grows with pixels
+    interpolate = f"minterpolate=fps={target['fps']}:mi_mode={INTERPOLATION_MODE}"
+    if INTERPOLATION_MODE == "mci":
+        interpolate += ":mc_mode=aobmc:me_mode=bidir:vsbmc=1"
+    return f"{interpolate},scale={target['width']}:{target['height']}:flags=lanczos"
+
+def encode_frames_to_clip(images: List[Dict], output_path: str, fps: int, target: Optional[Dict] = None) -> Dict:
+    """
+    Encode a frame sequence into an H.264 clip
+    
+    Frames are decoded one at a time and piped to FFmpeg's stdin as
+    rawvideo, so no per-frame temp files are written and at most one
+    decoded frame is held in memory. With a target ({"width", "height",
+    "fps"}) the frames are interpolated and upscaled to it in the same
+    FFmpeg pass. Runs in the encode process pool.
+    """
+    from PIL import Image
+    
+    start = time.time()
+    cpu_start = [sum(resource.getrusage(who)[:2]) for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+    session = requests.Session()
+    process = None
+    try:
+        for i, image in enumerate(images):
+            frame = Image.open(io.BytesIO(read_frame(image, session))).convert("RGB")
+            
+            if process is None:
+                # The first frame fixes the clip size
+                width, height = frame.size
+                process = subprocess.Popen([
+                    "ffmpeg", "-y", "-v", "error",
+                    "-f", "rawvideo",
+                    "-pix_fmt", "rgb24",
+                    "-s", f"{width}x{height}",
+                    "-r", str(fps),
+                    "-i", "pipe:0",
+                    *(["-vf", postprocess_filter(target)] if target else []),
+                    "-c:v", "libx264",
+                    "-pix_fmt", "yuv420p",
+                    output_path
+                ], stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            elif frame.size != (width, height):
+                frame = frame.resize((width, height))
+            
+            process.stdin.write(frame.tobytes())
         
-        time.sleep(2)
+        if process is None:
+            raise Exception("No frames to encode")
+        
+        process.stdin.close()
+        stderr = process.stderr.read().decode("utf-8", "replace")
+        if process.wait() != 0:
+            raise Exception(f"FFmpeg failed: {stderr.strip()[-500:]}")
+    except BaseException:
+        if process and process.poll() is None:
+            process.kill()
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise
+    finally:
+        session.close()
     
-    return False
+    # This worker encodes one clip at a time, so the deltas are this clip's
+    cpu_end = [sum(resource.getrusage(who)[:2]) for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+    return {
+        "path": output_path,
+        "frames": len(images),
+        "encode_seconds": round(time.time() - start, 2),
+        "cpu_seconds": round(sum(cpu_end) - sum(cpu_start), 2)
+    }
+
+# ==============================================
+# Clip Cache
+# ==============================================
+
+# workflow fingerprint -> {"clips": paths or filenames, "size": bytes}, in LRU order
+clip_cache: "OrderedDict[str, Dict]" = OrderedDict()
+clip_cache_lock = threading.Lock()
+clip_cache_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+def clip_seed(prompt: str, index: int, base_seed: int = 0) -> int:
+    """Deterministic KSampler seed for one clip of a prompt"""
+    digest = hashlib.sha256(f"{base_seed}:{index}:{prompt}".encode()).hexdigest()
+    return int(digest[:8], 16)
+
+def workflow_fingerprint(workflow: Dict, fps: int, target: Optional[Dict] = None) -> str:
+    """
+    Canonical hash of everything that determines a clip's pixels: the whole
+    graph (prompt, seed, steps, dimensions, frame count, checkpoint) except
+    the SaveImage filename prefix, plus how the frames are delivered and
+    post-processed
+    """
+    graph = json.loads(json.dumps(workflow))
+    for node in graph.values():
+        if node.get("class_type") == "SaveImage":
+            node["inputs"].pop("filename_prefix", None)
+    key = {"workflow": graph, "fps": fps, "encoded": ENCODE_CLIPS}
+    if target:
+        key["postprocess"] = {**target, "interpolation": INTERPOLATION_MODE}
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+def cached_clips_exist(entry: Dict) -> bool:
+    """Local files behind a cache entry are still there (remote filenames can't be checked)"""
+    return all(os.path.exists(path) for path in entry["clips"] if os.path.isabs(path))
 
-def get_output_images(prompt_id: str) -> List[str]:
-    """Get generated images from ComfyUI"""
+def save_clip_cache_index():
+    """Persist the cache index so entries survive restarts (caller holds the lock)"""
     try:
-        response = requests.get(f"{COMFYUI_URL}/history/{prompt_id}")
-        if response.status_code == 200:
-            history = response.json()
-            if prompt_id in history:
-                outputs = history[prompt_id].get("outputs", {})
-                images = []
-                for node_output in outputs.values():
-                    if "images" in node_output:
-                        for img in node_output["images"]:
-                            filename = img.get("filename", "")
-                            if filename:
-                                images.append(filename)
-                return images
-    except:
-        pass
+        with open(CLIP_CACHE_INDEX, 'w') as f:
+            json.dump(list(clip_cache.items()), f)
+    except OSError as e:
+        print(f"Error saving clip cache index: {e}")
+
+def load_clip_cache_index():
+    """Load the persisted cache index, dropping entries whose clips are gone"""
+    try:
+        with open(CLIP_CACHE_INDEX) as f:
+            entries = json.load(f)
+    except (OSError, ValueError):
+        return
     
-    return []
+    with clip_cache_lock:
+        for key, entry in entries:
+            if cached_clips_exist(entry):
+                clip_cache[key] = entry
+
+def lookup_cached_clip(key: str) -> Optional[List[str]]:
+    """Return a cached clip's outputs if they still exist"""
+    with clip_cache_lock:
+        entry = clip_cache.get(key)
+        if entry and not cached_clips_exist(entry):
+            del clip_cache[key]
+            entry = None
+        
+        if not entry:
+            clip_cache_stats["misses"] += 1
+            return None
+        
+        clip_cache.move_to_end(key)
+        clip_cache_stats["hits"] += 1
+        return list(entry["clips"])
+
+def store_cached_clip(key: str, clips: List[str]):
+    """Add a generated clip to the cache and evict least recently used entries"""
+    size = sum(os.path.getsize(path) for path in clips if os.path.isabs(path) and os.path.exists(path))
+    with clip_cache_lock:
+        clip_cache[key] = {"clips": clips, "size": size}
+        clip_cache.move_to_end(key)
+        
+        total = sum(entry["size"] for entry in clip_cache.values())
+        while total > CLIP_CACHE_MAX_BYTES and len(clip_cache) > 1:
+            _, evicted = clip_cache.popitem(last=False)
+            total -= evicted["size"]
+            clip_cache_stats["evictions"] += 1
+            for path in evicted["clips"]:
+                if os.path.isabs(path):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+            # Raw frames live in their own frames_<prompt_id> folder
+            for folder in {os.path.dirname(path) for path in evicted["clips"] if os.path.isabs(path)}:
+                if folder != OUTPUT_DIR:
+                    try:
+                        os.rmdir(folder)  # Only once it's empty
+                    except OSError:
+                        pass
+        
+        save_clip_cache_index()
+
+def get_clip_cache_stats() -> Dict:
+    """Clip cache size and hit rate"""
+    with clip_cache_lock:
+        lookups = clip_cache_stats["hits"] + clip_cache_stats["misses"]
+        return {
+            "entries": len(clip_cache),
+            "bytes": sum(entry["size"] for entry in clip_cache.values()),
+            "max_bytes": CLIP_CACHE_MAX_BYTES,
+            **clip_cache_stats,
+            "hit_rate": round(clip_cache_stats["hits"] / lookups, 3) if lookups else 0.0
+        }
+
+load_clip_cache_index()
+
+# ==============================================
+# Retention
+# ==============================================
+
+# path (clip file or frames_<prompt_id> folder) -> {"size", "last_access"}
+artifacts: Dict[str, Dict] = {}
+artifacts_lock = threading.Lock()
+janitor_stats = {"runs": 0, "bytes_reclaimed": 0, "last_run": None}
+
+def path_size(path: str) -> int:
+    """Size of a file, or of every file in a folder"""
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+    return os.path.getsize(path)
+
+def is_output(path: str) -> bool:
+    """An encoded clip_<prompt_id>.mp4 or a downloaded frames_<prompt_id> folder"""
+    name = os.path.basename(path)
+    return (name.startswith("clip_") and name.endswith(".mp4")) or (name.startswith("frames_") and os.path.isdir(path))
+
+def output_paths(clips: List[str]) -> List[str]:
+    """OUTPUT_DIR entries behind a clip's outputs: the encoded file, or its frames folders"""
+    paths = set()
+    for path in clips:
+        if not os.path.isabs(path):
+            continue  # Remote ComfyUI filename
+        folder = os.path.dirname(path)
+        paths.add(path if os.path.normpath(folder) == os.path.normpath(OUTPUT_DIR) else folder)
+    return sorted(paths)
+
+def cached_output_paths() -> set:
+    """Outputs owned by the clip cache, which bounds them itself"""
+    with clip_cache_lock:
+        return {path for entry in clip_cache.values() for path in output_paths(entry["clips"])}
+
+def register_artifact(path: str):
+    """Track a generated clip or frames folder"""
+    try:
+        size = path_size(path)
+    except OSError:
+        return
+    with artifacts_lock:
+        artifacts[path] = {"size": size, "last_access": time.time()}
+
+def forget_artifact(path: str):
+    """Stop tracking an output (deleted, or handed to the clip cache)"""
+    with artifacts_lock:
+        artifacts.pop(path, None)
+
+def discard_output(path: str):
+    """Delete a clip or frames folder and stop tracking it"""
+    forget_artifact(path)
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
+
+def scan_artifacts():
+    """Index existing outputs not owned by the clip cache, once at startup"""
+    cached = cached_output_paths()
+    for filename in os.listdir(OUTPUT_DIR):
+        path = os.path.join(OUTPUT_DIR, filename)
+        if is_output(path) and path not in cached:
+            try:
+                entry = {"size": path_size(path), "last_access": os.stat(path).st_mtime}
+            except OSError:
+                continue
+            with artifacts_lock:
+                artifacts[path] = entry
+
+def remove_orphans(max_age: float) -> Dict:
+    """Delete untracked outputs left behind by failed encodes or crashes"""
+    removed, reclaimed = 0, 0
+    cutoff = time.time() - max_age
+    cached = cached_output_paths()
+    for filename in os.listdir(OUTPUT_DIR):
+        path = os.path.join(OUTPUT_DIR, filename)
+        with artifacts_lock:
+            tracked = path in artifacts
+        if not is_output(path) or tracked or path in cached:
+            continue
+        try:
+            if os.stat(path).st_mtime > cutoff:
+                continue
+            size = path_size(path)
+            discard_output(path)
+            removed += 1
+            reclaimed += size
+        except OSError:
+            pass
+    return {"files": removed, "bytes": reclaimed}
+
+def evict_over_quota() -> Dict:
+    """Evict outputs, least recently used first, until under quota"""
+    with artifacts_lock:
+        used = sum(entry["size"] for entry in artifacts.values())
+        candidates = sorted((entry["last_access"], path, entry["size"]) for path, entry in artifacts.items())
+    
+    evicted, reclaimed = 0, 0
+    for _, path, size in candidates:
+        if used <= DISK_QUOTA_BYTES:
+            break
+        try:
+            discard_output(path)
+        except OSError:
+            continue
+        used -= size
+        evicted += 1
+        reclaimed += size
+    
+    return {"files": evicted, "bytes": reclaimed, "used_bytes": used}
+
+def run_janitor() -> Dict:
+    """One retention pass: orphan cleanup, then LRU eviction over the quota"""
+    start = time.time()
+    orphans = remove_orphans(TEMP_ORPHAN_AGE)
+    evicted = evict_over_quota()
+    report = {
+        "started_at": start,
+        "duration": round(time.time() - start, 3),
+        "orphans_removed": orphans["files"],
+        "evicted_files": evicted["files"],
+        "bytes_reclaimed": orphans["bytes"] + evicted["bytes"],
+        "used_bytes": evicted["used_bytes"],
+        "quota_bytes": DISK_QUOTA_BYTES
+    }
+    
+    with artifacts_lock:
+        janitor_stats["runs"] += 1
+        janitor_stats["bytes_reclaimed"] += report["bytes_reclaimed"]
+        janitor_stats["last_run"] = report
+    
+    if report["bytes_reclaimed"]:
+        print(f"🧹 Janitor reclaimed {report['bytes_reclaimed']/1024/1024:.2f}MB "
+              f"({report['orphans_removed']} orphans, {report['evicted_files']} evicted)")
+    return report
+
+def janitor_loop():
+    """Background retention manager"""
+    while True:
+        try:
+            run_janitor()
+        except Exception as e:
+            print(f"Janitor error: {e}")
+        time.sleep(JANITOR_INTERVAL)
+
+def get_retention_stats() -> Dict:
+    """Tracked disk usage and janitor history"""
+    with artifacts_lock:
+        return {
+            "artifacts": len(artifacts),
+            "used_bytes": sum(entry["size"] for entry in artifacts.values()),
+            "quota_bytes": DISK_QUOTA_BYTES,
+            **janitor_stats
+        }
 
 # ==============================================
 # API Endpoints
 # ==============================================
 
+@app.on_event("startup")
+def start_event_listener():
+    """Listen for ComfyUI completion events in the background"""
+    if COMFYUI_WS and websocket:
+        for url in COMFYUI_URLS:
+            threading.Thread(target=event_listener_loop, args=(url,), daemon=True).start()
+    elif COMFYUI_WS:
+        print("⚠️  websocket-client not installed, polling ComfyUI history instead")
+
+@app.on_event("startup")
+def start_janitor():
+    """Index existing outputs and start the background retention manager"""
+    scan_artifacts()
+    threading.Thread(target=janitor_loop, name="janitor", daemon=True).start()
+
 @app.get("/")
 def read_root():
     comfyui_online = check_comfyui_status()
@@ -188,6 +1205,7 @@ def read_root():
         "cost": "FREE",
         "backend": "ComfyUI + AnimateDiff",
         "comfyui_url": COMFYUI_URL,
+        "comfyui_urls": COMFYUI_URLS,
         "comfyui_status": "online" if comfyui_online else "offline"
     }
 
@@ -195,74 +1213,385 @@ def read_root():
 def health_check():
     """Health check endpoint"""
     comfyui_status = "online" if check_comfyui_status() else "offline"
+    online = sum(1 for url in COMFYUI_URLS if check_comfyui_status(url))
+    streaming = all(backends[url]["ws_connected"].is_set() for url in COMFYUI_URLS)
     return {
         "status": "healthy" if comfyui_status == "online" else "comfyui_offline",
         "comfyui": comfyui_status,
+        "backends_online": f"{online}/{len(COMFYUI_URLS)}",
+        "event_stream": "connected" if streaming else "polling",
         "output_dir": OUTPUT_DIR
     }
 
-@app.post("/generate-video", response_model=VideoResponse)
-def generate_video(request: VideoRequest):
+@app.get("/backends")
+def list_backends():
+    """Per-backend health, queue depth and throughput"""
+    return {"backends": get_backend_stats()}
+
+def generate_clip_stream(request: VideoRequest, cancelled: Optional[threading.Event] = None):
     """
-    Generate video clips using FREE ComfyUI + AnimateDiff
+    Generate a request's clips, yielding records as they become available:
     
-    Note: Requires ComfyUI with AnimateDiff and SDXL models installed
+    - {"type": "queued", ...} once everything is submitted
+    - {"type": "clip", ...ClipResult} for each clip as soon as it's ready
+    - {"type": "failure", ...ClipFailure} for each clip that fails
+    - {"type": "summary", ...VideoResponse} last, with clips in story order
+    
+    Validation errors are raised as HTTPException before the first record.
+    Setting cancelled (or closing the generator) cancels the remaining prompts.
     """
-    try:
-        # Check ComfyUI status
-        if not check_comfyui_status():
-            raise HTTPException(
-                status_code=503,
-                detail=f"ComfyUI not available at {COMFYUI_URL}"
-            )
-        
-        print(f"🎬 Generating {request.num_clips} video clips...")
-        print(f"   Prompt: {request.visual_prompt}")
-        
-        # Calculate dimensions
-        width = 1080 if request.aspect_ratio == [9, 16] else 1920
-        height = 1920 if request.aspect_ratio == [9, 16] else 1080
-        num_frames = request.clip_duration * request.fps
-        
-        clips = []
+    print(f"🎬 Generating {request.num_clips} video clips...")
+    print(f"   Prompt: {request.visual_prompt}")
+    started = time.time()
+    
+    # Calculate dimensions
+    width = 1080 if request.aspect_ratio == [9, 16] else 1920
+    height = 1920 if request.aspect_ratio == [9, 16] else 1080
+    
+    if request.clip_duration < 1 or request.fps < 1:
+        raise HTTPException(status_code=400, detail="clip_duration and fps must be at least 1")
+    
+    quality = request.quality or QUALITY_MODE
+    if quality not in QUALITY_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown quality mode: {quality}")
+    mode = QUALITY_MODES[quality]
+    # Latent dimensions must be multiples of 8
+    gen_width = max(8, int(width * mode["scale"]) // 8 * 8) if mode["scale"] != 1 else width
+    gen_height = max(8, int(height * mode["scale"]) // 8 * 8) if mode["scale"] != 1 else height
+    gen_fps = min(mode["fps"] or request.fps, request.fps)
+    target = None
+    if (gen_width, gen_height, gen_fps) != (width, height, request.fps):
+        if not ENCODE_CLIPS:
+            raise HTTPException(status_code=400, detail=f"Quality mode {quality} needs ENCODE_CLIPS")
+        # The encode workers interpolate and upscale to the requested format
+        target = {"width": width, "height": height, "fps": request.fps}
+        print(f"   Quality: {quality}, generating {gen_width}x{gen_height} at {gen_fps}fps")
+    num_frames = request.clip_duration * gen_fps
+    
+    deterministic = request.seed is not None or (
+        DETERMINISTIC_SEEDS if request.deterministic is None else request.deterministic
+    )
+    # Sub-batch size is only worked out once a clip has to be generated, since it asks
+    # every backend for its VRAM and cached clips shouldn't touch ComfyUI
+    batch_size = None
+    fingerprints = {}
+    cached = {}
+    parts = {}  # (clip, sub-batch) -> workflow
+    num_batches = {}
+    
+    for i in range(request.num_clips):
+        seed = clip_seed(request.visual_prompt, i, request.seed or 0) if deterministic else random.randrange(2**32)
+        # Random seeds never repeat, so only deterministic clips can be cached
+        if deterministic:
+            # Fingerprint the whole clip, so the key doesn't depend on how it's split
+            workflow = generate_workflow(request.visual_prompt, num_frames, gen_width, gen_height, seed)
+            fingerprints[i] = workflow_fingerprint(workflow, gen_fps, target)
+            hit = lookup_cached_clip(fingerprints[i])
+            if hit is not None:
+                cached[i] = hit
+                continue
         
-        # Generate each clip
-        for i in range(request.num_clips):
-            print(f"   Generating clip {i+1}/{request.num_clips}...")
-            
-            # Create workflow
-            workflow = generate_workflow(
+        if batch_size is None:
+            # Split each clip into sub-batches that fit the smallest backend's VRAM
+            batch_size = min(frames_per_batch(gen_width, gen_height) or num_frames, num_frames)
+        # Every sub-batch shares the clip's seed and samples its own slice of the latent batch
+        for j, first in enumerate(range(0, num_frames, batch_size)):
+            parts[(i, j)] = generate_workflow(
                 prompt=request.visual_prompt,
                 num_frames=num_frames,
-                width=width,
-                height=height
+                width=gen_width,
+                height=gen_height,
+                seed=seed,
+                batch_index=first,
+                batch_length=min(batch_size, num_frames - first)
             )
-            
-            # Queue in ComfyUI
-            prompt_id = queue_prompt(workflow)
-            
-            # Wait for completion
-            if wait_for_completion(prompt_id):
-                # Get output images
-                images = get_output_images(prompt_id)
-                if images:
-                    clips.extend(images)
+            num_batches[i] = j + 1
+    
+    # Check ComfyUI status
+    if len(cached) < request.num_clips and not check_comfyui_status():
+        raise HTTPException(
+            status_code=503,
+            detail=f"ComfyUI not available at {', '.join(COMFYUI_URLS)}"
+        )
+    
+    failures = {}
+    prompt_ids = {}
+    
+    # Submit every sub-batch up front, each to the least-loaded backend, so no queue runs dry
+    for key, workflow in parts.items():
+        if key[0] in failures:
+            continue
+        try:
+            prompt_ids[key] = submit_workflow(workflow)
+        except Exception as e:
+            failures[key[0]] = ClipFailure(index=key[0], error=str(e))
+    # A clip with a missing sub-batch can't be stitched
+    for key in [key for key in prompt_ids if key[0] in failures]:
+        cancel_prompt(prompt_ids[key])
+        untrack_prompt(prompt_ids.pop(key))
+    print(f"   Queued {len({i for i, _ in prompt_ids})}/{request.num_clips} clips "
+          f"as {len(prompt_ids)} sub-batches" + (f" of up to {batch_size} frames" if batch_size else "")
+          + (f", {len(cached)} from cache" if cached else ""))
+    
+    # Gather sub-batches as they finish; each one is downloaded while the rest generate,
+    # each clip is encoded as soon as all its sub-batches are in, and each clip is
+    # reported as soon as it's encoded
+    results = {}
+    frame_dirs = {}
+    part_images = {}
+    generated_at = {}
+    timings = []
+    cpu_seconds = 0.0
+    submitted = time.time()
+    queue_timeout = CLIP_TIMEOUT * len({i for i, _ in prompt_ids})
+    # Prompts are watched from submission, so a bounded set of waiters can work through them in queue order
+    with ThreadPoolExecutor(max_workers=max(min(len(prompt_ids), GATHER_WORKERS), 1),
+                            thread_name_prefix="gather") as gather:
+        waits = {
+            gather.submit(wait_for_part, key, parts[key], prompt_ids, queue_timeout): key
+            for key in list(prompt_ids)
+        }
+        encodes = {}  # encode future -> clip index
+        pending = set(waits)
         
-        total_duration = request.num_clips * request.clip_duration
+        def fail_clip(i: int, prompt_id: Optional[str], error: str) -> Dict:
+            """Give up on a clip: cancel its other sub-batches and drop their frames"""
+            print(f"   Warning: Clip {i+1} failed: {error}")
+            failures[i] = ClipFailure(index=i, prompt_id=prompt_id, error=error)
+            for future, key in waits.items():
+                if key[0] == i and not future.done():
+                    cancel_prompt(prompt_ids[key])
+            for key in [key for key in part_images if key[0] == i]:
+                del part_images[key]
+            for frame_dir in frame_dirs.pop(i, []):
+                discard_output(frame_dir)
+            return {"type": "failure", **failures[i].model_dump()}
         
-        print(f"✅ Generated {len(clips)} clips")
+        def finish_clip(i: int, clip_outputs: List[str], encode_seconds: Optional[float] = None) -> Dict:
+            results[i] = ClipResult(
+                index=i,
+                clips=clip_outputs,
+                generate_seconds=round(generated_at[i] - submitted, 2),
+                encode_seconds=encode_seconds,
+                elapsed_seconds=round(time.time() - started, 2)
+            )
+            for path in output_paths(clip_outputs):
+                if i in fingerprints:
+                    forget_artifact(path)  # The clip cache owns it from here
+                else:
+                    register_artifact(path)
+            if i in fingerprints:
+                store_cached_clip(fingerprints[i], clip_outputs)
+            return {"type": "clip", **results[i].model_dump()}
         
-        return VideoResponse(
-            clips=clips,
-            total_duration=total_duration,
-            prompt_used=request.visual_prompt
-        )
+        def abandon():
+            """Cancel everything still queued, freeing the GPUs for other requests"""
+            for future, key in waits.items():
+                if not future.done():
+                    cancel_prompt(prompt_ids[key])
+        
+        # Every yield from here on is covered, so a consumer going away at any record
+        # (or a cancel, or an error) never leaves submitted prompts queued
+        completed = False
+        try:
+            yield {
+                "type": "queued",
+                "clips": request.num_clips,
+                "sub_batches": len(prompt_ids),
+                "frames_per_batch": batch_size,
+                "cached": len(cached)
+            }
+            for i in sorted(failures):
+                yield {"type": "failure", **failures[i].model_dump()}
+            
+            for i in sorted(cached):
+                results[i] = ClipResult(index=i, clips=cached[i], cached=True,
+                                        elapsed_seconds=round(time.time() - started, 2))
+                yield {"type": "clip", **results[i].model_dump()}
+            
+            while pending:
+                done_set, pending = wait(pending, timeout=1, return_when=FIRST_COMPLETED)
+                if cancelled is not None and cancelled.is_set():
+                    print(f"   Request cancelled, dropping {len(pending)} pending clips")
+                    return
+                for done in done_set:
+                    if done in encodes:
+                        i = encodes.pop(done)
+                        try:
+                            result = done.result()
+                            cpu_seconds += result["cpu_seconds"]
+                            print(f"   Encoded {result['frames']} frames in {result['encode_seconds']}s"
+                                  + (f" (upscaled to {width}x{height} at {request.fps}fps)" if target else ""))
+                        except Exception as e:
+                            yield fail_clip(i, None, f"Encoding failed: {e}")
+                            continue
+                        finally:
+                            # The downloaded frames only existed to feed the encoder
+                            for frame_dir in frame_dirs.pop(i, []):
+                                discard_output(frame_dir)
+                        yield finish_clip(i, [result["path"]], result["encode_seconds"])
+                        continue
+                    
+                    key = waits[done]
+                    i, j = key
+                    prompt_id = prompt_ids[key]
+                    base_url = prompt_backend(prompt_id)
+                    try:
+                        images = done.result()
+                        if not images:
+                            # Outputs weren't in the events (e.g. cached nodes), read them from history
+                            images = get_output_image_refs(prompt_id)
+                        if not images:
+                            raise Exception("No output images")
+                    except Exception as e:
+                        if i in failures:
+                            untrack_prompt(prompt_id)  # Cancelled along with its clip
+                            continue
+                        if isinstance(e, TimeoutError):
+                            cancel_prompt(prompt_id)
+                        record_prompt_result(prompt_id, error=str(e))
+                        yield fail_clip(i, prompt_id, str(e))
+                        continue
+                    
+                    finished = time.time()
+                    runtime = record_prompt_result(prompt_id, frames=len(images))
+                    if i in failures:
+                        continue
+                    # Frames are read back from the backend that rendered them
+                    images = [{**image, "base_url": base_url} for image in images]
+                    
+                    # Pull the frames into OUTPUT_DIR while the other sub-batches are still generating
+                    # (a mounted ComfyUI output folder is read directly by the encoder instead)
+                    if not (ENCODE_CLIPS and COMFYUI_OUTPUT_DIR):
+                        try:
+                            images = download_outputs(prompt_id, images)
+                        except Exception as e:
+                            yield fail_clip(i, prompt_id, str(e))
+                            continue
+                        frame_dir = os.path.join(OUTPUT_DIR, f"frames_{prompt_id}")
+                        frame_dirs.setdefault(i, []).append(frame_dir)
+                        # Tracked while waiting for the clip's other sub-batches, so it's never an orphan
+                        register_artifact(frame_dir)
+                    
+                    timings.append(SubBatchTiming(
+                        clip=i,
+                        batch=j,
+                        frames=len(images),
+                        backend=base_url,
+                        wait_seconds=round(finished - submitted, 2),
+                        gpu_seconds=round(runtime, 2) if runtime is not None else None,
+                        download_seconds=round(time.time() - finished, 2)
+                    ))
+                    part_images[key] = images
+                    if any((i, b) not in part_images for b in range(num_batches[i])):
+                        continue
+                    
+                    # Stitch the sub-batches back together in frame order
+                    images = [image for b in range(num_batches[i]) for image in part_images.pop((i, b))]
+                    generated_at[i] = time.time()
+                    print(f"   Clip {i+1}/{request.num_clips} generated ({len(images)} frames, "
+                          f"{num_batches[i]} sub-batches)")
+                    if ENCODE_CLIPS:
+                        clip_path = os.path.join(OUTPUT_DIR, f"clip_{prompt_ids[(i, 0)]}.mp4")
+                        future = get_encode_pool().submit(encode_frames_to_clip, images, clip_path, gen_fps, target)
+                        encodes[future] = i
+                        pending.add(future)
+                    else:
+                        yield finish_clip(i, [img["local_path"] for img in images])
+            completed = True
+        finally:
+            if not completed:
+                abandon()
+    
+    # Keep clips in story order regardless of completion order
+    clips = [clip for i in sorted(results) for clip in results[i].clips]
+    generated = len(results)
+    total_duration = generated * request.clip_duration
+    
+    print(f"✅ Generated {generated} clips" + (f", {len(failures)} failed" if failures else ""))
+    
+    summary = VideoResponse(
+        clips=clips,
+        total_duration=total_duration,
+        prompt_used=request.visual_prompt,
+        failed_clips=[failures[i] for i in sorted(failures)],
+        cached_clips=len(cached),
+        frames_per_batch=batch_size if parts else None,
+        sub_batches=sorted(timings, key=lambda timing: (timing.clip, timing.batch)),
+        quality=quality,
+        generated_size=[gen_width, gen_height, gen_fps],
+        gpu_seconds=round(sum(timing.gpu_seconds for timing in timings), 2)
+                    if timings and all(timing.gpu_seconds is not None for timing in timings) else None,
+        cpu_seconds=round(cpu_seconds, 2)
+    )
+    yield {"type": "summary", **summary.model_dump()}
+
+@app.post("/generate-video", response_model=VideoResponse)
+def generate_video(request: VideoRequest):
+    """
+    Generate video clips using FREE ComfyUI + AnimateDiff
+    
+    Note: Requires ComfyUI with AnimateDiff and SDXL models installed
+    """
+    try:
+        for record in generate_clip_stream(request):
+            if record["type"] == "summary":
+                record.pop("type")
+                return VideoResponse(**record)
         
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/generate-video/stream")
+async def generate_video_stream(request: VideoRequest):
+    """
+    Generate video clips, streaming one NDJSON record per clip as it's ready
+    
+    Records: queued, then clip/failure in completion order, then summary.
+    An error after streaming started is sent as a final error record. If the
+    client disconnects, the request's remaining prompts are cancelled.
+    """
+    loop = asyncio.get_running_loop()
+    cancelled = threading.Event()
+    records = generate_clip_stream(request, cancelled)
+    try:
+        # Surface validation and availability errors as HTTP status codes
+        first = await loop.run_in_executor(None, next, records)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    async def stream():
+        try:
+            yield json.dumps(first) + "\n"
+            while True:
+                # Awaiting an executor future (not run_in_threadpool) lets a disconnect interrupt the wait
+                record = await loop.run_in_executor(None, next, records, None)
+                if record is None:
+                    break
+                yield json.dumps(record) + "\n"
+        except Exception as e:
+            yield json.dumps({"type": "error", "detail": str(e)}) + "\n"
+        finally:
+            # A running generator sees the flag; a suspended one is closed
+            cancelled.set()
+            if not records.gi_running:
+                loop.run_in_executor(None, records.close)
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@app.get("/stats")
+def stats():
+    """Cache, download and disk usage statistics"""
+    return {
+        "clip_cache": get_clip_cache_stats(),
+        "downloads": get_download_stats(),
+        "retention": get_retention_stats()
+    }
+
 @app.post("/test")
 def test_video():
     """Quick test endpoint"""
@@ -280,7 +1609,7 @@ if __name__ == "__main__":
     import uvicorn
     print("🚀 Starting FREE Video Generation Service")
     print(f"   Backend: ComfyUI + AnimateDiff")
-    print(f"   ComfyUI: {COMFYUI_URL}")
+    print(f"   ComfyUI: {', '.join(COMFYUI_URLS)}")
     print(f"   Status: {'✅ Connected' if check_comfyui_status() else '❌ Offline'}")
     print(f"   Cost: $0.00/month 💚")
     uvicorn.run(app, host="0.0.0.0", port=8003)
@@ -0,0 +1,112 @@
+"""
+Backend Pool Harness - runs /generate-video against several fake ComfyUI servers
+Starts one fake_comfyui.py process per --frame-seconds entry (so backends can
+be given different speeds), points the video service at all of them through
+COMFYUI_URLS and reports where each clip ran plus the per-backend metrics.
+
+--kill-backend/--kill-after stop one server mid-request to exercise failover:
+its queued and running clips should be resubmitted to the remaining backends.
+
+Usage:
+    python pool_harness.py --frame-seconds 0.25,0.5,0.5 --clips 6
+    python pool_harness.py --frame-seconds 0.25,0.25 --kill-backend 0 --kill-after 1.5 --output pool.json
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+def start_backend(port: int, frame_seconds: float, output_dir: str, extra_args: tuple = ()) -> subprocess.Popen:
+    """Start a fake ComfyUI server (extra_args go to fake_comfyui.py) and wait until it answers"""
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_comfyui.py"),
+         "--port", str(port), "--frame-seconds", str(frame_seconds), "--output-dir", output_dir, *extra_args],
+        stdout=subprocess.DEVNULL
+    )
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/system_stats", timeout=1)
+            return process
+        except Exception:
+            time.sleep(0.1)
+    process.kill()
+    raise Exception(f"Fake ComfyUI on port {port} didn't start")
+
+def main_harness():
+    parser = argparse.ArgumentParser(description="Run the video service against a pool of fake ComfyUI servers")
+    parser.add_argument("--frame-seconds", default="0.25,0.5", help="Simulated GPU time per frame, one per backend")
+    parser.add_argument("--clips", type=int, default=4)
+    parser.add_argument("--clip-duration", type=int, default=1)
+    parser.add_argument("--fps", type=int, default=4)
+    parser.add_argument("--port", type=int, default=18188, help="Port of the first backend")
+    parser.add_argument("--kill-backend", type=int, help="Index of a backend to stop mid-request")
+    parser.add_argument("--kill-after", type=float, default=1.0, help="Seconds into the request to stop it")
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+    speeds = [float(n) for n in args.frame_seconds.split(",")]
+
+    root = tempfile.mkdtemp(prefix="pool_harness_")
+    urls = [f"http://127.0.0.1:{args.port + i}" for i in range(len(speeds))]
+    os.environ["COMFYUI_URLS"] = ",".join(urls)
+    os.environ["OUTPUT_DIR"] = os.path.join(root, "clips")
+    os.environ.setdefault("HISTORY_POLL_INTERVAL", "0.5")
+
+    processes = []
+    try:
+        for i, speed in enumerate(speeds):
+            processes.append(start_backend(args.port + i, speed, os.path.join(root, f"backend_{i}")))
+        print(f"🧪 {len(processes)} fake backends: {', '.join(urls)}", file=sys.stderr)
+
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        import main
+
+        main.start_event_listener()
+        deadline = time.time() + 10
+        while not all(main.backends[url]["ws_connected"].is_set() for url in urls) and time.time() < deadline:
+            time.sleep(0.05)
+
+        if args.kill_backend is not None:
+            victim = processes[args.kill_backend]
+
+            def kill():
+                print(f"💥 Stopping backend {urls[args.kill_backend]}", file=sys.stderr)
+                victim.kill()
+            threading.Timer(args.kill_after, kill).start()
+
+        start = time.perf_counter()
+        result = main.generate_video(main.VideoRequest(
+            visual_prompt="Harness clip",
+            num_clips=args.clips,
+            clip_duration=args.clip_duration,
+            fps=args.fps
+        ))
+        elapsed = time.perf_counter() - start
+
+        report = {
+            "wall_seconds": round(elapsed, 3),
+            "clips": len(result.clips),
+            "failed_clips": [failure.model_dump() for failure in result.failed_clips],
+            "backends": main.get_backend_stats()
+        }
+        output = json.dumps(report, indent=2)
+        if args.output:
+            with open(args.output, 'w') as f:
+                f.write(output)
+            print(f"✅ Wrote report to {args.output}", file=sys.stderr)
+        else:
+            print(output)
+        if len(result.clips) != args.clips:
+            sys.exit(1)
+    finally:
+        for process in processes:
+            process.kill()
+
+if __name__ == "__main__":
+    main_harness()
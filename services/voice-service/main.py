@@ -6,9 +6,16 @@ Uses Coqui TTS (open source)
 from fastapi import FastAPI, HTTPException
 from fastapi.responses import FileResponse
 from pydantic import BaseModel
+from typing import Dict, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
 import os
 import tempfile
+import threading
+import time
 import uuid
+import wave
 from pathlib import Path
 
 app = FastAPI(title="Voice Service", description="FREE TTS using Coqui TTS")
@@ -20,6 +27,19 @@ app = FastAPI(title="Voice Service", description="FREE TTS using Coqui TTS")
 TTS_MODEL = os.getenv("TTS_MODEL", "tts_models/en/ljspeech/tacotron2-DDC")
 OUTPUT_DIR = os.getenv("OUTPUT_DIR", "/tmp/tts_output")
 
+# Retention: evict least recently used audio once the disk quota is crossed
+DISK_QUOTA_BYTES = int(os.getenv("DISK_QUOTA_BYTES", str(1024**3)))
+JANITOR_INTERVAL = int(os.getenv("JANITOR_INTERVAL", "300"))
+TEMP_ORPHAN_AGE = int(os.getenv("TEMP_ORPHAN_AGE", "1800"))  # Partial files older than this are orphans
+PARTIAL_SUFFIX = ".partial.wav"
+
+# Chunked synthesis: sentences are synthesized in parallel by a pool of model workers
+TTS_CHUNKED = os.getenv("TTS_CHUNKED", "true").lower() == "true"
+TTS_WORKERS = int(os.getenv("TTS_WORKERS", str(min(os.cpu_count() or 1, 4))))
+TTS_WORKER_THREADS = int(os.getenv("TTS_WORKER_THREADS", "1"))  # Torch threads per worker
+SENTENCE_GAP_MS = float(os.getenv("SENTENCE_GAP_MS", "450"))  # Coqui's own gap is 10000 samples (~450ms)
+MIN_CHUNK_CHARS = int(os.getenv("MIN_CHUNK_CHARS", "20"))  # Shorter sentences are joined to the next one
+
 # Create output directory
 Path(OUTPUT_DIR).mkdir(parents=True, exist_ok=True)
 
@@ -37,6 +57,119 @@ except Exception as e:
     print("   Install with: pip install TTS")
     tts = None
 
+# ==============================================
+# Chunked Synthesis
+# ==============================================
+
+tts_pool: Optional[ProcessPoolExecutor] = None
+tts_pool_lock = threading.Lock()
+
+def init_tts_worker():
+    """Cap torch threads so parallel workers don't oversubscribe the cores"""
+    try:
+        import torch
+        torch.set_num_threads(TTS_WORKER_THREADS)
+    except ImportError:
+        pass
+
+def get_tts_pool() -> ProcessPoolExecutor:
+    """Pool of model workers, created on first use (each loads its own model when it imports this module)"""
+    global tts_pool
+    with tts_pool_lock:
+        if tts_pool is None:
+            # spawn: forking a process that runs uvicorn threads is unsafe
+            tts_pool = ProcessPoolExecutor(
+                max_workers=TTS_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_tts_worker
+            )
+        return tts_pool
+
+def reset_tts_pool():
+    """Drop a broken pool so the next request starts fresh workers"""
+    global tts_pool
+    with tts_pool_lock:
+        if tts_pool is not None:
+            tts_pool.shutdown(wait=False, cancel_futures=True)
+            tts_pool = None
+
+def worker_ready() -> bool:
+    """No-op task used to start the workers and load their models ahead of the first request"""
+    return tts is not None
+
+def warm_tts_pool():
+    """Start every model worker in the background"""
+    start = time.time()
+    try:
+        pool = get_tts_pool()
+        ready = sum(future.result() for future in [pool.submit(worker_ready) for _ in range(TTS_WORKERS)])
+        print(f"✅ {ready}/{TTS_WORKERS} TTS workers ready in {time.time() - start:.1f}s")
+    except Exception as e:
+        print(f"⚠️  TTS workers failed to start: {e}")
+        reset_tts_pool()
+
+def split_sentences(text: str) -> List[str]:
+    """Split text into sentence chunks with Coqui's segmenter, joining fragments shorter than MIN_CHUNK_CHARS"""
+    chunks, carry = [], ""
+    for sentence in tts.synthesizer.split_into_sentences(text):
+        carry = f"{carry} {sentence.strip()}".strip()
+        if len(carry) >= MIN_CHUNK_CHARS:
+            chunks.append(carry)
+            carry = ""
+    if carry:
+        if chunks:
+            chunks[-1] = f"{chunks[-1]} {carry}"
+        else:
+            chunks.append(carry)
+    return chunks
+
+def synthesize_chunk(text: str, speed: float) -> Tuple["np.ndarray", int]:
+    """Synthesize one chunk in a model worker, returning float samples and the sample rate"""
+    import numpy as np
+    if not tts:
+        raise Exception("TTS not initialized in worker")
+    wav = np.asarray(tts.tts(text=text, speed=speed, split_sentences=False), dtype=np.float32)
+    # Coqui pads each synthesis with 10000 zero samples; the gap is added when stitching instead
+    return np.trim_zeros(wav, 'b'), tts.synthesizer.output_sample_rate
+
+def write_wav(samples: "np.ndarray", sample_rate: int, path: str):
+    """Write float samples as 16-bit mono PCM, peak-normalized like Coqui's save_wav"""
+    import numpy as np
+    peak = max(0.01, float(np.max(np.abs(samples)))) if samples.size else 0.01
+    pcm = (samples * (32767 / peak)).astype(np.int16)
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(pcm.tobytes())
+
+def synthesize_chunked(chunks: List[str], speed: float, gap_ms: float, path: str):
+    """Synthesize chunks in parallel and stitch them in order, each followed by gap_ms of silence"""
+    import numpy as np
+    start = time.time()
+    futures = [get_tts_pool().submit(synthesize_chunk, chunk, speed) for chunk in chunks]
+    try:
+        results = [future.result() for future in futures]
+    except BrokenProcessPool:
+        reset_tts_pool()
+        raise Exception("TTS worker crashed")
+    finally:
+        for future in futures:
+            future.cancel()
+    
+    rates = {rate for _, rate in results}
+    if len(rates) != 1:
+        raise Exception(f"Chunks synthesized at different sample rates: {sorted(rates)}")
+    sample_rate = rates.pop()
+    
+    # Gaps are whole samples, so every chunk starts exactly where the one before ends plus the gap
+    gap = np.zeros(int(round(gap_ms * sample_rate / 1000)), dtype=np.float32)
+    parts = []
+    for samples, _ in results:
+        parts.extend([samples, gap])
+    write_wav(np.concatenate(parts), sample_rate, path)
+    print(f"🧩 Synthesized {len(chunks)} chunks on {min(len(chunks), TTS_WORKERS)} workers in {time.time() - start:.1f}s")
+
 # ==============================================
 # Request Models
 # ==============================================
@@ -45,6 +178,8 @@ class VoiceRequest(BaseModel):
     text: str
     speed: float = 1.0
     output_format: str = "wav"
+    chunked: Optional[bool] = None  # Defaults to TTS_CHUNKED
+    sentence_gap_ms: Optional[float] = None  # Defaults to SENTENCE_GAP_MS
 
 class VoiceResponse(BaseModel):
     audio_file: str
@@ -55,26 +190,40 @@ class VoiceResponse(BaseModel):
 # Helper Functions
 # ==============================================
 
-def generate_voice(text: str, speed: float = 1.0) -> str:
-    """Generate voice using FREE Coqui TTS"""
+def generate_voice(text: str, speed: float = 1.0, chunked: Optional[bool] = None,
+                   sentence_gap_ms: Optional[float] = None) -> str:
+    """Generate voice using FREE Coqui TTS, one sentence chunk per worker when chunked"""
     if not tts:
         raise Exception("TTS not initialized. Install with: pip install TTS")
     
     # Generate unique filename
-    filename = f"{uuid.uuid4()}.wav"
-    filepath = os.path.join(OUTPUT_DIR, filename)
+    file_id = uuid.uuid4()
+    filepath = os.path.join(OUTPUT_DIR, f"{file_id}.wav")
+    # Write under a partial name so a crash mid-synthesis leaves a recognizable orphan
+    partial_path = os.path.join(OUTPUT_DIR, f"{file_id}{PARTIAL_SUFFIX}")
     
     try:
+        chunked = TTS_CHUNKED if chunked is None else chunked
+        chunks = split_sentences(text) if chunked and TTS_WORKERS > 1 else [text]
+        
         # Generate audio
-        tts.tts_to_file(
-            text=text,
-            file_path=filepath,
-            speed=speed
-        )
+        if len(chunks) > 1:
+            gap_ms = SENTENCE_GAP_MS if sentence_gap_ms is None else sentence_gap_ms
+            synthesize_chunked(chunks, speed, gap_ms, partial_path)
+        else:
+            tts.tts_to_file(
+                text=text,
+                file_path=partial_path,
+                speed=speed
+            )
+        os.replace(partial_path, filepath)
+        register_artifact(filepath)
         
         return filepath
         
     except Exception as e:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
         raise Exception(f"TTS generation failed: {e}")
 
 def get_audio_duration(filepath: str) -> float:
@@ -89,10 +238,133 @@ def get_audio_duration(filepath: str) -> float:
     except:
         return 0.0
 
+# ==============================================
+# Retention
+# ==============================================
+
+# path -> {"size", "last_access"}
+artifacts: Dict[str, Dict] = {}
+artifacts_lock = threading.Lock()
+janitor_stats = {"runs": 0, "bytes_reclaimed": 0, "last_run": None}
+
+def register_artifact(path: str):
+    """Track a generated audio file"""
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return
+    with artifacts_lock:
+        artifacts[path] = {"size": size, "last_access": time.time()}
+
+def touch_artifact(path: str):
+    """Mark an artifact as recently used"""
+    with artifacts_lock:
+        if path in artifacts:
+            artifacts[path]["last_access"] = time.time()
+
+def scan_artifacts():
+    """Index existing audio files once at startup"""
+    for filename in os.listdir(OUTPUT_DIR):
+        filepath = os.path.join(OUTPUT_DIR, filename)
+        if not filename.endswith(PARTIAL_SUFFIX) and os.path.isfile(filepath):
+            stat = os.stat(filepath)
+            with artifacts_lock:
+                artifacts[filepath] = {"size": stat.st_size, "last_access": stat.st_mtime}
+
+def remove_orphans(max_age: float) -> Dict:
+    """Delete partial files left behind by crashed syntheses"""
+    removed, reclaimed = 0, 0
+    cutoff = time.time() - max_age
+    for filename in os.listdir(OUTPUT_DIR):
+        if not filename.endswith(PARTIAL_SUFFIX):
+            continue
+        filepath = os.path.join(OUTPUT_DIR, filename)
+        try:
+            stat = os.stat(filepath)
+            if stat.st_mtime > cutoff:
+                continue
+            os.remove(filepath)
+            removed += 1
+            reclaimed += stat.st_size
+        except OSError:
+            pass
+    return {"files": removed, "bytes": reclaimed}
+
+def evict_over_quota() -> Dict:
+    """Evict audio files, least recently used first, until under quota"""
+    with artifacts_lock:
+        used = sum(entry["size"] for entry in artifacts.values())
+        candidates = sorted((entry["last_access"], path, entry["size"]) for path, entry in artifacts.items())
+    
+    evicted, reclaimed = 0, 0
+    for _, path, size in candidates:
+        if used <= DISK_QUOTA_BYTES:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            continue
+        with artifacts_lock:
+            artifacts.pop(path, None)
+        used -= size
+        evicted += 1
+        reclaimed += size
+    
+    return {"files": evicted, "bytes": reclaimed, "used_bytes": used}
+
+def run_janitor(orphan_age: float = TEMP_ORPHAN_AGE) -> Dict:
+    """One retention pass: orphan cleanup, then LRU eviction over the quota"""
+    start = time.time()
+    orphans = remove_orphans(orphan_age)
+    evicted = evict_over_quota()
+    report = {
+        "started_at": start,
+        "duration": round(time.time() - start, 3),
+        "orphans_removed": orphans["files"],
+        "evicted_files": evicted["files"],
+        "bytes_reclaimed": orphans["bytes"] + evicted["bytes"],
+        "used_bytes": evicted["used_bytes"],
+        "quota_bytes": DISK_QUOTA_BYTES
+    }
+    
+    with artifacts_lock:
+        janitor_stats["runs"] += 1
+        janitor_stats["bytes_reclaimed"] += report["bytes_reclaimed"]
+        janitor_stats["last_run"] = report
+    
+    if report["bytes_reclaimed"]:
+        print(f"🧹 Janitor reclaimed {report['bytes_reclaimed']/1024/1024:.2f}MB "
+              f"({report['orphans_removed']} orphans, {report['evicted_files']} evicted)")
+    return report
+
+def janitor_loop():
+    """Background retention manager"""
+    while True:
+        time.sleep(JANITOR_INTERVAL)
+        try:
+            run_janitor()
+        except Exception as e:
+            print(f"Janitor error: {e}")
+
 # ==============================================
 # API Endpoints
 # ==============================================
 
+@app.on_event("startup")
+def start_janitor():
+    """Index existing audio and start the background retention manager"""
+    scan_artifacts()
+    # Runs before the server accepts requests, so every partial file is left over from a previous process
+    try:
+        run_janitor(orphan_age=0)
+    except Exception as e:
+        print(f"Janitor error: {e}")
+    threading.Thread(target=janitor_loop, name="janitor", daemon=True).start()
+    if tts and TTS_CHUNKED and TTS_WORKERS > 1:
+        threading.Thread(target=warm_tts_pool, name="tts-warmup", daemon=True).start()
+
 @app.get("/")
 def read_root():
     return {
@@ -110,9 +382,23 @@ def health_check():
     return {
         "status": "healthy" if tts else "tts_not_loaded",
         "model": TTS_MODEL,
-        "output_dir": OUTPUT_DIR
+        "output_dir": OUTPUT_DIR,
+        "tts_workers": TTS_WORKERS if TTS_CHUNKED else 0
     }
 
+@app.get("/stats")
+def stats():
+    """Tracked disk usage and janitor history"""
+    with artifacts_lock:
+        return {
+            "retention": {
+                "artifacts": len(artifacts),
+                "used_bytes": sum(entry["size"] for entry in artifacts.values()),
+                "quota_bytes": DISK_QUOTA_BYTES,
+                **janitor_stats
+            }
+        }
+
 @app.post("/generate-voice", response_model=VoiceResponse)
 def generate_voice_endpoint(request: VoiceRequest):
     """
@@ -127,7 +413,7 @@ def generate_voice_endpoint(request: VoiceRequest):
         print(f"🎙️  Generating voice for {len(request.text)} characters...")
         
         # Generate audio
-        audio_path = generate_voice(request.text, request.speed)
+        audio_path = generate_voice(request.text, request.speed, request.chunked, request.sentence_gap_ms)
         
         # Get duration
         duration = get_audio_duration(audio_path)
@@ -151,6 +437,7 @@ def download_audio(filename: str):
     if not os.path.exists(filepath):
         raise HTTPException(status_code=404, detail="File not found")
     
+    touch_artifact(filepath)
     return FileResponse(
         filepath,
         media_type="audio/wav",
@@ -180,20 +467,10 @@ def test_voice():
 
 @app.delete("/cleanup")
 def cleanup_old_files():
-    """Clean up old audio files"""
+    """Run the retention janitor now instead of waiting for its next pass"""
     try:
-        import time
-        deleted = 0
-        current_time = time.time()
-        
-        for filename in os.listdir(OUTPUT_DIR):
-            filepath = os.path.join(OUTPUT_DIR, filename)
-            # Delete files older than 1 hour
-            if os.path.getmtime(filepath) < current_time - 3600:
-                os.remove(filepath)
-                deleted += 1
-        
-        return {"deleted_files": deleted}
+        report = run_janitor()
+        return {"deleted_files": report["orphans_removed"] + report["evicted_files"], **report}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 